@@ -0,0 +1,149 @@
+"""
+AutoSplit GIEEE - エリア平均色の間引きサンプリング
+エリアの全画素ではなく、step 画素おきの格子 (またはその中で固定パターンでずらした点) だけで
+平均色を求める
+
+間引いた平均色は全画素の平均色から少しずれるので、
+・ターゲット色との距離が許容値に近いエリア (境目から margin 以内) は全画素で求め直す
+・audit_frames フレームおきに全画素の平均色と比べて、実際のずれの最大を記録する
+ことで判定結果が全画素のときと変わらないようにする。
+ずれは三角不等式で距離のずれの上限になるので、観測したずれが margin を超えたら margin を広げる。
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+
+
+SAMPLING_GRID = "grid"  # 各 step x step のマスの中心
+SAMPLING_JITTER = "jitter"  # 各マスの中の固定の乱数位置 (縞模様と周期がそろいにくい)
+JITTER_SEED = 0  # 固定パターンにするため毎回同じ種を使う
+
+
+@lru_cache(maxsize=64)
+def sample_offsets(width: int, height: int, step: int,
+                   pattern: str = SAMPLING_GRID) -> tuple[np.ndarray, np.ndarray]:
+    """
+    width x height のエリア内で平均をとる点 (エリア左上からの座標)
+
+    Returns:
+        (ys, xs) それぞれ (S,) の intp
+    """
+    rows = (height + step - 1) // step
+    cols = (width + step - 1) // step
+    cell_y = np.repeat(np.arange(rows, dtype=np.intp) * step, cols)
+    cell_x = np.tile(np.arange(cols, dtype=np.intp) * step, rows)
+    if pattern == SAMPLING_JITTER:
+        rng = np.random.default_rng(JITTER_SEED)
+        ys = cell_y + rng.integers(0, step, rows * cols)
+        xs = cell_x + rng.integers(0, step, rows * cols)
+    else:
+        ys = cell_y + step // 2
+        xs = cell_x + step // 2
+    # 端のマスはエリアからはみ出した点を除く (何も残らなければ中心だけ)
+    inside = (ys < height) & (xs < width)
+    if not inside.any():
+        return np.array([height // 2], dtype=np.intp), np.array([width // 2], dtype=np.intp)
+    ys, xs = ys[inside], xs[inside]
+    ys.flags.writeable = False
+    xs.flags.writeable = False
+    return ys, xs
+
+
+@dataclass
+class SamplingStats:
+    """間引きサンプリングの統計 (監視セッション中の累計)"""
+    frames: int = 0
+    sampled_areas: int = 0  # 間引いて平均色を求めたエリア数
+    refined_areas: int = 0  # 許容値の境目に近かったので全画素で求め直したエリア数
+    audited_areas: int = 0  # 全画素の平均色と比べたエリア数
+    worst_deviation: float = 0.0  # 観測した平均色のずれの最大 (色距離)
+    mean_deviation: float = 0.0  # 観測した平均色のずれの平均 (色距離)
+
+
+class AreaSampler:
+    """
+    エリアの平均色を間引いて求める設定と、その誤差の記録
+
+    検知エンジン (detection_engine) とエリア方式 (detector) の両方から使う。
+    """
+
+    def __init__(self, step: int, pattern: str = SAMPLING_GRID, margin: float = 6.0,
+                 audit_frames: int = 30):
+        if step < 2:
+            raise ValueError("step は2以上にしてください")
+        self.step = step
+        self.pattern = pattern
+        self.base_margin = margin
+        self.audit_frames = audit_frames
+        self.stats = SamplingStats()
+        self.auditing = False  # このフレームは全画素の平均色と比べるか
+
+    @classmethod
+    def from_config(cls, config) -> Optional["AreaSampler"]:
+        """設定から作る (間引かない設定なら None)"""
+        if config.area_sampling_step <= 1:
+            return None
+        return cls(config.area_sampling_step, config.area_sampling_pattern,
+                   config.area_sampling_margin, config.area_sampling_audit_frames)
+
+    @property
+    def margin(self) -> float:
+        """全画素で求め直す、許容値の境目からの幅 (観測したずれより必ず広くする)"""
+        return max(self.base_margin, self.stats.worst_deviation + 1.0)
+
+    def begin_frame(self):
+        """フレームの最初に呼ぶ (audit_frames フレームおきに auditing が立つ)"""
+        self.auditing = self.audit_frames > 0 and self.stats.frames % self.audit_frames == 0
+        self.stats.frames += 1
+
+    def is_uncertain(self, distance, tolerance):
+        """間引いた平均色の距離では判定が変わるかもしれないか (配列も可)"""
+        return np.abs(distance - tolerance) <= self.margin
+
+    def offsets(self, width: int, height: int) -> tuple[np.ndarray, np.ndarray]:
+        return sample_offsets(width, height, self.step, self.pattern)
+
+    def pixels_mean(self, pixels: np.ndarray) -> tuple[int, int, int]:
+        """(H, W, C) の画素の間引いた平均色 (四捨五入)"""
+        ys, xs = self.offsets(pixels.shape[1], pixels.shape[0])
+        sums = pixels[ys, xs, :3].sum(axis=0, dtype=np.int64)
+        n = len(ys)
+        return tuple(int(v) for v in (sums * 2 + n) // (n * 2))
+
+    def area_mean(self, frame, box: tuple[int, int, int, int]) -> tuple[int, int, int]:
+        """Frame / SparseFrame の box 部分の間引いた平均色 (フレームのチャンネル順)"""
+        left, top, right, bottom = box
+        find_region = getattr(frame, "find_region", None)
+        if find_region is not None:
+            found = find_region(box)
+            if found is None:
+                raise ValueError(f"ROI外の領域です: {box}")
+            rect, frame = found
+            left, top, right, bottom = left - rect.left, top - rect.top, right - rect.left, bottom - rect.top
+        self.stats.sampled_areas += 1
+        if hasattr(frame, "pixels"):
+            return self.pixels_mean(frame.pixels[top:bottom, left:right])
+        # PIL Image の領域
+        return self.pixels_mean(np.asarray(frame.crop((left, top, right, bottom)).convert("RGB")))
+
+    def record_deviation(self, sampled: np.ndarray, full: np.ndarray):
+        """間引いた平均色と全画素の平均色を比べて、ずれを記録する ((N, 3) どうし)"""
+        if len(sampled) == 0:
+            return
+        diff = np.asarray(sampled, dtype=np.float64) - np.asarray(full, dtype=np.float64)
+        deviation = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+        stats = self.stats
+        total = stats.audited_areas + len(deviation)
+        stats.mean_deviation = (stats.mean_deviation * stats.audited_areas + float(deviation.sum())) / total
+        stats.audited_areas = total
+        stats.worst_deviation = max(stats.worst_deviation, float(deviation.max()))
+
+    def summary(self) -> str:
+        s = self.stats
+        refined = s.refined_areas / s.sampled_areas * 100 if s.sampled_areas else 0.0
+        return (f"間引きサンプリング ({self.step}画素おき/{self.pattern}): "
+                f"{s.sampled_areas}エリア, 全画素で求め直し {refined:.1f}%, "
+                f"平均色のずれ 最大 {s.worst_deviation:.2f} / 平均 {s.mean_deviation:.2f} "
+                f"({s.audited_areas}エリアで確認)")
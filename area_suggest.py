@@ -0,0 +1,276 @@
+"""
+AutoSplit GIEEE - 検知エリアの自動提案
+ロード画面とゲーム画面のサンプルから、ロード画面でだけパターンの色になる場所を探して
+少ない数の検知エリアを提案する
+
+エリアの候補は画面全体に並べ、フレームごとに候補の行ごとの帯で全候補の平均色とばらつきを求める
+(画面全体の2乗の累積和テーブルは4Kだと数百MBになるので作らない)。
+"""
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from config import DetectionArea, PatternConfig, hex_to_rgb, load_config
+from frame import Frame
+from roi import area_pixel_box
+
+
+AREA_STEP_PERCENT = 2  # 候補を並べる間隔 (%)
+DEFAULT_CONFIDENCE = 0.99  # 目標の確からしさ (ロード検知率 x (1 - ゲーム画面での誤検知率))
+MIN_AREAS = 2  # 1エリアだけだと、UIが重なっただけでロードを見逃す
+MAX_AREAS = 8
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+@dataclass
+class AreaScore:
+    """候補エリア1つの評価"""
+    area: DetectionArea
+    box: tuple[int, int, int, int]  # ピクセル矩形
+    score: float  # 0-1 (大きいほど良い)
+    load_hit_rate: float  # ロード画面で色が許容値内だった割合
+    gameplay_hit_rate: float  # ゲーム画面で色が許容値内だった割合 (誤検知の元)
+    spread: float  # ロード画面でのエリア内の色のばらつき (標準偏差の平均)
+    gameplay_distance: float  # ゲーム画面で一番近づいたときの色距離
+
+
+@dataclass
+class AreaSuggestion:
+    """提案する検知エリアの組"""
+    areas: list[DetectionArea]
+    scores: list[AreaScore]
+    load_detection_rate: float  # サンプルのロード画面を検知できた割合
+    gameplay_false_rate: float  # サンプルのゲーム画面を誤検知した割合
+    confidence: float
+    target: float  # 目標の確からしさ
+    candidate_count: int
+    warning: str = ""  # 提案はしたが注意してほしいこと (エリアが min_areas 個に届かなかったなど)
+
+    @property
+    def reached(self) -> bool:
+        """目標の確からしさに届いたか"""
+        return bool(self.areas) and self.confidence >= self.target
+
+
+def candidate_areas(frame_size: tuple[int, int], area_size: int = 50,
+                    step: int = AREA_STEP_PERCENT) -> tuple[list[DetectionArea], np.ndarray]:
+    """
+    画面全体に並べた候補エリア (ピクセル矩形が同じになるものは1つにまとめる)
+
+    Returns:
+        (DetectionArea のリスト, (N, 4) のピクセル矩形)
+    """
+    img_w, img_h = frame_size
+    seen = {}
+    for y in range(0, 100, step):
+        for x in range(0, 100, step):
+            box = area_pixel_box(x, y, img_w, img_h, area_size)
+            if box[0] < 0 or box[1] < 0:
+                continue  # エリアが画面より大きい
+            seen.setdefault(box, DetectionArea(x=x, y=y))
+    boxes = np.array(list(seen), dtype=np.intp).reshape(-1, 4)
+    return list(seen.values()), boxes
+
+
+def block_stats(pixels: np.ndarray, boxes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    全候補エリアの平均色とばらつきを求める
+
+    候補は行 (上端と下端が同じもの) ごとに、その高さの帯だけを縦に合計して横方向の累積和を取る
+    (画面全体の累積和テーブルを作らないので、作業用の配列は帯1本分で済む)。
+
+    Returns:
+        (平均色 (N, 3) ※検知エンジンと同じ丸め, ばらつき (N,) ※チャンネルごとの標準偏差の平均)
+    """
+    sums = np.zeros((len(boxes), 3), dtype=np.int64)
+    squares = np.zeros((len(boxes), 3), dtype=np.int64)
+    width = pixels.shape[1]
+    columns = np.zeros((width + 1, 3), dtype=np.int64)
+    column_squares = np.zeros((width + 1, 3), dtype=np.int64)
+    for top, bottom in np.unique(boxes[:, [1, 3]], axis=0):
+        in_row = np.flatnonzero((boxes[:, 1] == top) & (boxes[:, 3] == bottom))
+        strip = pixels[top:bottom, :, :3].astype(np.int32)
+        np.cumsum(strip.sum(axis=0), axis=0, out=columns[1:])
+        np.cumsum(np.einsum("hwc,hwc->wc", strip, strip), axis=0, out=column_squares[1:])
+        left, right = boxes[in_row, 0], boxes[in_row, 2]
+        sums[in_row] = columns[right] - columns[left]
+        squares[in_row] = column_squares[right] - column_squares[left]
+
+    counts = ((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]))[:, None]
+    # PILのBOX縮小と同じく四捨五入: floor(sum / n + 0.5)
+    means = (sums * 2 + counts) // (counts * 2)
+    mean = sums / counts
+    variance = np.maximum(squares / counts - mean ** 2, 0)
+    return means, np.sqrt(variance).mean(axis=1)
+
+
+def _to_pixels(image, frame_size: Optional[tuple[int, int]]) -> np.ndarray:
+    """PIL Image / Frame を RGB の画素にする (サイズが違えば合わせる)"""
+    if isinstance(image, Frame):
+        pixels = image.pixels[:, :, :3]
+        if image.channel_order == "BGR":
+            pixels = pixels[:, :, ::-1]
+        if frame_size is None or image.size == frame_size:
+            return pixels
+        image = Image.fromarray(np.ascontiguousarray(pixels), "RGB")
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if frame_size is not None and image.size != frame_size:
+        image = image.resize(frame_size, Image.Resampling.BILINEAR)
+    return np.asarray(image)
+
+
+def score_areas(load_frames: list, gameplay_frames: list, color: str, tolerance: int,
+                area_size: int = 50, step: int = AREA_STEP_PERCENT
+                ) -> tuple[list[AreaScore], np.ndarray, np.ndarray]:
+    """
+    全候補エリアを採点する
+
+    ロード画面で毎回パターンの色になり (一致率)、エリア内の色がそろっていて (均一さ)、
+    ゲーム画面ではその色にならない (分離) 場所ほど点が高い。
+
+    Args:
+        load_frames / gameplay_frames: PIL Image か Frame のリスト (サイズは最初のロード画面に合わせる)
+
+    Returns:
+        (候補ごとの評価, ロード画面での一致フラグ (Fl, N), ゲーム画面での一致フラグ (Fg, N))
+    """
+    first = load_frames[0]
+    frame_size = first.size
+    areas, boxes = candidate_areas(frame_size, area_size, step)
+    target = np.array(hex_to_rgb(color), dtype=np.int64)
+    tolerance_sq = tolerance * tolerance
+
+    def evaluate(frames):
+        hits = np.zeros((len(frames), len(boxes)), dtype=bool)
+        distances = np.zeros((len(frames), len(boxes)), dtype=np.float64)
+        spreads = np.zeros((len(frames), len(boxes)), dtype=np.float64)
+        for i, frame in enumerate(frames):
+            means, spread = block_stats(_to_pixels(frame, frame_size), boxes)
+            diff = means - target
+            distance_sq = np.einsum("ij,ij->i", diff, diff)
+            hits[i] = distance_sq <= tolerance_sq
+            distances[i] = np.sqrt(distance_sq)
+            spreads[i] = spread
+        return hits, distances, spreads
+
+    load_hits, _, load_spreads = evaluate(load_frames)
+    game_hits, game_distances, _ = evaluate(gameplay_frames)
+
+    load_rate = load_hits.mean(axis=0)
+    game_rate = game_hits.mean(axis=0) if len(gameplay_frames) else np.zeros(len(boxes))
+    spread = load_spreads.mean(axis=0)
+    # 許容値に比べてばらつきが大きいエリアは、少しずれただけで外れるので減点
+    uniformity = np.clip(1 - spread / max(tolerance, 1), 0, 1)
+    scores = load_rate * (1 - game_rate) * uniformity
+    nearest = game_distances.min(axis=0) if len(gameplay_frames) else np.full(len(boxes), np.inf)
+
+    results = [
+        AreaScore(areas[i], tuple(int(v) for v in boxes[i]), float(scores[i]), float(load_rate[i]),
+                  float(game_rate[i]), float(spread[i]), float(nearest[i]))
+        for i in range(len(boxes))
+    ]
+    return results, load_hits, game_hits
+
+
+def _overlaps(a: tuple[int, int, int, int], b: tuple[int, int, int, int]) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def suggest_areas(load_frames: list, gameplay_frames: list, pattern: PatternConfig,
+                  area_size: int = 50, confidence: float = DEFAULT_CONFIDENCE,
+                  min_areas: int = MIN_AREAS, max_areas: int = MAX_AREAS,
+                  step: int = AREA_STEP_PERCENT) -> AreaSuggestion:
+    """
+    目標の確からしさに届く、なるべく少ない検知エリアを提案する
+
+    点の高い候補から重ならないものを順に足していき、パターンの検知閾値で
+    サンプルを判定したときの確からしさが confidence に届いたところで止める。
+    """
+    if not load_frames:
+        raise ValueError("ロード画面のサンプルがありません")
+    scores, load_hits, game_hits = score_areas(
+        load_frames, gameplay_frames, pattern.color, pattern.tolerance, area_size, step
+    )
+    # 同じ点ならゲーム画面の色から遠いエリアを優先
+    order = sorted(range(len(scores)), key=lambda i: (-scores[i].score, -scores[i].gameplay_distance))
+
+    chosen: list[int] = []
+    best = None
+    for i in order:
+        if len(chosen) >= max_areas or scores[i].score <= 0:
+            break
+        if any(_overlaps(scores[i].box, scores[j].box) for j in chosen):
+            continue
+        chosen.append(i)
+        if len(chosen) < min_areas:
+            continue
+
+        required = (pattern.threshold_percent * len(chosen) + 99) // 100
+        load_rate = float((load_hits[:, chosen].sum(axis=1) >= required).mean())
+        game_rate = float((game_hits[:, chosen].sum(axis=1) >= required).mean()) if len(game_hits) else 0.0
+        current = (load_rate * (1 - game_rate), list(chosen), load_rate, game_rate)
+        if best is None or current[0] > best[0]:
+            best = current
+        if current[0] >= confidence:
+            break
+
+    warning = ""
+    if best is None and chosen:
+        # 点のつく場所が min_areas 個もなかった -> 見つかった分だけで判定して、そのことを伝える
+        required = (pattern.threshold_percent * len(chosen) + 99) // 100
+        load_rate = float((load_hits[:, chosen].sum(axis=1) >= required).mean())
+        game_rate = float((game_hits[:, chosen].sum(axis=1) >= required).mean()) if len(game_hits) else 0.0
+        best = (load_rate * (1 - game_rate), list(chosen), load_rate, game_rate)
+        warning = (f"使えそうな場所が{len(chosen)}個しか見つかりませんでした "
+                   f"({min_areas}個以上あると、UIが重なったときも見逃しにくくなります)")
+    if best is None:
+        return AreaSuggestion([], [], 0.0, 0.0, 0.0, confidence, len(scores))
+    value, picked, load_rate, game_rate = best
+    return AreaSuggestion(
+        areas=[scores[i].area for i in picked],
+        scores=[scores[i] for i in picked],
+        load_detection_rate=load_rate,
+        gameplay_false_rate=game_rate,
+        confidence=value,
+        target=confidence,
+        candidate_count=len(scores),
+        warning=warning,
+    )
+
+
+def load_images(path) -> list[Image.Image]:
+    """画像ファイルか、画像の入ったフォルダを読み込む"""
+    path = Path(path)
+    files = sorted(f for f in path.iterdir() if f.suffix.lower() in IMAGE_SUFFIXES) if path.is_dir() else [path]
+    images = []
+    for f in files:
+        with Image.open(f) as img:
+            images.append(img.convert("RGB"))
+    return images
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ロード画面とゲーム画面のサンプルから検知エリアを提案します")
+    parser.add_argument("load", help="ロード画面の画像 (ファイル or フォルダ)")
+    parser.add_argument("gameplay", nargs="?", default=None, help="ゲーム画面の画像 (ファイル or フォルダ)")
+    parser.add_argument("--pattern", type=int, default=0, help="パターン番号 (設定の上から0, 1, ...)")
+    args = parser.parse_args()
+
+    config = load_config()
+    pattern = config.patterns[args.pattern]
+    suggestion = suggest_areas(
+        load_images(args.load), load_images(args.gameplay) if args.gameplay else [],
+        pattern, config.area_size
+    )
+    print(f"{pattern.name}: 候補 {suggestion.candidate_count}個から {len(suggestion.areas)}個を選びました "
+          f"(ロード検知 {suggestion.load_detection_rate:.0%} / 誤検知 {suggestion.gameplay_false_rate:.0%})")
+    if suggestion.warning:
+        print(f"  ※ {suggestion.warning}")
+    for s in suggestion.scores:
+        print(f"  x={s.area.x}% y={s.area.y}%  点 {s.score:.2f} (ばらつき {s.spread:.1f}, "
+              f"ゲーム画面との距離 {s.gameplay_distance:.0f})")
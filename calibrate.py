@@ -0,0 +1,451 @@
+"""
+AutoSplit GIEEE - 検知パラメータの自動調整
+ロード区間をラベル付けした録画から、色許容値・検知閾値・誤検知無視時間の組み合わせを探して提案する
+
+エリアごとの平均色は最初に1回だけ (並列で) 求めて、候補の評価ではそれを使い回す。
+組み合わせが MAX_CANDIDATES 以下なら全部を、多すぎるときは1パターンずつ選び直す座標降下で探す
+(検知は全パターンの OR なので、パターンごとに良くしていけば全体も良くなる)。
+画素ごとに判定するパターン (match_mode="pixel") は平均色から判定できないので、今の設定のまま判定して
+どの候補にも同じように加える (許容値と閾値は探索しない)。
+候補はプロセスプールで並列に評価し、誤スプリット・ロードの見逃し・境界のずれで採点する。
+
+ラベルファイルは1行に1つのロード区間を「開始秒,終了秒」で書いたCSV
+(時刻は録画のタイムスタンプ基準。動画なら先頭からの秒数)。
+
+使い方:
+    python calibrate.py <録画> <ラベルCSV> [--workers N] [--step N] [--output 設定ファイル]
+"""
+import argparse
+import copy
+import csv
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from config import AppConfig, load_config, save_config, get_app_dir
+from detection_engine import DetectionPlan
+from load_state import BOUNDARY_MIDPOINT
+from vod_analyzer import recording_area_means
+
+
+# 探索する値 (パターンごとに許容値と閾値、全体で誤検知無視時間)
+DEFAULT_TOLERANCES = (10, 15, 20, 30, 40, 50, 60, 80)
+DEFAULT_THRESHOLDS = (50, 60, 70, 80, 90, 100)
+DEFAULT_MIN_DURATIONS = (0, 50, 100, 140, 200, 300, 500)
+MAX_CANDIDATES = 50000  # 組み合わせがこれより多いときは座標降下で探す (評価する候補数の上限にもなる)
+MAX_DESCENT_ROUNDS = 10  # 座標降下で全パターンを選び直す回数の上限
+
+# 採点の重み (小さいほど良い)
+FALSE_SPLIT_WEIGHT = 10.0  # 誤スプリット1回
+MISSED_LOAD_WEIGHT = 10.0  # 見逃したロード1回
+BOUNDARY_WEIGHT_PER_MS = 0.01  # ロード境界のずれ (平均, ms)
+
+SCORE_CHUNK = 256  # ワーカーに一度に渡す候補数
+
+
+@dataclass
+class CalibrationCandidate:
+    """評価したパラメータの組み合わせ"""
+    tolerances: tuple[int, ...]  # パターンごとの色許容値
+    thresholds: tuple[int, ...]  # パターンごとの検知閾値 (%)
+    min_duration_ms: int
+    score: float
+    false_splits: int
+    missed_loads: int
+    boundary_error_ms: float  # 一致したロードの開始・終了のずれの平均
+
+
+def read_labels(path) -> np.ndarray:
+    """ラベルCSV (開始秒,終了秒) を (L, 2) の配列で読む"""
+    labels = []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 2:
+                continue
+            try:
+                start, end = float(row[0]), float(row[1])
+            except ValueError:
+                continue  # ヘッダー行
+            if end > start:
+                labels.append((start, end))
+    labels.sort()
+    return np.array(labels, dtype=np.float64).reshape(-1, 2)
+
+
+def area_distances(plan: DetectionPlan, means: np.ndarray) -> np.ndarray:
+    """各フレーム・各エントリ (パターンのエリア) のターゲット色との平方距離 (F, E)"""
+    diff = means[:, plan.box_ids].astype(np.int32) - plan.targets[plan.pattern_ids].astype(np.int32)
+    return np.einsum("fej,fej->fe", diff, diff)
+
+
+def mean_patterns(plan: DetectionPlan) -> list[int]:
+    """平均色で判定する (探索できる) パターンの番号"""
+    return [p for p in range(len(plan.patterns))
+            if plan.totals[p] > 0 and plan.patterns[p].match_mode != "pixel"]
+
+
+def pixel_patterns(plan: DetectionPlan) -> list[int]:
+    """画素ごとに判定するパターンの番号"""
+    return [p for p in range(len(plan.patterns))
+            if plan.totals[p] > 0 and plan.patterns[p].match_mode == "pixel"]
+
+
+def pixel_detections(plan: DetectionPlan, pixel_counts: np.ndarray) -> np.ndarray:
+    """画素ごとに判定するパターンのどれかが、今の閾値で検知したフレーム (F,)"""
+    detected = np.zeros(len(pixel_counts), dtype=bool)
+    for p in pixel_patterns(plan):
+        detected |= pixel_counts[:, p] >= plan.threshold_counts[p]
+    return detected
+
+
+def detection_masks(plan: DetectionPlan, distances: np.ndarray,
+                    tolerances, thresholds) -> np.ndarray:
+    """
+    パターン・許容値・閾値ごとの検知フラグ
+
+    Returns:
+        (P, T, H, F) の bool (エリアのないパターンと画素ごとに判定するパターンは常に False)
+    """
+    pattern_count = len(plan.patterns)
+    masks = np.zeros((pattern_count, len(tolerances), len(thresholds), len(distances)), dtype=bool)
+    for p in mean_patterns(plan):
+        total = int(plan.totals[p])
+        columns = distances[:, plan.pattern_ids == p]
+        for ti, tolerance in enumerate(tolerances):
+            counts = np.count_nonzero(columns <= tolerance * tolerance, axis=1)
+            for hi, threshold in enumerate(thresholds):
+                masks[p, ti, hi] = counts >= (threshold * total + 99) // 100
+    return masks
+
+
+def find_loads(timestamps: np.ndarray, detected: np.ndarray, min_duration_ms: float,
+               mode: str, cooldown_ms: float = 0) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    検知フラグの列からロード区間を求める (LoadStateMachine と同じ判定)
+
+    続けて検知したフレームのうち、最初のフレームの境界から最後のフレームまでが
+    min_duration_ms 以上あり、その後に検知が途切れたフレームがあるものをロードとする
+    (録画の最後まで続いている検知は、LoadStateMachine と同じくロード終了にならないので数えない)。
+    スプリットは前回スプリットしたロードの開始から cooldown_ms 以上空いたロードだけで送る。
+
+    Returns:
+        (開始時刻, 終了時刻, スプリットを送ったか) の配列
+    """
+    edges = np.diff(np.concatenate(([0], detected.view(np.int8), [0])))
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)  # 検知が途切れた最初のフレーム
+    closed = run_ends < len(timestamps)
+    run_starts, run_ends = run_starts[closed], run_ends[closed]
+    if len(run_starts) == 0:
+        empty = np.zeros(0, dtype=np.float64)
+        return empty, empty.copy(), np.zeros(0, dtype=bool)
+
+    starts = timestamps[run_starts].copy()
+    last = timestamps[run_ends - 1]
+    ends = timestamps[run_ends].copy()
+    if mode == BOUNDARY_MIDPOINT:
+        has_prev = run_starts > 0
+        # boundary_time と同じ式で求める (丸め方をそろえる)
+        before = timestamps[run_starts[has_prev] - 1]
+        starts[has_prev] = before + (starts[has_prev] - before) / 2
+        ends = last + (ends - last) / 2
+
+    confirmed = (last - starts) * 1000 >= min_duration_ms
+    starts, ends = starts[confirmed], ends[confirmed]
+    return starts, ends, cooldown_splits(starts, cooldown_ms)
+
+
+def cooldown_splits(starts: np.ndarray, cooldown_ms: float) -> np.ndarray:
+    """ロード開始時刻の列のうち、クールダウンを過ぎていてスプリットを送るもの"""
+    splits = np.ones(len(starts), dtype=bool)
+    if cooldown_ms <= 0:
+        return splits
+    last_split = None
+    for i, start in enumerate(starts):
+        if last_split is not None and (start - last_split) * 1000 < cooldown_ms:
+            splits[i] = False
+        else:
+            last_split = start
+    return splits
+
+
+def score_loads(starts: np.ndarray, ends: np.ndarray, labels: np.ndarray,
+                splits: Optional[np.ndarray] = None) -> tuple[float, int, int, float]:
+    """
+    検知したロードをラベルと突き合わせて採点する
+
+    重なっているロードとラベルを1対1で対応させ、
+    対応しないロードは誤スプリット、対応しないラベルは見逃しとして数える。
+    splits を渡すと、クールダウンでスプリットを送らなかったロードは誤スプリットに数えない。
+
+    Returns:
+        (スコア, 誤スプリット数, 見逃し数, 境界のずれの平均 (ms))
+    """
+    overlap = (starts[:, None] < labels[None, :, 1]) & (ends[:, None] > labels[None, :, 0])
+    used = np.zeros(len(starts), dtype=bool)
+    matched = 0
+    error_sum = 0.0
+    for label in range(len(labels)):
+        hits = np.flatnonzero(overlap[:, label] & ~used)
+        if len(hits) == 0:
+            continue
+        load = hits[0]
+        used[load] = True
+        matched += 1
+        error_sum += (abs(starts[load] - labels[label, 0]) + abs(ends[load] - labels[label, 1])) / 2
+
+    unmatched = ~used if splits is None else ~used & splits
+    false_splits = int(np.count_nonzero(unmatched))
+    missed = len(labels) - matched
+    boundary_ms = error_sum / matched * 1000 if matched else 0.0
+    score = (false_splits * FALSE_SPLIT_WEIGHT + missed * MISSED_LOAD_WEIGHT
+             + boundary_ms * BOUNDARY_WEIGHT_PER_MS)
+    return float(score), int(false_splits), int(missed), float(boundary_ms)
+
+
+# --- ワーカープロセス側 ---
+
+_search = None
+
+
+class _Search:
+    """候補の評価に必要なもの一式 (ワーカーごとに1つ)"""
+
+    def __init__(self, timestamps, masks, labels, searched, min_durations, mode, cooldown_ms=0,
+                 fixed=None):
+        self.timestamps = timestamps
+        self.masks = masks
+        # 探索しないパターン (画素ごとに判定するもの) の検知フラグ
+        self.fixed = fixed if fixed is not None else np.zeros(len(timestamps), dtype=bool)
+        self.labels = labels
+        self.searched = searched  # 探索するパターンの番号
+        self.min_durations = min_durations
+        self.mode = mode
+        self.cooldown_ms = cooldown_ms
+        _, tolerance_count, threshold_count, _ = masks.shape
+        # 候補 = (パターンごとの (許容値, 閾値) の番号, 誤検知無視時間の番号)
+        # 候補番号はそれを混合基数で表したもの
+        self.shape = (tolerance_count, threshold_count) * len(searched) + (len(min_durations),)
+
+    @property
+    def candidate_count(self) -> int:
+        """全組み合わせの数 (パターンが多いと int64 に収まらないので Python の int で数える)"""
+        return math.prod(self.shape)
+
+    def decode(self, index: int) -> tuple[tuple[tuple[int, int], ...], int]:
+        """候補番号を候補にする"""
+        digits = []
+        for size in reversed(self.shape):
+            index, digit = divmod(index, size)
+            digits.append(digit)
+        digits.reverse()
+        pairs = tuple((digits[2 * i], digits[2 * i + 1]) for i in range(len(self.searched)))
+        return pairs, digits[-1]
+
+    def score(self, candidate: tuple[tuple[tuple[int, int], ...], int]) -> tuple[float, int, int, float]:
+        pairs, duration_index = candidate
+        detected = self.fixed.copy()
+        for p, (ti, hi) in zip(self.searched, pairs):
+            detected |= self.masks[p, ti, hi]
+        starts, ends, splits = find_loads(self.timestamps, detected, self.min_durations[duration_index],
+                                          self.mode, self.cooldown_ms)
+        return score_loads(starts, ends, self.labels, splits)
+
+
+def _init_search(*args):
+    global _search
+    _search = _Search(*args)
+
+
+def _score_chunk(candidates: list) -> list[tuple[float, int, int, float, tuple]]:
+    return [(*_search.score(c), c) for c in candidates]
+
+
+def _rank(scored: tuple) -> tuple[float, int]:
+    """並べ替えのキー (同じスコアなら誤検知無視時間が短い = スプリットが早い方を選ぶ)"""
+    return scored[0], scored[4][1]
+
+
+def _nearest_index(values, value) -> int:
+    return min(range(len(values)), key=lambda i: abs(values[i] - value))
+
+
+def _coordinate_descent(search: _Search, start: tuple, score_all, max_candidates: int) -> list[tuple]:
+    """
+    全組み合わせが多すぎるときの探索
+
+    他のパターンを固定して、1パターンずつ (許容値, 閾値) と誤検知無視時間を全通り試して一番良いものに替える。
+    一周しても良くならないか、評価した候補が max_candidates を超えたら終わる。
+
+    Returns:
+        評価した全候補の (スコア, 誤スプリット, 見逃し, ずれ, 候補)
+    """
+    tolerance_count, threshold_count = search.shape[0], search.shape[1]
+    duration_count = search.shape[-1]
+    scored = score_all([start])
+    best = scored[0]
+    for _ in range(MAX_DESCENT_ROUNDS):
+        improved = False
+        for k in range(len(search.searched)):
+            pairs = best[4][0]
+            results = score_all([
+                (pairs[:k] + ((ti, hi),) + pairs[k + 1:], di)
+                for ti in range(tolerance_count) for hi in range(threshold_count) for di in range(duration_count)
+            ])
+            scored.extend(results)
+            top = min(results, key=_rank)
+            if _rank(top) < _rank(best):
+                best = top
+                improved = True
+            if len(scored) >= max_candidates:
+                return scored
+        if not improved:
+            break
+    return scored
+
+
+# --- 調整 ---
+
+def evaluate_config(config: AppConfig, plan: DetectionPlan, timestamps: np.ndarray,
+                    distances: np.ndarray, labels: np.ndarray,
+                    pixel_counts: Optional[np.ndarray] = None) -> tuple[float, int, int, float]:
+    """今の設定のスコア"""
+    if pixel_counts is not None:
+        detected = pixel_detections(plan, pixel_counts)
+    else:
+        detected = np.zeros(len(timestamps), dtype=bool)
+    for p in mean_patterns(plan):
+        pattern = plan.patterns[p]
+        detected |= detection_masks(plan, distances, [pattern.tolerance], [pattern.threshold_percent])[p, 0, 0]
+    starts, ends, splits = find_loads(timestamps, detected, config.min_duration_ms,
+                                      config.load_boundary_mode, config.cooldown_ms)
+    return score_loads(starts, ends, labels, splits)
+
+
+def calibrate(source_path, labels: np.ndarray, config: AppConfig,
+              workers: Optional[int] = None, step: int = 1,
+              tolerances=DEFAULT_TOLERANCES, thresholds=DEFAULT_THRESHOLDS,
+              min_durations=DEFAULT_MIN_DURATIONS, max_candidates: int = MAX_CANDIDATES,
+              top: int = 10) -> tuple[list[CalibrationCandidate], dict[str, float]]:
+    """
+    録画とラベルからパラメータを探す
+
+    画素ごとに判定するパターンは今の設定のまま判定に加え、許容値と閾値は今の値を候補に入れる。
+
+    Returns:
+        (スコアの良い順の候補 top 個, 統計 ※ fixed_patterns = 探索しなかったパターン数)
+    """
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    timestamps, means, pixel_counts, plan = recording_area_means(source_path, config, workers, step)
+    distances = area_distances(plan, means)
+    masks = detection_masks(plan, distances, tolerances, thresholds)
+    fixed = pixel_detections(plan, pixel_counts)
+    prepared = time.perf_counter()
+
+    searched = mean_patterns(plan)
+    init_args = (timestamps, masks, labels, searched, tuple(min_durations), config.load_boundary_mode,
+                 config.cooldown_ms, fixed)
+    search = _Search(*init_args)
+    pool = None
+    if workers == 1:
+        _init_search(*init_args)
+    else:
+        pool = ProcessPoolExecutor(workers, initializer=_init_search, initargs=init_args)
+
+    def score_all(batch: list) -> list:
+        chunks = [batch[i:i + SCORE_CHUNK] for i in range(0, len(batch), SCORE_CHUNK)]
+        parts = pool.map(_score_chunk, chunks) if pool is not None else map(_score_chunk, chunks)
+        return [s for part in parts for s in part]
+
+    try:
+        if search.candidate_count <= max_candidates:
+            scored = score_all([search.decode(i) for i in range(search.candidate_count)])
+        else:
+            # 全部は多すぎるので、今の設定から1パターンずつ選び直す
+            start = (
+                tuple((_nearest_index(tolerances, plan.patterns[p].tolerance),
+                       _nearest_index(thresholds, plan.patterns[p].threshold_percent)) for p in searched),
+                _nearest_index(min_durations, config.min_duration_ms),
+            )
+            scored = _coordinate_descent(search, start, score_all, max_candidates)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    finished = time.perf_counter()
+
+    # 座標降下では同じ候補を何度か評価するので1つにまとめる
+    unique = list({s[4]: s for s in scored}.values())
+    unique.sort(key=_rank)
+    candidates = []
+    for score, false_splits, missed, boundary_ms, (pairs, duration_index) in unique[:top]:
+        tolerance_values = [p.tolerance for p in plan.patterns]
+        threshold_values = [p.threshold_percent for p in plan.patterns]
+        for p, (ti, hi) in zip(searched, pairs):
+            tolerance_values[p] = tolerances[ti]
+            threshold_values[p] = thresholds[hi]
+        candidates.append(CalibrationCandidate(
+            tuple(tolerance_values), tuple(threshold_values), min_durations[duration_index],
+            score, false_splits, missed, boundary_ms
+        ))
+
+    stats = {
+        "frames": len(timestamps),
+        "candidates": len(unique),
+        "prepare_seconds": prepared - started,
+        "search_seconds": finished - prepared,
+        "fixed_patterns": len(pixel_patterns(plan)),
+    }
+    stats["current_score"], stats["current_false_splits"], stats["current_missed"], stats["current_boundary_ms"] = (
+        evaluate_config(config, plan, timestamps, distances, labels, pixel_counts)
+    )
+    return candidates, stats
+
+
+def apply_candidate(config: AppConfig, candidate: CalibrationCandidate) -> AppConfig:
+    """候補のパラメータを反映した設定のコピー"""
+    proposed = copy.deepcopy(config)
+    for pattern, tolerance, threshold in zip(proposed.patterns, candidate.tolerances, candidate.thresholds):
+        pattern.tolerance = tolerance
+        pattern.threshold_percent = threshold
+    proposed.min_duration_ms = candidate.min_duration_ms
+    return proposed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ラベル付きの録画から検知パラメータを探します")
+    parser.add_argument("source", help="録画 (動画ファイル / PNG連番フォルダ / ROI録画ファイル)")
+    parser.add_argument("labels", help="ロード区間のCSV (開始秒,終了秒)")
+    parser.add_argument("--workers", type=int, default=None, help="プロセス数 (省略時はCPUコア数)")
+    parser.add_argument("--step", type=int, default=1, help="何フレームおきに使うか")
+    parser.add_argument("--output", default=None, help="提案する設定の保存先 (省略時は config.calibrated.json)")
+    args = parser.parse_args()
+
+    config = load_config()
+    labels = read_labels(args.labels)
+    candidates, stats = calibrate(args.source, labels, config, args.workers, max(1, args.step))
+
+    names = [p.name for p in config.patterns]
+    print(f"{stats['frames']}フレーム / ラベル {len(labels)}件 / 候補 {stats['candidates']}個 "
+          f"(準備 {stats['prepare_seconds']:.2f}秒, 探索 {stats['search_seconds']:.2f}秒)")
+    print(f"今の設定: スコア {stats['current_score']:.2f} (誤スプリット {stats['current_false_splits']} / "
+          f"見逃し {stats['current_missed']} / ずれ {stats['current_boundary_ms']:.1f}ms)")
+    if stats["fixed_patterns"]:
+        fixed_names = ", ".join(p.name for p in config.patterns
+                                if p.enabled and p.areas and p.match_mode == "pixel")
+        print(f"※ 画素ごとに判定するパターン ({fixed_names}) は今の許容値・閾値のまま判定しています (探索していません)")
+    for rank, c in enumerate(candidates[:5], 1):
+        params = ", ".join(f"{n}: 許容値{t} 閾値{h}%" for n, t, h in zip(names, c.tolerances, c.thresholds))
+        print(f"{rank}. スコア {c.score:.2f} (誤スプリット {c.false_splits} / 見逃し {c.missed_loads} / "
+              f"ずれ {c.boundary_error_ms:.1f}ms) 誤検知無視 {c.min_duration_ms}ms / {params}")
+
+    if candidates:
+        output = Path(args.output) if args.output else get_app_dir() / "config.calibrated.json"
+        save_config(apply_candidate(config, candidates[0]), output)
+        print(f"提案する設定を保存しました: {output}")
@@ -2,25 +2,256 @@
 AutoSplit GIEEE - 画面キャプチャモジュール
 """
 from PIL import Image, ImageGrab
+from abc import ABC, abstractmethod
 from typing import Optional
-import win32gui
-import win32ui
-import win32con
+import importlib
 import ctypes
 
+import numpy as np
 
-class ScreenCapture:
-    """画面キャプチャを行うクラス"""
+from frame import Frame
+from roi import RoiRect, SparseFrame
+
+# Windows専用の依存はWindows以外 (CIなど) では読み込めないので任意扱い
+try:
+    import win32gui
+    import win32ui
+    import win32con
+except ImportError:
+    win32gui = None
+    win32ui = None
+    win32con = None
+
+
+class CaptureBackend(ABC):
+    """
+    キャプチャバックエンドの基底クラス
+    
+    register_backend() で名前を付けて登録し、create_backend() で生成する。
+    """
+
+    name = ""
+
+    @classmethod
+    def from_config(cls, config) -> "CaptureBackend":
+        """AppConfig からバックエンドを生成 (必要なら各バックエンドで上書き)"""
+        return cls()
+
+    @abstractmethod
+    def set_target_window(self, window_title: Optional[str]) -> bool:
+        """監視対象を設定"""
+
+    @abstractmethod
+    def capture(self) -> Optional[Image.Image]:
+        """1フレームをキャプチャしてPIL Imageを返す"""
+
+    def capture_frame(self, out: Optional[np.ndarray] = None) -> Optional[Frame]:
+        """
+        1フレームをキャプチャして Frame を返す
+        
+        Args:
+            out: 書き込み先の配列 (対応しているバックエンドのみ使用)
+        """
+        image = self.capture()
+        return Frame.from_image(image) if image is not None else None
+
+    def get_frame_size(self) -> Optional[tuple[int, int]]:
+        """キャプチャ全体のサイズ (幅, 高さ) を取得"""
+        image = self.capture()
+        return image.size if image is not None else None
+
+    def capture_regions(self, rects: list[RoiRect],
+                        frame_size: tuple[int, int]) -> Optional[SparseFrame]:
+        """指定した矩形だけをキャプチャ (既定では全体から切り抜く)"""
+        frame = self.capture_frame()
+        if frame is None or frame.size != tuple(frame_size):
+            return None
+        regions = [
+            (rect, frame.crop((rect.left, rect.top, rect.right, rect.bottom)))
+            for rect in rects
+        ]
+        return SparseFrame(frame_size, regions, frame.timestamp)
+
+    def close(self):
+        pass
+
+
+# 登録済みバックエンド (名前 -> クラス)
+_BACKENDS: dict[str, type[CaptureBackend]] = {}
+
+# 組み込みバックエンドのうち、初回利用時に読み込むモジュール
+_BUILTIN_BACKEND_MODULES = {
+    "replay": "replay",
+}
+
+
+def register_backend(name: str):
+    """キャプチャバックエンドを登録するデコレータ"""
+    def decorator(cls: type[CaptureBackend]) -> type[CaptureBackend]:
+        cls.name = name
+        _BACKENDS[name] = cls
+        return cls
+    return decorator
+
+
+def available_backends() -> list[str]:
+    """利用可能なバックエンド名の一覧"""
+    return sorted(set(_BACKENDS) | set(_BUILTIN_BACKEND_MODULES))
+
+
+def get_backend_class(name: str) -> type[CaptureBackend]:
+    """名前からバックエンドのクラスを取得"""
+    if name not in _BACKENDS and name in _BUILTIN_BACKEND_MODULES:
+        importlib.import_module(_BUILTIN_BACKEND_MODULES[name])
+    if name not in _BACKENDS:
+        raise ValueError(f"未知のキャプチャバックエンド: {name}")
+    return _BACKENDS[name]
+
+
+def create_backend(config) -> CaptureBackend:
+    """AppConfig.capture_backend に従ってゲーム画面用のバックエンドを生成"""
+    return get_backend_class(config.capture_backend).from_config(config)
+
+
+class _BITMAPINFOHEADER(ctypes.Structure):
+    _fields_ = [
+        ("biSize", ctypes.c_uint32),
+        ("biWidth", ctypes.c_int32),
+        ("biHeight", ctypes.c_int32),
+        ("biPlanes", ctypes.c_uint16),
+        ("biBitCount", ctypes.c_uint16),
+        ("biCompression", ctypes.c_uint32),
+        ("biSizeImage", ctypes.c_uint32),
+        ("biXPelsPerMeter", ctypes.c_int32),
+        ("biYPelsPerMeter", ctypes.c_int32),
+        ("biClrUsed", ctypes.c_uint32),
+        ("biClrImportant", ctypes.c_uint32),
+    ]
+
+
+class _BITMAPINFO(ctypes.Structure):
+    _fields_ = [
+        ("bmiHeader", _BITMAPINFOHEADER),
+        ("bmiColors", ctypes.c_uint32 * 3),
+    ]
+
+
+def _read_bitmap_bits(hdc: int, hbitmap: int, width: int, height: int,
+                      out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    ビットマップのピクセルを (H, W, 4) のBGRX配列に直接書き込む
+    
+    GetBitmapBits と違い bytes オブジェクトを経由しないので余計なコピーが発生しない。
+    """
+    if out is None or out.shape != (height, width, 4) or not out.flags.c_contiguous:
+        out = np.empty((height, width, 4), dtype=np.uint8)
+    
+    info = _BITMAPINFO()
+    info.bmiHeader.biSize = ctypes.sizeof(_BITMAPINFOHEADER)
+    info.bmiHeader.biWidth = width
+    info.bmiHeader.biHeight = -height  # 負の値 = 上から下 (トップダウン)
+    info.bmiHeader.biPlanes = 1
+    info.bmiHeader.biBitCount = 32
+    info.bmiHeader.biCompression = 0  # BI_RGB
+    
+    # DIB_RGB_COLORS = 0
+    lines = ctypes.windll.gdi32.GetDIBits(
+        hdc, hbitmap, 0, height, out.ctypes.data_as(ctypes.c_void_p),
+        ctypes.byref(info), 0
+    )
+    if lines != height:
+        raise OSError(f"GetDIBitsに失敗しました ({lines}/{height}行)")
+    return out
+
+
+class _GdiSurface:
+    """
+    ウィンドウキャプチャ用のDCとビットマップ一式 (画面全体の矩形キャプチャではデスクトップウィンドウ)
+    
+    毎フレームの生成/破棄を避けるため、同じウィンドウ・同じサイズの間は使い回す。
+    """
+
+    def __init__(self, hwnd: int, width: int, height: int):
+        self.hwnd = hwnd
+        self.width = width
+        self.height = height
+        
+        # デバイスコンテキスト取得
+        self.hwnd_dc = win32gui.GetWindowDC(hwnd)
+        self.mfc_dc = win32ui.CreateDCFromHandle(self.hwnd_dc)
+        self.save_dc = self.mfc_dc.CreateCompatibleDC()
+        
+        # ビットマップ作成
+        self.bitmap = win32ui.CreateBitmap()
+        self.bitmap.CreateCompatibleBitmap(self.mfc_dc, width, height)
+        self.save_dc.SelectObject(self.bitmap)
+        
+        # ROI矩形ごとの小さなビットマップ (矩形リストが変わるまで使い回す)
+        self._roi_rects: tuple[RoiRect, ...] = ()
+        self._roi_bitmaps: list[tuple] = []
+        self.roi_allocations = 0  # ROI用の (DC, ビットマップ) を確保した数
+        self.roi_releases = 0  # ROI用の (DC, ビットマップ) を解放した数
+
+    def get_roi_bitmaps(self, rects: list[RoiRect]) -> list[tuple]:
+        """ROI矩形ごとの (DC, ビットマップ) を取得 (必要なら作り直す)"""
+        rects = tuple(rects)
+        if rects != self._roi_rects:
+            self._release_roi_bitmaps()
+            for rect in rects:
+                dc = self.mfc_dc.CreateCompatibleDC()
+                bitmap = win32ui.CreateBitmap()
+                bitmap.CreateCompatibleBitmap(self.mfc_dc, rect.width, rect.height)
+                dc.SelectObject(bitmap)
+                self._roi_bitmaps.append((dc, bitmap))
+                self.roi_allocations += 1
+            self._roi_rects = rects
+        return self._roi_bitmaps
+
+    def _release_roi_bitmaps(self):
+        for dc, bitmap in self._roi_bitmaps:
+            win32gui.DeleteObject(bitmap.GetHandle())
+            dc.DeleteDC()
+            self.roi_releases += 1
+        self._roi_bitmaps = []
+        self._roi_rects = ()
+
+    def matches(self, hwnd: int, width: int, height: int) -> bool:
+        """同じウィンドウ・同じサイズならTrue"""
+        return self.hwnd == hwnd and self.width == width and self.height == height
+
+    def release(self):
+        """リソース解放"""
+        try:
+            self._release_roi_bitmaps()
+            win32gui.DeleteObject(self.bitmap.GetHandle())
+            self.save_dc.DeleteDC()
+            self.mfc_dc.DeleteDC()
+        finally:
+            win32gui.ReleaseDC(self.hwnd, self.hwnd_dc)
+
+
+@register_backend("win32")
+class ScreenCapture(CaptureBackend):
+    """画面キャプチャを行うクラス (PrintWindow / BitBlt / ImageGrab)"""
 
     def __init__(self):
         self._target_window: Optional[str] = None
         self._window_handle: Optional[int] = None
+        
+        # フレーム間で使い回すGDIリソース
+        self._surface: Optional[_GdiSurface] = None
+        self._surface_allocations = 0
+        self._surface_releases = 0
+        # 解放済みサーフェスのROIビットマップの確保/解放数
+        self._roi_allocations = 0
+        self._roi_releases = 0
 
     def set_target_window(self, window_title: Optional[str]) -> bool:
         """監視対象ウィンドウを設定"""
         self._target_window = window_title
         if window_title is None:
             self._window_handle = None
+            self._release_surface()
             return True
 
         self._window_handle = win32gui.FindWindow(None, window_title)
@@ -28,16 +259,131 @@ class ScreenCapture:
 
     def capture(self) -> Optional[Image.Image]:
         """画面をキャプチャしてPIL Imageを返す"""
+        frame = self.capture_frame()
+        return frame.to_image() if frame is not None else None
+
+    def capture_frame(self, out: Optional[np.ndarray] = None) -> Optional[Frame]:
+        """画面をキャプチャして Frame (ウィンドウ指定時はBGRXのまま) を返す"""
         try:
             if self._window_handle is None:
-                return ImageGrab.grab()
+                return Frame.from_image(ImageGrab.grab())
             else:
-                return self._capture_window_bitblt(self._window_handle)
+                return self._capture_window_bitblt(self._window_handle, out)
+        except Exception as e:
+            print(f"キャプチャエラー: {e}")
+            return None
+
+    def get_frame_size(self) -> Optional[tuple[int, int]]:
+        """キャプチャ全体のサイズ (幅, 高さ) を取得"""
+        try:
+            if self._window_handle is None:
+                user32 = ctypes.windll.user32
+                # SM_CXSCREEN = 0, SM_CYSCREEN = 1 (プライマリモニター)
+                return (user32.GetSystemMetrics(0), user32.GetSystemMetrics(1))
+            left, top, right, bottom = win32gui.GetWindowRect(self._window_handle)
+            if right - left <= 0 or bottom - top <= 0:
+                return None
+            return (right - left, bottom - top)
+        except Exception as e:
+            print(f"サイズ取得エラー: {e}")
+            return None
+
+    def capture_regions(self, rects: list[RoiRect],
+                        frame_size: tuple[int, int]) -> Optional[SparseFrame]:
+        """
+        指定した矩形だけをキャプチャ
+        
+        Args:
+            rects: キャプチャする矩形 (compute_roi_rects の結果)
+            frame_size: 矩形計算に使ったキャプチャ全体のサイズ
+        
+        Returns:
+            SparseFrame (サイズが変わっていた場合などはNone)
+        """
+        try:
+            if self._window_handle is None:
+                return self._capture_screen_regions(rects, frame_size)
+            return self._capture_regions_bitblt(self._window_handle, rects, frame_size)
         except Exception as e:
             print(f"キャプチャエラー: {e}")
             return None
 
-    def _capture_window_bitblt(self, hwnd: int) -> Optional[Image.Image]:
+    def _capture_regions_bitblt(self, hwnd: int, rects: list[RoiRect],
+                                frame_size: tuple[int, int]) -> Optional[SparseFrame]:
+        """ウィンドウを描画し、矩形部分だけをビットマップから取り出す"""
+        left, top, right, bottom = win32gui.GetWindowRect(hwnd)
+        width = right - left
+        height = bottom - top
+        if (width, height) != tuple(frame_size):
+            # ウィンドウサイズが変わった -> 呼び出し側で矩形を再計算してもらう
+            return None
+        
+        try:
+            surface = self._get_surface(hwnd, width, height)
+            
+            user32 = ctypes.windll.user32
+            result = user32.PrintWindow(hwnd, surface.save_dc.GetSafeHdc(), 2)
+            src_dc = surface.save_dc if result != 0 else surface.mfc_dc
+            return SparseFrame(frame_size, self._copy_roi_regions(surface, src_dc, rects))
+            
+        except Exception as e:
+            print(f"BitBltキャプチャエラー: {e}")
+            self._release_surface()
+            # フォールバック: 全体をキャプチャして切り抜く
+            try:
+                full = Frame.from_image(ImageGrab.grab(bbox=(left, top, right, bottom)))
+                regions = [
+                    (rect, full.crop((rect.left, rect.top, rect.right, rect.bottom)))
+                    for rect in rects
+                ]
+                return SparseFrame(frame_size, regions)
+            except:
+                return None
+
+    def _capture_screen_regions(self, rects: list[RoiRect],
+                                frame_size: tuple[int, int]) -> Optional[SparseFrame]:
+        """
+        画面 (プライマリモニター) の矩形部分だけを画面のDCから BitBlt で取り出す
+        
+        ImageGrab.grab(bbox=...) は毎回画面全体を取ってから切り抜くので、矩形ごとに呼ぶと重い。
+        """
+        user32 = ctypes.windll.user32
+        width, height = user32.GetSystemMetrics(0), user32.GetSystemMetrics(1)
+        if (width, height) != tuple(frame_size):
+            # 解像度が変わった -> 呼び出し側で矩形を再計算してもらう
+            return None
+        
+        try:
+            surface = self._get_surface(win32gui.GetDesktopWindow(), width, height)
+            return SparseFrame(frame_size, self._copy_roi_regions(surface, surface.mfc_dc, rects))
+        except Exception as e:
+            print(f"BitBltキャプチャエラー: {e}")
+            self._release_surface()
+            # フォールバック: 画面全体を1回だけキャプチャして切り抜く
+            try:
+                full = Frame.from_image(ImageGrab.grab())
+                regions = [
+                    (rect, full.crop((rect.left, rect.top, rect.right, rect.bottom)))
+                    for rect in rects
+                ]
+                return SparseFrame(frame_size, regions)
+            except:
+                return None
+
+    @staticmethod
+    def _copy_roi_regions(surface: "_GdiSurface", src_dc, rects: list[RoiRect]) -> list[tuple[RoiRect, Frame]]:
+        """src_dc の矩形部分だけを矩形ごとの小さなビットマップにコピーして取り出す"""
+        regions = []
+        for rect, (dc, bitmap) in zip(rects, surface.get_roi_bitmaps(rects)):
+            dc.BitBlt((0, 0), (rect.width, rect.height), src_dc,
+                      (rect.left, rect.top), win32con.SRCCOPY)
+            pixels = _read_bitmap_bits(dc.GetSafeHdc(), bitmap.GetHandle(),
+                                       rect.width, rect.height)
+            regions.append((rect, Frame(pixels, "BGR")))
+        return regions
+
+    def _capture_window_bitblt(self, hwnd: int,
+                               out: Optional[np.ndarray] = None) -> Optional[Frame]:
         """BitBltを使用してウィンドウをキャプチャ"""
         try:
             # ウィンドウの位置とサイズを取得
@@ -48,55 +394,92 @@ class ScreenCapture:
             if width <= 0 or height <= 0:
                 return None
 
-            # デバイスコンテキスト取得
-            hwnd_dc = win32gui.GetWindowDC(hwnd)
-            mfc_dc = win32ui.CreateDCFromHandle(hwnd_dc)
-            save_dc = mfc_dc.CreateCompatibleDC()
-            
-            # ビットマップ作成
-            save_bitmap = win32ui.CreateBitmap()
-            save_bitmap.CreateCompatibleBitmap(mfc_dc, width, height)
-            save_dc.SelectObject(save_bitmap)
+            # DC・ビットマップはフレーム間で使い回す (サイズ/ハンドル変更時のみ再生成)
+            surface = self._get_surface(hwnd, width, height)
             
             # PrintWindow を ctypes経由で呼び出し (DirectXウィンドウ対応)
             # PW_RENDERFULLCONTENT = 2
             user32 = ctypes.windll.user32
-            result = user32.PrintWindow(hwnd, save_dc.GetSafeHdc(), 2)
+            result = user32.PrintWindow(hwnd, surface.save_dc.GetSafeHdc(), 2)
             
             if result == 0:
                 # PrintWindowが失敗した場合はBitBltを試す
-                save_dc.BitBlt((0, 0), (width, height), mfc_dc, (0, 0), win32con.SRCCOPY)
-            
-            # ビットマップからPIL Imageに変換
-            bmp_info = save_bitmap.GetInfo()
-            bmp_str = save_bitmap.GetBitmapBits(True)
-            
-            img = Image.frombuffer(
-                'RGB',
-                (bmp_info['bmWidth'], bmp_info['bmHeight']),
-                bmp_str, 'raw', 'BGRX', 0, 1
-            )
-            
-            # リソース解放
-            win32gui.DeleteObject(save_bitmap.GetHandle())
-            save_dc.DeleteDC()
-            mfc_dc.DeleteDC()
-            win32gui.ReleaseDC(hwnd, hwnd_dc)
+                surface.save_dc.BitBlt((0, 0), (width, height), surface.mfc_dc, (0, 0), win32con.SRCCOPY)
             
-            return img
+            # ビットマップのピクセルをBGRXのまま配列に読み出す (RGB変換はしない)
+            pixels = _read_bitmap_bits(surface.save_dc.GetSafeHdc(), surface.bitmap.GetHandle(),
+                                       width, height, out)
+            return Frame(pixels, "BGR")
             
         except Exception as e:
             print(f"BitBltキャプチャエラー: {e}")
+            # DCが壊れている可能性があるので次フレームで作り直す
+            self._release_surface()
             # フォールバック
             try:
                 rect = win32gui.GetWindowRect(hwnd)
-                return ImageGrab.grab(bbox=rect)
+                return Frame.from_image(ImageGrab.grab(bbox=rect))
             except:
                 return None
 
+    def _get_surface(self, hwnd: int, width: int, height: int) -> "_GdiSurface":
+        """使い回し用のGDIサーフェスを取得 (必要なら作り直す)"""
+        surface = self._surface
+        if surface is not None and surface.matches(hwnd, width, height):
+            return surface
+        
+        self._release_surface()
+        surface = _GdiSurface(hwnd, width, height)
+        self._surface = surface
+        self._surface_allocations += 1
+        return surface
+
+    def _release_surface(self):
+        """保持しているGDIサーフェスを解放"""
+        if self._surface is None:
+            return
+        try:
+            self._surface.release()
+        finally:
+            self._roi_allocations += self._surface.roi_allocations
+            self._roi_releases += self._surface.roi_releases
+            self._surface = None
+            self._surface_releases += 1
+
+    def get_gdi_stats(self) -> dict[str, int]:
+        """
+        GDIリソースの確保/解放回数を取得 (リーク確認用)
+        
+        ウィンドウ全体用のサーフェスと、ROI矩形ごとの (DC, ビットマップ) の両方を数える。
+        
+        Returns:
+            {"allocations": 確保回数, "releases": 解放回数, "live": 保持中の数 (いずれも合計),
+             "surface_*": ウィンドウ全体用の内訳, "roi_*": ROI矩形用の内訳}
+        """
+        roi_allocations = self._roi_allocations
+        roi_releases = self._roi_releases
+        if self._surface is not None:
+            roi_allocations += self._surface.roi_allocations
+            roi_releases += self._surface.roi_releases
+        surface_live = self._surface_allocations - self._surface_releases
+        roi_live = roi_allocations - roi_releases
+        return {
+            "allocations": self._surface_allocations + roi_allocations,
+            "releases": self._surface_releases + roi_releases,
+            "live": surface_live + roi_live,
+            "surface_allocations": self._surface_allocations,
+            "surface_releases": self._surface_releases,
+            "surface_live": surface_live,
+            "roi_allocations": roi_allocations,
+            "roi_releases": roi_releases,
+            "roi_live": roi_live,
+        }
+
     @staticmethod
     def list_windows() -> list[str]:
         """キャプチャ可能なウィンドウ一覧を取得"""
+        if win32gui is None:
+            return []
         windows = []
 
         def enum_callback(hwnd, _):
@@ -111,12 +494,14 @@ class ScreenCapture:
         return sorted(set(windows))
 
     def close(self):
-        pass
+        self._release_surface()
 
 
 def check_window_exists(title: Optional[str]) -> bool:
     """指定されたタイトルのウィンドウが存在するかチェック"""
     if not title:
         return True # フルスクリーン判定
+    if win32gui is None:
+        return False
     hwnd = win32gui.FindWindow(None, title)
     return hwnd != 0
@@ -0,0 +1,115 @@
+"""
+AutoSplit GIEEE - 色分類ルックアップテーブル
+画素の色が「パターンの色のどれかから許容値以内か」を、量子化した色空間の表で引けるようにする
+
+表は色の組と許容値のハッシュをキーにしてディスクにキャッシュする (起動を速くするため)。
+"""
+import hashlib
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from config import get_app_dir
+
+
+LUT_BITS = 6  # 1チャンネルあたりのビット数 (64段階 -> 表は 64^3 = 262144 要素)
+LUT_SHIFT = 8 - LUT_BITS
+LUT_SIZE = 1 << LUT_BITS
+LUT_VERSION = 1  # 表の作り方を変えたら上げる (古いキャッシュを使わないように)
+
+
+def lut_key(colors: tuple[tuple[int, int, int], ...], tolerance: int) -> str:
+    """色の組と許容値から作るキャッシュのキー"""
+    payload = json.dumps({
+        "colors": sorted(list(c) for c in colors),
+        "tolerance": tolerance,
+        "bits": LUT_BITS,
+        "version": LUT_VERSION,
+    })
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def build_color_lut(colors: tuple[tuple[int, int, int], ...], tolerance: int) -> np.ndarray:
+    """
+    色の表を作る
+
+    各セルの中心の色が colors のどれかから tolerance 以内なら True。
+    色はフレームのチャンネル順で渡すこと (表もその順で引く)。
+
+    Returns:
+        (LUT_SIZE ** 3,) の bool
+    """
+    centers = (np.arange(LUT_SIZE, dtype=np.int32) << LUT_SHIFT) + (1 << LUT_SHIFT) // 2
+    lut = np.zeros((LUT_SIZE, LUT_SIZE, LUT_SIZE), dtype=bool)
+    tolerance_sq = tolerance * tolerance
+    for c0, c1, c2 in colors:
+        d0 = (centers - c0) ** 2
+        d1 = (centers - c1) ** 2
+        d2 = (centers - c2) ** 2
+        lut |= (d0[:, None, None] + d1[None, :, None] + d2[None, None, :]) <= tolerance_sq
+    return lut.reshape(-1)
+
+
+def _cache_dir() -> Path:
+    return get_app_dir() / "cache"
+
+
+@lru_cache(maxsize=32)
+def cached_color_lut(colors: tuple[tuple[int, int, int], ...], tolerance: int,
+                     cache_dir: Optional[Path] = None) -> np.ndarray:
+    """
+    色の表 (メモリとディスクにキャッシュ)
+
+    ディスクのキャッシュが読めなければ作り直して保存する (保存できなくても動く)。
+    """
+    folder = Path(cache_dir) if cache_dir is not None else _cache_dir()
+    path = folder / f"lut_{lut_key(colors, tolerance)}.npy"
+    lut = None
+    try:
+        loaded = np.load(path)
+        if loaded.shape == (LUT_SIZE ** 3,) and loaded.dtype == bool:
+            lut = loaded
+    except (OSError, ValueError):
+        pass
+
+    if lut is None:
+        lut = build_color_lut(colors, tolerance)
+        try:
+            folder.mkdir(parents=True, exist_ok=True)
+            np.save(path, lut)
+        except OSError as e:
+            print(f"色の表を保存できませんでした: {e}")
+    # キャッシュしたものを共有するので書き換えられないようにする
+    lut.flags.writeable = False
+    return lut
+
+
+def combine_luts(luts: list[np.ndarray]) -> np.ndarray:
+    """
+    複数の表を1つにまとめる (i 番目の表のフラグを i ビット目に入れる)
+
+    1回の参照で全部のパターンの判定が取れる。
+    """
+    if len(luts) <= 8:
+        dtype = np.uint8
+    elif len(luts) <= 16:
+        dtype = np.uint16
+    elif len(luts) <= 32:
+        dtype = np.uint32
+    else:
+        raise ValueError("画素ごとに判定するパターンは32個までです")
+    combined = np.zeros(LUT_SIZE ** 3, dtype=dtype)
+    for bit, lut in enumerate(luts):
+        combined |= lut.astype(dtype) << dtype(bit)
+    return combined
+
+
+def lut_indices(pixels: np.ndarray) -> np.ndarray:
+    """(H, W, C) の画素を表の番号 (H, W) にする (チャンネル順はそのまま)"""
+    index = (pixels[:, :, 0] >> LUT_SHIFT).astype(np.uint32) << (2 * LUT_BITS)
+    index |= (pixels[:, :, 1] >> LUT_SHIFT).astype(np.uint32) << LUT_BITS
+    index |= pixels[:, :, 2] >> LUT_SHIFT
+    return index
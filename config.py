@@ -2,6 +2,7 @@
 AutoSplit GIEEE - 設定管理モジュール
 """
 import json
+import itertools
 from pathlib import Path
 from dataclasses import dataclass, field, asdict
 from typing import Optional
@@ -17,6 +18,9 @@ def get_app_dir():
 
 CONFIG_FILE = get_app_dir() / "config.json"
 
+# 設定リビジョンの採番 (インスタンスをまたいで重複しないように共通のカウンタを使う)
+_revision_counter = itertools.count(1)
+
 
 @dataclass
 class DetectionArea:
@@ -33,8 +37,12 @@ class PatternConfig:
     tolerance: int = 50  # 色距離の許容値
     threshold_percent: int = 80  # 一致判定閾値 (%)
     hotkey: str = "numpad1"
+    split_transport: str = "hotkey"  # 送信方法 "hotkey"=ホットキー / "livesplit_server"=LiveSplit Server
     enabled: bool = True
     areas: list[DetectionArea] = field(default_factory=list)  # 検知エリアリスト
+    match_mode: str = "mean"  # "mean"=エリアの平均色で判定 / "pixel"=許容値内の画素の割合で判定
+    extra_colors: list[str] = field(default_factory=list)  # "pixel"時: color 以外にも一致とみなす色
+    pixel_match_percent: int = 60  # "pixel"時: エリアの何%の画素が許容値内なら一致とするか
 
     def __post_init__(self):
         # dictからDetectionAreaに変換
@@ -58,18 +66,51 @@ class AppConfig:
     target_window: Optional[str] = None  # None = フルスクリーン
     cooldown_ms: int = 2000  # 連続発火防止 (ミリ秒)
     check_interval_ms: int = 50  # 監視間隔 (約20fps)
+    scheduler_spin_ms: float = 0.0  # 締め切り直前この時間はsleepせずに待つ (CPUを使う代わりに周期が正確になる)
     area_size: int = 50  # エリアサイズ (px)
+    detection_engine: str = "integral"  # "integral"=一括計算 / "area"=エリアごとに計算
+    fast_evaluation: bool = True  # "area"時: 結果が確定したら残りのエリアを省略
+    area_sampling_step: int = 1  # エリアの平均色を何画素おきに取るか (1=全画素)
+    area_sampling_pattern: str = "grid"  # 間引き方 "grid"=格子 / "jitter"=格子のマスの中で固定パターンでずらす
+    area_sampling_margin: float = 6.0  # 間引き時: 色距離が許容値からこれ以内のエリアは全画素で求め直す
+    area_sampling_audit_frames: int = 30  # 間引き時: このフレームおきに全画素の平均色と比べてずれを記録 (0=しない)
+    roi_capture_mode: str = "cluster"  # "off"=全体 / "bbox"=外接矩形 / "cluster"=エリアごとの矩形
+    frame_ring_size: int = 3  # キャプチャ→検知間のフレームバッファ数
+    frame_drop_policy: str = "drop_oldest"  # バッファが埋まったとき "drop_oldest" / "drop_newest"
+    ui_refresh_hz: int = 10  # 一致率表示の更新頻度 (0=毎フレーム)
+    
+    # キャプチャバックエンド設定
+    capture_backend: str = "win32"  # "win32"=画面キャプチャ / "replay"=録画ファイル再生
+    replay_source: str = ""  # replay用: PNGフォルダ or 複数フレーム画像ファイル
+    replay_rate: float = 1.0  # replay用: 再生速度 (1.0=等速, 0=待たずに最速)
+    replay_loop: bool = False  # replay用: 最後まで再生したら先頭に戻る
     
     # ロギング設定
     csv_logging_enabled: bool = True  # CSV記録を有効化
     csv_logging_path: str = ""  # CSV保存先パス (空文字=デフォルト)
     min_duration_ms: int = 140  # 誤検知無視時間 (これ以上検知して初めてロードとみなす)
+    load_boundary_mode: str = "frame"  # ロード境界の時刻 "frame"=切り替わったフレーム / "midpoint"=前後フレームの中間
+    
+    # ROI録画設定 (誤検知の調査用)
+    recording_enabled: bool = False  # 検知エリア周辺を録画する
+    recording_path: str = ""  # 保存先フォルダ (空文字=アプリフォルダ/recordings)
+    recording_max_mb: int = 512  # 1セッションの上限 (MB)
+    recording_compression: bool = False  # zlibで圧縮する (CPUを使う代わりに小さくなる)
+    
+    # フライトレコーダー設定 (直近の判定結果をメモリに持っておき、必要なときだけ保存する)
+    flight_recorder_enabled: bool = True
+    flight_recorder_seconds: int = 60  # 保持する秒数
+    flight_recorder_thumbnails: bool = False  # 検知エリアごとの平均色も保持する
+    flight_recorder_path: str = ""  # 保存先フォルダ (空文字=アプリフォルダ/flight)
     
     # LiveSplit監視設定
+    timer_source: str = "capture"  # タイマー状態の取得元 "capture"=画面キャプチャ / "livesplit_server"=LiveSplit Server
     livesplit_window: Optional[str] = None
     timer_area: TimerArea = field(default_factory=TimerArea)
     timer_freeze_ms: int = 1000  # タイマー停止判定時間 (ms)
     auto_stop_enabled: bool = False  # 自動停止機能を有効化
+    livesplit_server_host: str = "localhost"  # LiveSplit Server の接続先
+    livesplit_server_port: int = 16834
     min_hotkey_count: int = 3  # 自動停止前の最低ホットキー送信回数
 
     def __post_init__(self):
@@ -79,6 +120,17 @@ class AppConfig:
         # dictからTimerAreaに変換
         if isinstance(self.timer_area, dict):
             self.timer_area = TimerArea(**self.timer_area)
+        # 設定リビジョン (保存対象外。検知プランのキャッシュ判定に使う)
+        self._revision = next(_revision_counter)
+
+    @property
+    def revision(self) -> int:
+        """設定リビジョン (bump_revision() のたびに変わる)"""
+        return self._revision
+
+    def bump_revision(self) -> None:
+        """設定を変更したことを知らせる (キャッシュを無効化する)"""
+        self._revision = next(_revision_counter)
 
 
 def get_default_config() -> AppConfig:
@@ -121,10 +173,11 @@ def load_config() -> AppConfig:
     return get_default_config()
 
 
-def save_config(config: AppConfig) -> None:
-    """設定をファイルに保存"""
+def save_config(config: AppConfig, path: Optional[Path] = None) -> None:
+    """設定をファイルに保存 (path 省略時は config.json)"""
+    config.bump_revision()
     data = asdict(config)
-    with open(CONFIG_FILE, "w", encoding="utf-8") as f:
+    with open(path or CONFIG_FILE, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
 
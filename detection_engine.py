@@ -0,0 +1,567 @@
+"""
+AutoSplit GIEEE - ベクトル化検知エンジン
+ROIの累積和テーブル (summed-area table) から全パターン・全エリアの平均色を一括で求める
+
+画素ごとに判定するパターン (match_mode="pixel") は、色の表 (color_lut) を1回引いて
+パターンごとのビットを作り、その累積和テーブルからエリアごとの一致画素数を求める。
+"""
+import math
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+
+from area_sampling import AreaSampler, sample_offsets
+from color_lut import cached_color_lut, combine_luts, lut_indices
+from config import PatternConfig, hex_to_rgb
+from detector import DetectionResult, empty_result, pick_results
+from frame import Frame, order_color
+from roi import RoiRect, SparseFrame, area_pixel_box, merge_rects
+
+
+# ターゲット色の彩度 (灰色からの距離) がこれ以下のパターンは、まず明るさだけで判定する
+NEUTRAL_CHROMA = 16.0
+
+
+def summed_area_table(pixels: np.ndarray) -> np.ndarray:
+    """
+    (H, W, C) の画素から (H+1, W+1, 3) の累積和テーブルを作る
+
+    sat[y, x] は pixels[:y, :x] の合計 (先頭の行/列は0)。
+    """
+    height, width = pixels.shape[:2]
+    # 255 * 画素数 が int32 に収まるなら int32 で計算 (速い)
+    dtype = np.int32 if height * width * 255 < 2 ** 31 else np.int64
+    sat = np.zeros((height + 1, width + 1, 3), dtype=dtype)
+    np.cumsum(pixels[:, :, :3], axis=0, dtype=dtype, out=sat[1:, 1:])
+    np.cumsum(sat[1:, 1:], axis=1, out=sat[1:, 1:])
+    return sat
+
+
+def box_means(sat: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """
+    累積和テーブルから複数の矩形の平均色を求める
+
+    Args:
+        sat: summed_area_table() の結果
+        boxes: (N, 4) の (left, top, right, bottom) ※テーブル座標
+
+    Returns:
+        (N, 3) の平均色 (四捨五入した整数)
+    """
+    left, top, right, bottom = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    sums = (sat[bottom, right] - sat[top, right] - sat[bottom, left] + sat[top, left]).astype(np.int64)
+    counts = ((right - left) * (bottom - top))[:, None]
+    # PILのBOX縮小と同じく四捨五入: floor(sum / n + 0.5)
+    return (sums * 2 + counts) // (counts * 2)
+
+
+@lru_cache(maxsize=8)
+def _cluster_rects(boxes: tuple[tuple[int, int, int, int], ...]) -> list[RoiRect]:
+    """エリアをまとめた矩形 (同じエリア構成なら使い回す)"""
+    return merge_rects(sorted({RoiRect(*box) for box in boxes}, key=lambda r: (r.top, r.left)))
+
+
+def frame_regions(frame, boxes: list[tuple[int, int, int, int]]) -> list[tuple[RoiRect, Frame]]:
+    """エリアを含む領域の一覧 (SparseFrameならその領域、Frameならエリア周辺を切り出したビュー)"""
+    if isinstance(frame, SparseFrame):
+        return frame.regions
+    # 全体フレームでもテーブルを作るのはエリア周辺だけにする
+    rects = _cluster_rects(boxes)
+    return [(rect, frame.crop((rect.left, rect.top, rect.right, rect.bottom))) for rect in rects]
+
+
+def compute_area_means(frame, boxes: tuple[tuple[int, int, int, int], ...]) -> np.ndarray:
+    """
+    エリア (フレーム座標) ごとの平均色を一括で求める
+
+    Args:
+        frame: Frame / SparseFrame
+        boxes: (left, top, right, bottom) のタプル
+
+    Returns:
+        (N, 3) の平均色 (フレームのチャンネル順)
+    """
+    means = np.zeros((len(boxes), 3), dtype=np.int64)
+    if not boxes:
+        return means
+
+    regions = frame_regions(frame, boxes)
+    rects = tuple(rect for rect, _ in regions)
+
+    for r, indices, local in _assign_boxes(boxes, rects):
+        sat = summed_area_table(regions[r][1].pixels)
+        means[indices] = box_means(sat, local)
+
+    return means
+
+
+def compute_sampled_area_means(frame, boxes: tuple[tuple[int, int, int, int], ...],
+                               sampler: AreaSampler) -> np.ndarray:
+    """
+    エリアごとの平均色を間引いて一括で求める (compute_area_means の近似)
+
+    累積和テーブルは作らず、領域ごとに間引いた点だけをまとめて取り出して合計する。
+
+    Returns:
+        (N, 3) の平均色 (フレームのチャンネル順)
+    """
+    means = np.zeros((len(boxes), 3), dtype=np.int64)
+    if not boxes:
+        return means
+
+    regions = frame_regions(frame, boxes)
+    rects = tuple(rect for rect, _ in regions)
+
+    for r, indices, ys, xs, starts, counts in _sample_points(boxes, rects, sampler.step, sampler.pattern):
+        sums = np.add.reduceat(regions[r][1].pixels[ys, xs, :3], starts, axis=0, dtype=np.int64)
+        means[indices] = (sums * 2 + counts) // (counts * 2)
+
+    sampler.stats.sampled_areas += len(boxes)
+    return means
+
+
+@lru_cache(maxsize=8)
+def _sample_points(boxes: tuple[tuple[int, int, int, int], ...], rects: tuple[RoiRect, ...],
+                   step: int, pattern: str) -> list[tuple]:
+    """
+    間引いた点を領域ごとにまとめる (同じ構成なら使い回す)
+
+    Returns:
+        [(領域番号, エリア番号の配列, 領域内の y, x, エリアごとの先頭位置, エリアごとの点の数 (N, 1)), ...]
+    """
+    groups = []
+    for r, indices, local in _assign_boxes(boxes, rects):
+        ys_list, xs_list, counts = [], [], []
+        for left, top, right, bottom in local:
+            ys, xs = sample_offsets(int(right - left), int(bottom - top), step, pattern)
+            ys_list.append(ys + top)
+            xs_list.append(xs + left)
+            counts.append(len(ys))
+        counts = np.array(counts, dtype=np.int64)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.intp)
+        groups.append((r, indices, np.concatenate(ys_list), np.concatenate(xs_list), starts, counts[:, None]))
+    return groups
+
+
+def plane_sat(plane: np.ndarray, max_value: int = 255) -> np.ndarray:
+    """(H, W) の1チャンネル (値は max_value 以下) から (H+1, W+1) の累積和テーブルを作る"""
+    height, width = plane.shape
+    dtype = np.int32 if height * width * max_value < 2 ** 31 else np.int64
+    sat = np.zeros((height + 1, width + 1), dtype=dtype)
+    np.cumsum(plane, axis=0, dtype=dtype, out=sat[1:, 1:])
+    np.cumsum(sat[1:, 1:], axis=1, out=sat[1:, 1:])
+    return sat
+
+
+def compute_area_brightness_sums(frame, boxes: tuple[tuple[int, int, int, int], ...]) -> np.ndarray:
+    """
+    エリアごとの R+G+B の合計を一括で求める
+
+    領域ごとに R+G+B の1チャンネル (uint16) を1回だけ作り、その累積和テーブルを使う。
+    3チャンネルのテーブルより計算もメモリも1/3で済む。
+
+    Returns:
+        (N,) の合計 (画素数で割ると3チャンネルの平均の和)
+    """
+    sums = np.zeros(len(boxes), dtype=np.int64)
+    if not boxes:
+        return sums
+
+    regions = frame_regions(frame, boxes)
+    rects = tuple(rect for rect, _ in regions)
+
+    for r, indices, local in _assign_boxes(boxes, rects):
+        pixels = regions[r][1].pixels
+        plane = pixels[:, :, 0].astype(np.uint16)
+        plane += pixels[:, :, 1]
+        plane += pixels[:, :, 2]
+        sat = plane_sat(plane, 255 * 3)
+        left, top, right, bottom = local[:, 0], local[:, 1], local[:, 2], local[:, 3]
+        sums[indices] = sat[bottom, right] - sat[top, right] - sat[bottom, left] + sat[top, left]
+
+    return sums
+
+
+def compute_pixel_hits(frame, boxes: tuple[tuple[int, int, int, int], ...], lut: np.ndarray,
+                       bit_count: int) -> np.ndarray:
+    """
+    エリアごと・ビットごとに、色の表でフラグの立った画素の数を一括で求める
+
+    領域ごとに色の表を1回だけ引き (全パターン分のビットが一度に取れる)、
+    ビットごとの累積和テーブルからエリアの合計を求める。
+
+    Args:
+        lut: combine_luts() の結果 (フレームのチャンネル順)
+        bit_count: 使っているビットの数
+
+    Returns:
+        (N, bit_count) の画素数
+    """
+    hits = np.zeros((len(boxes), bit_count), dtype=np.int64)
+    if not boxes:
+        return hits
+
+    regions = frame_regions(frame, boxes)
+    rects = tuple(rect for rect, _ in regions)
+
+    for r, indices, local in _assign_boxes(boxes, rects):
+        bits = lut[lut_indices(regions[r][1].pixels)]
+        left, top, right, bottom = local[:, 0], local[:, 1], local[:, 2], local[:, 3]
+        for bit in range(bit_count):
+            plane = (bits >> bit) & 1 if bit_count > 1 else bits
+            sat = plane_sat(plane, 1)
+            hits[indices, bit] = sat[bottom, right] - sat[top, right] - sat[bottom, left] + sat[top, left]
+
+    return hits
+
+
+@lru_cache(maxsize=8)
+def _assign_boxes(boxes: tuple[tuple[int, int, int, int], ...],
+                  rects: tuple[RoiRect, ...]) -> list[tuple[int, np.ndarray, np.ndarray]]:
+    """
+    エリアを領域ごとに振り分ける (同じ構成なら使い回す)
+
+    Returns:
+        [(領域番号, エリア番号の配列, 領域内座標の (N, 4) 配列), ...]
+    """
+    assigned: list[list[int]] = [[] for _ in rects]
+    for i, box in enumerate(boxes):
+        for r, rect in enumerate(rects):
+            if rect.contains(box):
+                assigned[r].append(i)
+                break
+        else:
+            raise ValueError(f"ROI外の領域です: {box}")
+
+    groups = []
+    for r, (rect, indices) in enumerate(zip(rects, assigned)):
+        if not indices:
+            continue
+        local = np.array([boxes[i] for i in indices], dtype=np.intp)
+        local -= np.array([rect.left, rect.top, rect.left, rect.top], dtype=np.intp)
+        groups.append((r, np.array(indices, dtype=np.intp), local))
+    return groups
+
+
+@dataclass(frozen=True)
+class DetectionPlan:
+    """
+    検知プラン: パターン設定をフレームサイズに合わせて事前計算したもの
+
+    毎フレームの処理では色文字列のパースや座標変換を行わず、
+    ここに用意した配列だけを使って判定する。
+    """
+    frame_size: tuple[int, int]
+    channel_order: str
+    patterns: tuple[PatternConfig, ...]
+    boxes: tuple[tuple[int, int, int, int], ...]  # 重複なしのエリア矩形 (ピクセル)
+    pattern_ids: np.ndarray  # (E,) 各エントリのパターン番号
+    box_ids: np.ndarray  # (E,) 各エントリのエリア矩形番号
+    targets: np.ndarray  # (P, 3) ターゲット色 (フレームのチャンネル順)
+    tolerances_sq: np.ndarray  # (P,) 許容値の2乗
+    totals: np.ndarray  # (P,) エリア数 (無効パターンは0)
+    threshold_counts: np.ndarray  # (P,) 検知に必要な一致エリア数
+    mean_boxes: tuple[tuple[int, int, int, int], ...]  # 平均色で判定するエリア
+    mean_box_ids: np.ndarray  # (M,) その boxes 内の番号
+    # 明るさで先に判定するエリア (灰色に近いパターンだけが使うエリア)
+    rgb_boxes: tuple[tuple[int, int, int, int], ...]  # 最初から平均色を求めるエリア
+    rgb_box_ids: np.ndarray  # (N-L,) その boxes 内の番号
+    brightness_boxes: tuple[tuple[int, int, int, int], ...]  # 明るさで先に判定するエリア
+    brightness_box_ids: np.ndarray  # (L,) その boxes 内の番号
+    brightness_entries: np.ndarray  # (El,) 明るさで先に判定するエントリの番号
+    brightness_entry_boxes: np.ndarray  # (El,) 各エントリの brightness_box_ids 内の番号
+    brightness_targets: np.ndarray  # (El,) ターゲット色の R+G+B
+    brightness_slack: np.ndarray  # (El,) 画素あたりの R+G+B の許容幅
+    brightness_pixels: np.ndarray  # (L,) エリアの画素数
+    # 画素ごとに判定するパターン (平均色のエントリには入らない)
+    pixel_boxes: tuple[tuple[int, int, int, int], ...]  # 画素ごとに判定するエリア
+    pixel_entry_patterns: np.ndarray  # (Ep,) 各エントリのパターン番号
+    pixel_entry_boxes: np.ndarray  # (Ep,) 各エントリの pixel_boxes 内の番号
+    pixel_entry_bits: np.ndarray  # (Ep,) 各エントリのパターンの色の表のビット
+    pixel_required: np.ndarray  # (Ep,) 一致とするのに必要な画素数
+    pixel_lut: Optional[np.ndarray]  # 全パターン分をまとめた色の表 (なければ None)
+    pixel_bit_count: int
+
+    def evaluate(self, frame, need_best: bool = True) -> tuple[Optional[DetectionResult], Optional[DetectionResult]]:
+        """
+        フレームを判定する
+
+        Args:
+            need_best: False ならベストマッチを求めず、検知パターンだけ結果を作る
+
+        Returns:
+            (検知パターン or None, ベストマッチ結果)
+        """
+        return self.results_from_counts(self.count_matches(frame), need_best)
+
+    def count_matches(self, frame, means: Optional[np.ndarray] = None,
+                      sampler: Optional[AreaSampler] = None) -> np.ndarray:
+        """
+        パターンごとの一致エリア数 (P,)
+
+        灰色に近いパターンのエリアは、まず R+G+B の1チャンネルで判定し、
+        許容値に入る可能性があるエリアが1つでもあるときだけ平均色を求める。
+        (ゲーム画面ではほとんど明るさだけで外れるので、3チャンネル分の計算を省ける)
+        判定結果は平均色だけで判定したときと同じ。
+
+        Args:
+            means: compute_area_means(frame, self.boxes) を求め済みなら渡す (使い回す)
+            sampler: 平均色を間引いて求める場合の設定 (判定結果は全画素のときと同じにする)
+        """
+        if means is not None:
+            counts = self.count_matches_from_means(means)
+        elif sampler is not None:
+            counts = self._count_sampled_matches(frame, sampler)
+        else:
+            counts = self._count_mean_matches(frame)
+        if len(self.pixel_entry_patterns):
+            counts += self.count_pixel_matches(frame)
+        return counts
+
+    def count_pixel_matches(self, frame) -> np.ndarray:
+        """画素ごとに判定するパターンの一致エリア数 (P,)"""
+        hits = compute_pixel_hits(frame, self.pixel_boxes, self.pixel_lut, self.pixel_bit_count)
+        in_tolerance = hits[self.pixel_entry_boxes, self.pixel_entry_bits] >= self.pixel_required
+        return np.bincount(self.pixel_entry_patterns, weights=in_tolerance,
+                           minlength=len(self.patterns)).astype(np.int64)
+
+    def _count_sampled_matches(self, frame, sampler: AreaSampler) -> np.ndarray:
+        """
+        間引いた平均色で判定するパターンの一致エリア数 (P,)
+
+        ターゲット色との距離が許容値の境目から sampler.margin 以内のエリアだけ全画素で求め直す。
+        間引いた平均色のずれが margin 以下なら、判定は全画素のときと同じになる。
+        """
+        sampler.begin_frame()
+        means = np.zeros((len(self.boxes), 3), dtype=np.int64)
+        if len(self.mean_box_ids) == 0:
+            return self.count_matches_from_means(means)
+        sampled = compute_sampled_area_means(frame, self.mean_boxes, sampler)
+
+        if sampler.auditing:
+            # ときどき全画素の平均色と比べて、実際のずれを記録する (このフレームは全画素で判定)
+            full = compute_area_means(frame, self.mean_boxes)
+            sampler.record_deviation(sampled, full)
+            means[self.mean_box_ids] = full
+            return self.count_matches_from_means(means)
+
+        means[self.mean_box_ids] = sampled
+        diff = means[self.box_ids] - self.targets[self.pattern_ids]
+        distances = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+        tolerances = np.sqrt(self.tolerances_sq[self.pattern_ids])
+        uncertain = sampler.is_uncertain(distances, tolerances)
+        if uncertain.any():
+            refined = np.unique(self.box_ids[uncertain])
+            for b in refined:
+                means[b] = frame.area_mean(self.boxes[b])
+            sampler.stats.refined_areas += len(refined)
+        return self.count_matches_from_means(means)
+
+    def _count_mean_matches(self, frame) -> np.ndarray:
+        """平均色で判定するパターンの一致エリア数 (P,)"""
+        if len(self.rgb_box_ids) == len(self.boxes):
+            return self.count_matches_from_means(compute_area_means(frame, self.boxes))
+
+        # 画素ごとにしか判定しないエリアの平均色は求めない
+        means = np.zeros((len(self.boxes), 3), dtype=np.int64)
+        if len(self.rgb_box_ids):
+            means[self.rgb_box_ids] = compute_area_means(frame, self.rgb_boxes)
+        if len(self.brightness_box_ids) == 0:
+            return self.count_matches_from_means(means)
+
+        sums = compute_area_brightness_sums(frame, self.brightness_boxes)
+        pixels = self.brightness_pixels[self.brightness_entry_boxes]
+        possible = (np.abs(sums[self.brightness_entry_boxes] - self.brightness_targets * pixels)
+                    <= self.brightness_slack * pixels)
+        if not possible.any():
+            # 明るさだけで全部外れた -> 平均色は求めない
+            return self.count_matches_from_means(means, excluded=self.brightness_entries)
+
+        means[self.brightness_box_ids] = compute_area_means(frame, self.brightness_boxes)
+        return self.count_matches_from_means(means)
+
+    def count_matches_from_means(self, means: np.ndarray,
+                                 excluded: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        compute_area_means(frame, self.boxes) の結果からパターンごとの一致エリア数を求める
+        (平均色で判定するパターンの分だけ)
+
+        Args:
+            excluded: 一致しないことが分かっているエントリの番号 (平均色は見ない)
+        """
+        # 全パターン・全エリアの判定を一度に行う (平方距離で比較するので sqrt は不要)
+        diff = means[self.box_ids] - self.targets[self.pattern_ids]
+        in_tolerance = np.einsum("ij,ij->i", diff, diff) <= self.tolerances_sq[self.pattern_ids]
+        if excluded is not None:
+            in_tolerance[excluded] = False
+        return np.bincount(self.pattern_ids, weights=in_tolerance,
+                           minlength=len(self.patterns)).astype(np.int64)
+
+    def results_from_counts(self, matched_counts: np.ndarray,
+                            need_best: bool = True) -> tuple[Optional[DetectionResult], Optional[DetectionResult]]:
+        """count_matches() の結果から (検知パターン or None, ベストマッチ結果) を作る"""
+        detected_flags = (self.totals > 0) & (matched_counts >= self.threshold_counts)
+
+        if not need_best:
+            hits = np.flatnonzero(detected_flags)
+            if len(hits) == 0:
+                return (None, None)
+            result = self._result(int(hits[0]), matched_counts)
+            return (result, result)
+
+        return pick_results(self._result(p, matched_counts) for p in range(len(self.patterns)))
+
+    def _result(self, p: int, matched_counts: np.ndarray) -> DetectionResult:
+        """パターン p の DetectionResult を作る"""
+        pattern = self.patterns[p]
+        total = int(self.totals[p])
+        if total == 0:
+            return empty_result(pattern)
+        matched = int(matched_counts[p])
+        return DetectionResult(
+            detected=matched >= int(self.threshold_counts[p]),
+            pattern=pattern,
+            match_percent=matched / total * 100,
+            matched_areas=matched,
+            total_areas=total
+        )
+
+
+def compile_plan(patterns: list[PatternConfig], frame_size: tuple[int, int],
+                 area_size: int = 50, channel_order: str = "RGB") -> DetectionPlan:
+    """パターン設定から検知プランを作る"""
+    img_w, img_h = frame_size
+
+    # 全パターンのエリアを重複なしで集める
+    box_index: dict[tuple[int, int, int, int], int] = {}
+    pattern_ids: list[int] = []
+    box_ids: list[int] = []
+    totals: list[int] = []
+    # 画素ごとに判定するパターン
+    pixel_box_index: dict[tuple[int, int, int, int], int] = {}
+    pixel_patterns: list[int] = []
+    pixel_boxes: list[int] = []
+    pixel_bits: list[int] = []
+    pixel_required: list[int] = []
+    luts: list[np.ndarray] = []
+    for p, pattern in enumerate(patterns):
+        if not pattern.enabled or not pattern.areas:
+            totals.append(0)
+            continue
+        pixel_mode = pattern.match_mode == "pixel"
+        if pixel_mode:
+            colors = (pattern.color, *pattern.extra_colors)
+            luts.append(cached_color_lut(
+                tuple(order_color(hex_to_rgb(c), channel_order) for c in colors), pattern.tolerance
+            ))
+        for area in pattern.areas:
+            left, top, right, bottom = area_pixel_box(area.x, area.y, img_w, img_h, area_size)
+            box = (max(0, left), max(0, top), min(img_w, right), min(img_h, bottom))
+            # 画素ごとのパターンのエリアも boxes に入れる (ROIやフライトレコーダーの平均色で使う)
+            b = box_index.setdefault(box, len(box_index))
+            if pixel_mode:
+                pixel_patterns.append(p)
+                pixel_boxes.append(pixel_box_index.setdefault(box, len(pixel_box_index)))
+                pixel_bits.append(len(luts) - 1)
+                pixel_count = (box[2] - box[0]) * (box[3] - box[1])
+                pixel_required.append(max(1, (pattern.pixel_match_percent * pixel_count + 99) // 100))
+            else:
+                pattern_ids.append(p)
+                box_ids.append(b)
+        totals.append(len(pattern.areas))
+
+    targets = [order_color(hex_to_rgb(p.color), channel_order) for p in patterns]
+    totals_arr = np.array(totals, dtype=np.int64)
+    thresholds = np.array([p.threshold_percent for p in patterns], dtype=np.int64)
+    boxes = tuple(box_index)
+
+    # 灰色に近いパターンだけが使うエリアは、明るさで先に判定する
+    neutral = [is_neutral_color(hex_to_rgb(p.color)) for p in patterns]
+    chromatic_boxes = {b for p, b in zip(pattern_ids, box_ids) if not neutral[p]}
+    brightness_box_ids = sorted(set(box_ids) - chromatic_boxes)
+    local_index = {b: i for i, b in enumerate(brightness_box_ids)}
+    brightness_entries = [e for e, b in enumerate(box_ids) if b in local_index]
+    # 平均色が許容値内なら |Σ平均 - Σターゲット| <= √3 * 許容値。
+    # 平均色はチャンネルごとに丸めるので、丸め前の和では最大 1.5 ずれる
+    slack = [math.sqrt(3) * patterns[pattern_ids[e]].tolerance + 1.5 for e in brightness_entries]
+
+    return DetectionPlan(
+        frame_size=tuple(frame_size),
+        channel_order=channel_order,
+        patterns=tuple(patterns),
+        boxes=boxes,
+        pattern_ids=np.array(pattern_ids, dtype=np.intp),
+        box_ids=np.array(box_ids, dtype=np.intp),
+        targets=np.array(targets, dtype=np.int64).reshape(-1, 3),
+        tolerances_sq=np.array([p.tolerance ** 2 for p in patterns], dtype=np.int64),
+        totals=totals_arr,
+        # 一致率 >= 閾値% <=> 一致数 * 100 >= 閾値 * エリア数 (整数で判定)
+        threshold_counts=(thresholds * totals_arr + 99) // 100,
+        mean_boxes=tuple(boxes[b] for b in sorted(set(box_ids))),
+        mean_box_ids=np.array(sorted(set(box_ids)), dtype=np.intp),
+        rgb_boxes=tuple(boxes[b] for b in sorted(chromatic_boxes)),
+        rgb_box_ids=np.array(sorted(chromatic_boxes), dtype=np.intp),
+        brightness_boxes=tuple(boxes[b] for b in brightness_box_ids),
+        brightness_box_ids=np.array(brightness_box_ids, dtype=np.intp),
+        brightness_entries=np.array(brightness_entries, dtype=np.intp),
+        brightness_entry_boxes=np.array([local_index[box_ids[e]] for e in brightness_entries], dtype=np.intp),
+        brightness_targets=np.array([sum(targets[pattern_ids[e]]) for e in brightness_entries], dtype=np.int64),
+        brightness_slack=np.array(slack, dtype=np.float64),
+        brightness_pixels=np.array([(boxes[b][2] - boxes[b][0]) * (boxes[b][3] - boxes[b][1])
+                                    for b in brightness_box_ids], dtype=np.int64),
+        pixel_boxes=tuple(pixel_box_index),
+        pixel_entry_patterns=np.array(pixel_patterns, dtype=np.intp),
+        pixel_entry_boxes=np.array(pixel_boxes, dtype=np.intp),
+        pixel_entry_bits=np.array(pixel_bits, dtype=np.intp),
+        pixel_required=np.array(pixel_required, dtype=np.int64),
+        pixel_lut=combine_luts(luts) if luts else None,
+        pixel_bit_count=len(luts),
+    )
+
+
+def is_neutral_color(rgb: tuple[int, int, int]) -> bool:
+    """灰色に近い色か (明るさだけでほぼ判定できる色)"""
+    mean = sum(rgb) / 3
+    return math.sqrt(sum((c - mean) ** 2 for c in rgb)) <= NEUTRAL_CHROMA
+
+
+class PlanCache:
+    """
+    検知プランのキャッシュ
+
+    (フレーム幅, フレーム高さ, 設定リビジョン) が変わったときだけ作り直す。
+    """
+
+    def __init__(self):
+        self._key = None
+        self._plan: Optional[DetectionPlan] = None
+        self.compile_count = 0  # 作り直した回数
+
+    def get(self, config, frame_size: tuple[int, int], channel_order: str) -> DetectionPlan:
+        key = (frame_size[0], frame_size[1], config.revision, channel_order)
+        if key != self._key or self._plan is None:
+            self._plan = compile_plan(config.patterns, frame_size, config.area_size, channel_order)
+            self._key = key
+            self.compile_count += 1
+        return self._plan
+
+    def invalidate(self):
+        self._key = None
+        self._plan = None
+
+
+def detect_all_patterns_integral(frame, patterns: list[PatternConfig],
+                                 area_size: int = 50) -> tuple[Optional[DetectionResult], Optional[DetectionResult]]:
+    """
+    全パターンを一括で検査する (detect_all_patterns_frame と同じ結果)
+
+    同じ座標のエリアを持つパターンが複数あっても平均色の計算は1回だけ。
+    繰り返し呼ぶ場合は PlanCache でプランを使い回すこと。
+
+    Returns:
+        (検知パターン or None, ベストマッチ結果)
+    """
+    plan = compile_plan(patterns, frame.size, area_size, frame.channel_order)
+    return plan.evaluate(frame)
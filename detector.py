@@ -2,11 +2,16 @@
 AutoSplit GIEEE - 色検知ロジック (エリア方式)
 """
 import math
+import hashlib
+import numpy as np
 from PIL import Image
 from typing import Optional
 from dataclasses import dataclass
 
+from area_sampling import AreaSampler
+from color_lut import cached_color_lut, lut_indices
 from config import PatternConfig, DetectionArea, hex_to_rgb
+from roi import area_pixel_box, timer_pixel_box
 
 
 @dataclass
@@ -34,68 +39,175 @@ def calculate_color_distance(color1: tuple[int, int, int], color2: tuple[int, in
 
 
 def get_area_average_color(image: Image.Image, x_percent: int, y_percent: int, 
-                            area_size: int = 50) -> tuple[int, int, int]:
+                            area_size: int = 50,
+                            sampler: Optional[AreaSampler] = None) -> tuple[int, int, int]:
     """
     エリアの平均色を取得
     
     Args:
-        image: PIL Image
+        image: PIL Image (またはROIだけを持つ SparseFrame)
         x_percent, y_percent: エリアの位置 (0-100%)
         area_size: エリアサイズ (px)
+        sampler: 指定すると全画素ではなく間引いた点だけで平均する
     
     Returns:
         (R, G, B)
     """
-    # パーセントから実座標に変換
     img_w, img_h = image.size
-    x = int((x_percent / 100) * img_w)
-    y = int((y_percent / 100) * img_h)
+    x, y, right, bottom = area_pixel_box(x_percent, y_percent, img_w, img_h, area_size)
     
-    # エリアが画像範囲内に収まるようにクリップ
-    x = max(0, min(x, img_w - area_size))
-    y = max(0, min(y, img_h - area_size))
+    if sampler is not None:
+        return sampler.area_mean(image, (x, y, right, bottom))
     
     # 高速化: クロップして縮小することで平均色を取得
     # Image.Resampling.BOX は平均画素法に近い処理を行うため平均色取得に適している
-    crop = image.crop((x, y, x + area_size, y + area_size))
+    crop = image.crop((x, y, right, bottom))
     pixel = crop.resize((1, 1), Image.Resampling.BOX).getpixel((0, 0))
     return pixel
 
 
-def detect_pattern(image: Image.Image, pattern: PatternConfig, 
-                   area_size: int = 50) -> DetectionResult:
+def get_frame_area_average_color(frame, x_percent: int, y_percent: int,
+                                 area_size: int = 50,
+                                 sampler: Optional[AreaSampler] = None) -> tuple[int, int, int]:
     """
-    パターンの検知を行う (エリア方式)
+    エリアの平均色を取得 (Frame / SparseFrame 用)
     
+    Returns:
+        フレームのチャンネル順での平均色 (BGRフレームなら (B, G, R))
+    """
+    img_w, img_h = frame.size
+    box = area_pixel_box(x_percent, y_percent, img_w, img_h, area_size)
+    if sampler is not None:
+        return sampler.area_mean(frame, box)
+    return frame.area_mean(box)
+
+
+def pattern_color_lut(pattern: PatternConfig, order_color=None) -> np.ndarray:
+    """
+    画素ごとに判定するパターンの色の表 (color と extra_colors のどれかから許容値以内か)
+
     Args:
-        image: キャプチャ画像
-        pattern: 検知パターン設定
-        area_size: エリアサイズ (px)
+        order_color: RGBの色をフレームのチャンネル順にする関数 (省略時はRGBのまま)
+    """
+    colors = tuple(hex_to_rgb(c) for c in (pattern.color, *pattern.extra_colors))
+    if order_color is not None:
+        colors = tuple(order_color(c) for c in colors)
+    return cached_color_lut(colors, pattern.tolerance)
+
+
+def pixel_area_matches(pixels: np.ndarray, lut: np.ndarray, pattern: PatternConfig) -> bool:
+    """エリアの画素 (H, W, C) のうち、色の表で一致した画素が pixel_match_percent% 以上か"""
+    pixel_count = pixels.shape[0] * pixels.shape[1]
+    required = max(1, (pattern.pixel_match_percent * pixel_count + 99) // 100)
+    return int(np.count_nonzero(lut[lut_indices(pixels[:, :, :3])])) >= required
+
+
+def _clipped_area_box(size: tuple[int, int], area: DetectionArea,
+                      area_size: int) -> tuple[int, int, int, int]:
+    """画面からはみ出した分を削ったエリアの矩形 (検知エンジンと同じ)"""
+    img_w, img_h = size
+    left, top, right, bottom = area_pixel_box(area.x, area.y, img_w, img_h, area_size)
+    return (max(0, left), max(0, top), min(img_w, right), min(img_h, bottom))
+
+
+@dataclass
+class EvaluationStats:
+    """早期終了モードの統計 (何エリア分の計算を省略できたか)"""
+    frames: int = 0
+    sampled_areas: int = 0  # 平均色を計算したエリア数
+    skipped_areas: int = 0  # 結果が確定したため計算を省略したエリア数
+    last_frame_skipped: int = 0  # 直近フレームで省略したエリア数
+
+    def begin_frame(self):
+        self.frames += 1
+        self.last_frame_skipped = 0
+
+    def add(self, sampled: int, skipped: int):
+        self.sampled_areas += sampled
+        self.skipped_areas += skipped
+        self.last_frame_skipped += skipped
+
+
+class PatternHitTracker:
+    """
+    パターンごとの最近の検知率を覚えておき、検知されやすい順に並べる
     
-    Returns:
-        DetectionResult
+    検知率は指数移動平均 (decay が大きいほど過去を長く覚える)。
     """
-    if not pattern.enabled or not pattern.areas:
-        return DetectionResult(
-            detected=False,
-            pattern=pattern,
-            match_percent=0.0,
-            matched_areas=0,
-            total_areas=len(pattern.areas) if pattern.areas else 0
-        )
+
+    def __init__(self, decay: float = 0.9):
+        self.decay = decay
+        self._scores: list[float] = []
+
+    def order(self, patterns: list[PatternConfig]) -> list[int]:
+        """検査する順番 (パターンのインデックス) を返す"""
+        if len(self._scores) != len(patterns):
+            # パターン構成が変わったらリセット
+            self._scores = [0.0] * len(patterns)
+        # 同点なら設定順 (sorted は安定ソート)
+        return sorted(range(len(patterns)), key=lambda i: -self._scores[i])
+
+    def record(self, index: Optional[int]):
+        """フレームの検知結果を記録 (index = 検知パターン or None)"""
+        for i in range(len(self._scores)):
+            hit = 1.0 if i == index else 0.0
+            self._scores[i] = self._scores[i] * self.decay + hit * (1 - self.decay)
+
+
+def required_matches(pattern: PatternConfig) -> int:
+    """検知に必要な一致エリア数 (一致率 >= 閾値% を整数で判定)"""
+    total = len(pattern.areas)
+    return (pattern.threshold_percent * total + 99) // 100
+
+
+def _evaluate_pattern(pattern: PatternConfig, target_color: tuple[int, int, int],
+                      sample, early_exit: bool = False,
+                      stats: Optional[EvaluationStats] = None,
+                      sampler: Optional[AreaSampler] = None, exact=None,
+                      matches=None) -> DetectionResult:
+    """
+    sample(area) で取った平均色とターゲット色を比較して判定
     
-    target_color = hex_to_rgb(pattern.color)
+    early_exit=True の場合、閾値に届いた時点/もう届かないと分かった時点で打ち切る。
+    このとき match_percent / matched_areas は途中までの値になる。
+    sampler を指定した場合、sample(area) は間引いた平均色を返すので、
+    許容値の境目に近いエリアは exact(area) (全画素の平均色) で判定し直す。
+    matches(area) を指定した場合 (画素ごとに判定するパターン) は、平均色ではなくそれで判定する。
+    """
     matched = 0
+    total = len(pattern.areas)
+    needed = required_matches(pattern)
+    sampled = 0
     
-    for area in pattern.areas:
-        area_color = get_area_average_color(image, area.x, area.y, area_size)
+    for i, area in enumerate(pattern.areas):
+        if early_exit and (matched >= needed or matched + (total - i) < needed):
+            break
+        sampled += 1
+        if matches is not None:
+            if matches(area):
+                matched += 1
+            continue
+        area_color = sample(area)
         distance = calculate_color_distance(area_color, target_color)
+        if sampler is not None:
+            if sampler.auditing:
+                full_color = exact(area)
+                sampler.record_deviation([area_color], [full_color])
+                distance = calculate_color_distance(full_color, target_color)
+            elif sampler.is_uncertain(distance, pattern.tolerance):
+                distance = calculate_color_distance(exact(area), target_color)
+                sampler.stats.refined_areas += 1
         if distance <= pattern.tolerance:
             matched += 1
     
-    total = len(pattern.areas)
+    if stats is not None:
+        stats.add(sampled, total - sampled)
+    
     match_percent = (matched / total * 100) if total > 0 else 0.0
-    detected = match_percent >= pattern.threshold_percent
+    if early_exit:
+        detected = matched >= needed
+    else:
+        detected = match_percent >= pattern.threshold_percent
     
     return DetectionResult(
         detected=detected,
@@ -106,21 +218,93 @@ def detect_pattern(image: Image.Image, pattern: PatternConfig,
     )
 
 
-def detect_all_patterns(image: Image.Image, 
-                        patterns: list[PatternConfig],
-                        area_size: int = 50) -> tuple[Optional[DetectionResult], Optional[DetectionResult]]:
+def empty_result(pattern: PatternConfig) -> DetectionResult:
+    """無効/エリアなしパターンの結果"""
+    return DetectionResult(
+        detected=False,
+        pattern=pattern,
+        match_percent=0.0,
+        matched_areas=0,
+        total_areas=len(pattern.areas) if pattern.areas else 0
+    )
+
+
+def detect_pattern(image: Image.Image, pattern: PatternConfig, 
+                   area_size: int = 50, early_exit: bool = False,
+                   stats: Optional[EvaluationStats] = None,
+                   sampler: Optional[AreaSampler] = None) -> DetectionResult:
     """
-    全パターンを検査し、結果を返す
+    パターンの検知を行う (エリア方式)
+    
+    Args:
+        image: キャプチャ画像
+        pattern: 検知パターン設定
+        area_size: エリアサイズ (px)
+        early_exit: 結果が確定した時点で残りのエリアを省略する
+        stats: 省略したエリア数の記録先
+        sampler: 平均色を間引いて求める場合の設定
     
     Returns:
-        (検知パターン or None, ベストマッチ結果)
+        DetectionResult
     """
+    if not pattern.enabled or not pattern.areas:
+        return empty_result(pattern)
+    
+    if pattern.match_mode == "pixel":
+        lut = pattern_color_lut(pattern)
+        return _evaluate_pattern(
+            pattern, None, None, early_exit, stats,
+            matches=lambda area: pixel_area_matches(
+                np.asarray(image.crop(_clipped_area_box(image.size, area, area_size)).convert("RGB")),
+                lut, pattern
+            )
+        )
+    
+    target_color = hex_to_rgb(pattern.color)
+    return _evaluate_pattern(
+        pattern, target_color,
+        lambda area: get_area_average_color(image, area.x, area.y, area_size, sampler),
+        early_exit, stats, sampler,
+        lambda area: get_area_average_color(image, area.x, area.y, area_size)
+    )
+
+
+def detect_pattern_frame(frame, pattern: PatternConfig,
+                         area_size: int = 50, early_exit: bool = False,
+                         stats: Optional[EvaluationStats] = None,
+                         sampler: Optional[AreaSampler] = None) -> DetectionResult:
+    """
+    パターンの検知を行う (Frame / SparseFrame 用)
+    
+    フレームのピクセルは並べ替えず、ターゲット色の方をフレームのチャンネル順に合わせる。
+    """
+    if not pattern.enabled or not pattern.areas:
+        return empty_result(pattern)
+    
+    if pattern.match_mode == "pixel":
+        lut = pattern_color_lut(pattern, frame.order_color)
+        return _evaluate_pattern(
+            pattern, None, None, early_exit, stats,
+            matches=lambda area: pixel_area_matches(
+                frame.crop(_clipped_area_box(frame.size, area, area_size)).pixels, lut, pattern
+            )
+        )
+    
+    target_color = frame.order_color(hex_to_rgb(pattern.color))
+    return _evaluate_pattern(
+        pattern, target_color,
+        lambda area: get_frame_area_average_color(frame, area.x, area.y, area_size, sampler),
+        early_exit, stats, sampler,
+        lambda area: get_frame_area_average_color(frame, area.x, area.y, area_size)
+    )
+
+
+def pick_results(results) -> tuple[Optional[DetectionResult], Optional[DetectionResult]]:
+    """(検知パターン or None, ベストマッチ結果) を選ぶ"""
     best_result = None
     detected_result = None
     
-    for pattern in patterns:
-        result = detect_pattern(image, pattern, area_size)
-        
+    for result in results:
         # ベストマッチを更新 (一致率が高いもの)
         if best_result is None or result.match_percent > best_result.match_percent:
             best_result = result
@@ -132,6 +316,110 @@ def detect_all_patterns(image: Image.Image,
     return (detected_result, best_result)
 
 
+def _detect_all(patterns: list[PatternConfig], detect_one, fast: bool, need_best: bool,
+                tracker: Optional[PatternHitTracker],
+                stats: Optional[EvaluationStats],
+                sampler: Optional[AreaSampler] = None,
+                results_out: Optional[list] = None) -> tuple[Optional[DetectionResult], Optional[DetectionResult]]:
+    """detect_all_patterns / detect_all_patterns_frame の共通処理"""
+    if stats is not None:
+        stats.begin_frame()
+    if sampler is not None:
+        sampler.begin_frame()
+    if results_out is not None:
+        results_out[:] = [None] * len(patterns)
+    
+    if not fast:
+        all_results = [detect_one(pattern, False, stats) for pattern in patterns]
+        if results_out is not None:
+            results_out[:] = all_results
+        return pick_results(all_results)
+    
+    order = tracker.order(patterns) if tracker is not None else list(range(len(patterns)))
+    
+    detected_index = None
+    if need_best:
+        # ベストマッチが必要なので全エリアを計算する (検査順だけ入れ替え)
+        results = {i: detect_one(patterns[i], False, stats) for i in order}
+        detected, best = pick_results(results[i] for i in order)
+        detected_index = next((i for i in order if results[i].detected), None)
+        if results_out is not None:
+            for i, result in results.items():
+                results_out[i] = result
+    else:
+        # 最初に検知したパターンで打ち切る (ベストマッチ = 検知パターン)
+        detected = None
+        for n, i in enumerate(order):
+            result = detect_one(patterns[i], True, stats)
+            if result.detected:
+                detected = result
+                detected_index = i
+                if stats is not None:
+                    skipped = sum(len(patterns[j].areas) for j in order[n + 1:]
+                                  if patterns[j].enabled and patterns[j].areas)
+                    stats.add(0, skipped)
+                break
+        best = detected
+    
+    if tracker is not None:
+        tracker.record(detected_index)
+    return (detected, best)
+
+
+def detect_all_patterns(image: Image.Image, 
+                        patterns: list[PatternConfig],
+                        area_size: int = 50,
+                        fast: bool = False,
+                        need_best: bool = True,
+                        tracker: Optional[PatternHitTracker] = None,
+                        stats: Optional[EvaluationStats] = None,
+                        sampler: Optional[AreaSampler] = None,
+                        results_out: Optional[list] = None) -> tuple[Optional[DetectionResult], Optional[DetectionResult]]:
+    """
+    全パターンを検査し、結果を返す
+    
+    Args:
+        fast: 結果が確定した時点で打ち切る早期終了モード
+        need_best: False ならベストマッチを求めない (fast時のみ有効、UIが見ていないとき用)
+        tracker: fast時に検知されやすい順に検査するための履歴
+        stats: 省略したエリア数の記録先
+        sampler: 平均色を間引いて求める場合の設定 (判定結果は全画素のときと同じにする)
+        results_out: 渡すとパターンごとの結果を patterns の順に入れる
+                     (早期終了で途中までしか数えなかったパターンは None)
+    
+    Returns:
+        (検知パターン or None, ベストマッチ結果)
+    """
+    return _detect_all(
+        patterns,
+        lambda pattern, early_exit, st: detect_pattern(image, pattern, area_size, early_exit, st, sampler),
+        fast, need_best, tracker, stats, sampler, results_out
+    )
+
+
+def detect_all_patterns_frame(frame, patterns: list[PatternConfig],
+                              area_size: int = 50,
+                              fast: bool = False,
+                              need_best: bool = True,
+                              tracker: Optional[PatternHitTracker] = None,
+                              stats: Optional[EvaluationStats] = None,
+                              sampler: Optional[AreaSampler] = None,
+                              results_out: Optional[list] = None) -> tuple[Optional[DetectionResult], Optional[DetectionResult]]:
+    """
+    全パターンを検査し、結果を返す (Frame / SparseFrame 用)
+    
+    引数は detect_all_patterns と同じ。
+    
+    Returns:
+        (検知パターン or None, ベストマッチ結果)
+    """
+    return _detect_all(
+        patterns,
+        lambda pattern, early_exit, st: detect_pattern_frame(frame, pattern, area_size, early_exit, st, sampler),
+        fast, need_best, tracker, stats, sampler, results_out
+    )
+
+
 def extract_dominant_color(image: Image.Image) -> tuple[int, int, int]:
     """
     画像から支配的な色を抽出（スポイト機能用）
@@ -163,19 +451,43 @@ def crop_timer_area(image: Image.Image, x_percent: int, y_percent: int,
         クロップした画像
     """
     img_w, img_h = image.size
+    box = timer_pixel_box(x_percent, y_percent, width_percent, height_percent, img_w, img_h)
+    return image.crop(box)
+
+
+# タイマー比較用の縮小サイズと、ピクセルを「同じ」とみなす色距離
+SIMILARITY_SIZE = (50, 20)
+SIMILARITY_DISTANCE = 30
+
+
+def downsample_for_similarity(image) -> np.ndarray:
+    """
+    比較用に SIMILARITY_SIZE へ縮小した (H, W, 3) の int16 配列を作る (最近傍法)
     
-    x = int(x_percent / 100 * img_w)
-    y = int(y_percent / 100 * img_h)
-    w = int(width_percent / 100 * img_w)
-    h = int(height_percent / 100 * img_h)
-    
-    # 範囲チェック
-    x = max(0, min(x, img_w - 1))
-    y = max(0, min(y, img_h - 1))
-    w = max(1, min(w, img_w - x))
-    h = max(1, min(h, img_h - y))
+    Args:
+        image: PIL Image または Frame
+    """
+    width, height = SIMILARITY_SIZE
+    if isinstance(image, Image.Image):
+        small = image.convert("RGB").resize(SIMILARITY_SIZE, Image.Resampling.NEAREST)
+        return np.asarray(small, dtype=np.int16)
     
-    return image.crop((x, y, x + w, y + h))
+    # Frame: 各出力画素の中心に最も近い画素を拾う
+    pixels = image.pixels
+    src_h, src_w = pixels.shape[:2]
+    ys = ((np.arange(height) + 0.5) * src_h / height).astype(np.intp)
+    xs = ((np.arange(width) + 0.5) * src_w / width).astype(np.intp)
+    return pixels[ys[:, None], xs[None, :], :3].astype(np.int16)
+
+
+def arrays_are_similar(small1: np.ndarray, small2: np.ndarray, threshold: float = 0.99) -> bool:
+    """downsample_for_similarity() の結果同士を比較"""
+    if small1.shape != small2.shape:
+        return False
+    diff = small1 - small2
+    distances_sq = np.einsum("ijk,ijk->ij", diff, diff, dtype=np.int32)
+    matching = np.count_nonzero(distances_sq < SIMILARITY_DISTANCE ** 2)
+    return matching / distances_sq.size >= threshold
 
 
 def images_are_similar(img1: Image.Image, img2: Image.Image, threshold: float = 0.99) -> bool:
@@ -192,27 +504,62 @@ def images_are_similar(img1: Image.Image, img2: Image.Image, threshold: float =
     if img1.size != img2.size:
         return False
     
-    # 小さくリサイズして比較（高速化）
-    size = (50, 20)
-    img1_small = img1.resize(size, Image.Resampling.NEAREST)
-    img2_small = img2.resize(size, Image.Resampling.NEAREST)
-    
-    # ピクセル比較
-    pixels1 = list(img1_small.getdata())
-    pixels2 = list(img2_small.getdata())
-    
-    if len(pixels1) != len(pixels2):
-        return False
-    
-    matching = 0
-    total = len(pixels1)
-    
-    for p1, p2 in zip(pixels1, pixels2):
-        # RGB距離
-        dist = math.sqrt((p1[0]-p2[0])**2 + (p1[1]-p2[1])**2 + (p1[2]-p2[2])**2)
-        if dist < 30:  # 許容誤差
-            matching += 1
+    # 小さくリサイズしてまとめて比較（高速化）
+    return arrays_are_similar(downsample_for_similarity(img1),
+                              downsample_for_similarity(img2), threshold)
+
+
+def _content_digest(image) -> bytes:
+    """画像の中身のハッシュ (完全一致の判定用)"""
+    if isinstance(image, Image.Image):
+        data = image.tobytes()
+    else:
+        data = np.ascontiguousarray(image.pixels).data
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class TimerFreezeComparator:
+    """
+    タイマー画像を前回と比べ続けるためのクラス
     
-    similarity = matching / total
-    return similarity >= threshold
+    前回の画像は縮小済みの配列とハッシュだけを持っておき、
+    バイト列が完全に同じなら縮小・比較自体を省略する。
+    """
+
+    def __init__(self, threshold: float = 0.99):
+        self.threshold = threshold
+        self._last_size = None
+        self._last_digest: Optional[bytes] = None
+        self._last_small: Optional[np.ndarray] = None
+        self.hash_hits = 0  # ハッシュ一致で比較を省略した回数
 
+    def reset(self):
+        self._last_size = None
+        self._last_digest = None
+        self._last_small = None
+
+    def update(self, image) -> Optional[bool]:
+        """
+        新しい画像を渡して前回と比較
+        
+        Returns:
+            前回と類似していればTrue (初回はNone)
+        """
+        size = image.size
+        digest = _content_digest(image)
+        
+        if self._last_digest is None or size != self._last_size:
+            similar = None
+            self._last_small = downsample_for_similarity(image)
+        elif digest == self._last_digest:
+            # 全く同じ画像 -> 比較するまでもなく類似
+            similar = True
+            self.hash_hits += 1
+        else:
+            small = downsample_for_similarity(image)
+            similar = arrays_are_similar(self._last_small, small, self.threshold)
+            self._last_small = small
+        
+        self._last_size = size
+        self._last_digest = digest
+        return similar
@@ -0,0 +1,185 @@
+"""
+AutoSplit GIEEE - フライトレコーダー
+直近N秒の判定結果を固定サイズのリングバッファに記録し続け、必要なときにファイルへ書き出す
+"""
+import csv
+import datetime
+import math
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+
+# 記録する処理時間の段階
+STAGES = ("capture", "queue", "detect", "state")
+
+# load_state の STATE_* に対応する表示名
+STATE_NAMES = ("idle", "pending", "loading")
+
+# 一致エリア数が分からない (早期終了で途中までしか数えていない) パターンの記録値
+UNAVAILABLE = -1
+
+
+class FlightRecorder:
+    """
+    直近 capacity フレーム分のテレメトリを持つリングバッファ
+
+    配列は最初にすべて確保し、record() は既存の配列に書き込むだけ (新しい配列を作らない)。
+    何時間動かしてもメモリ使用量は変わらない。
+
+    記録するもの:
+        - キャプチャ時刻
+        - パターンごとの一致エリア数・エリア数・一致率 (分からなければ一致エリア数は UNAVAILABLE、一致率は NaN)
+        - ロード状態 (load_state.STATE_*)
+        - 段階ごとの処理時間 (STAGES)
+        - 検知エリアごとの平均色 (thumbnails=True のとき。1エリア1ピクセルの縮小画像)
+    """
+
+    def __init__(self, capacity: int, pattern_names: list[str],
+                 max_areas: int = 0, thumbnails: bool = False):
+        if capacity < 1:
+            raise ValueError("capacity は1以上にしてください")
+        self.capacity = capacity
+        self.pattern_names = list(pattern_names)
+        pattern_count = len(self.pattern_names)
+
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.matched = np.zeros((capacity, pattern_count), dtype=np.int32)
+        self.totals = np.zeros((capacity, pattern_count), dtype=np.int32)
+        self.match_percent = np.zeros((capacity, pattern_count), dtype=np.float32)
+        self.states = np.zeros(capacity, dtype=np.uint8)
+        self.stage_ms = np.zeros((capacity, len(STAGES)), dtype=np.float32)
+        self._has_areas = np.zeros(pattern_count, dtype=bool)  # record() の作業用
+        self._unavailable = np.zeros(pattern_count, dtype=bool)
+        self.thumbnails: Optional[np.ndarray] = None
+        if thumbnails and max_areas > 0:
+            self.thumbnails = np.zeros((capacity, max_areas, 3), dtype=np.uint8)
+
+        self._next = 0  # 次に書き込む位置
+        self.count = 0  # 記録した総フレーム数
+
+    @classmethod
+    def for_duration(cls, seconds: float, interval_ms: float, pattern_names: list[str],
+                     max_areas: int = 0, thumbnails: bool = False) -> "FlightRecorder":
+        """seconds 秒分 (監視間隔 interval_ms) の容量で作る"""
+        capacity = max(1, math.ceil(seconds * 1000 / max(interval_ms, 1)))
+        return cls(capacity, pattern_names, max_areas, thumbnails)
+
+    @property
+    def byte_count(self) -> int:
+        """確保している配列のバイト数"""
+        arrays = [self.timestamps, self.matched, self.totals, self.match_percent,
+                  self.states, self.stage_ms]
+        if self.thumbnails is not None:
+            arrays.append(self.thumbnails)
+        return sum(a.nbytes for a in arrays)
+
+    def record(self, timestamp: float, state: int, stage_ms,
+               matched: Optional[np.ndarray] = None, totals: Optional[np.ndarray] = None,
+               area_means: Optional[np.ndarray] = None):
+        """
+        1フレーム分を書き込む
+
+        Args:
+            timestamp: キャプチャ時刻
+            state: ロード状態
+            stage_ms: STAGES 順の処理時間 (ms) の配列
+            matched / totals: パターンごとの一致エリア数とエリア数 (なければ0として記録。
+                              一致エリア数が UNAVAILABLE のパターンは一致率を NaN にする)
+            area_means: 検知エリアごとの平均色 (N, 3)
+        """
+        i = self._next
+        self.timestamps[i] = timestamp
+        self.states[i] = state
+        self.stage_ms[i] = stage_ms
+
+        row_matched = self.matched[i]
+        row_totals = self.totals[i]
+        if matched is not None and totals is not None:
+            n = min(len(row_matched), len(matched))
+            row_matched[:n] = matched[:n]
+            row_totals[:n] = totals[:n]
+            row_matched[n:] = 0
+            row_totals[n:] = 0
+        else:
+            row_matched[:] = 0
+            row_totals[:] = 0
+        # 一致率 = 一致数 / エリア数 * 100 (エリア数0のパターンは0%)
+        row_percent = self.match_percent[i]
+        row_percent[:] = 0
+        np.greater(row_totals, 0, out=self._has_areas)
+        np.less(row_matched, 0, out=self._unavailable)
+        np.copyto(self._has_areas, False, where=self._unavailable)
+        np.divide(row_matched, row_totals, out=row_percent, where=self._has_areas)
+        row_percent *= 100
+        np.copyto(row_percent, np.nan, where=self._unavailable)
+
+        if self.thumbnails is not None and area_means is not None:
+            n = min(len(self.thumbnails[i]), len(area_means))
+            self.thumbnails[i, :n] = area_means[:n]
+
+        self._next = (i + 1) % self.capacity
+        self.count += 1
+
+    def _order(self) -> np.ndarray:
+        """記録済みの行を古い順に並べた番号"""
+        filled = min(self.count, self.capacity)
+        start = self._next if self.count >= self.capacity else 0
+        return (start + np.arange(filled)) % self.capacity
+
+    def snapshot(self) -> dict[str, np.ndarray]:
+        """記録済みの内容を古い順に並べたコピー"""
+        order = self._order()
+        data = {
+            "timestamps": self.timestamps[order],
+            "matched": self.matched[order],
+            "totals": self.totals[order],
+            "match_percent": self.match_percent[order],
+            "states": self.states[order],
+            "stage_ms": self.stage_ms[order],
+        }
+        if self.thumbnails is not None:
+            data["thumbnails"] = self.thumbnails[order]
+        return data
+
+    def dump(self, folder) -> Path:
+        """
+        記録済みの内容をファイルに書き出す
+
+        CSV (人が見る用) と、縮小画像も含めた npz (解析用) を作る。
+
+        Returns:
+            CSVファイルのパス
+        """
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        stem = datetime.datetime.now().strftime("%Y%m%d_%H%M%S") + "_GIEEE_flight"
+        data = self.snapshot()
+
+        csv_path = folder / f"{stem}.csv"
+        with open(csv_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            header = ["Time", "State"]
+            for name in self.pattern_names:
+                header += [f"{name}_Match", f"{name}_Areas", f"{name}_Percent"]
+            header += [f"{stage}_ms" for stage in STAGES]
+            writer.writerow(header)
+
+            origin = data["timestamps"][0] if len(data["timestamps"]) else 0.0
+            for row in range(len(data["timestamps"])):
+                values = [f"{data['timestamps'][row] - origin:.4f}", STATE_NAMES[data["states"][row]]]
+                for p in range(len(self.pattern_names)):
+                    matched = int(data["matched"][row, p])
+                    if matched == UNAVAILABLE:
+                        # 途中で打ち切ったので数えていない
+                        values += ["", int(data["totals"][row, p]), ""]
+                    else:
+                        values += [matched, int(data["totals"][row, p]),
+                                   f"{data['match_percent'][row, p]:.1f}"]
+                values += [f"{v:.3f}" for v in data["stage_ms"][row]]
+                writer.writerow(values)
+
+        np.savez_compressed(folder / f"{stem}.npz",
+                            pattern_names=np.array(self.pattern_names), stages=np.array(STAGES), **data)
+        return csv_path
@@ -0,0 +1,93 @@
+"""
+AutoSplit GIEEE - フレームモジュール
+キャプチャしたピクセルバッファを変換せずにNumPy配列として扱う
+"""
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+
+# チャンネル順 -> RGB各チャンネルの位置
+_CHANNEL_INDEX = {
+    "RGB": (0, 1, 2),
+    "BGR": (2, 1, 0),
+}
+
+
+def order_color(rgb: tuple[int, int, int], channel_order: str) -> tuple[int, int, int]:
+    """RGBの色を指定のチャンネル順に並べ替える"""
+    r_idx, g_idx, b_idx = _CHANNEL_INDEX[channel_order]
+    ordered = [0, 0, 0]
+    ordered[r_idx], ordered[g_idx], ordered[b_idx] = rgb
+    return tuple(ordered)
+
+
+class Frame:
+    """
+    1フレーム分のピクセル (H, W, C) のNumPyビュー
+
+    Windowsのビットマップは BGRX 順なので、RGBへの並べ替えは行わずにそのまま持つ。
+    色の比較では order_color() でパターン側の色をフレームの並びに合わせる。
+    """
+
+    def __init__(self, pixels: np.ndarray, channel_order: str = "RGB",
+                 timestamp: Optional[float] = None):
+        if channel_order not in _CHANNEL_INDEX:
+            raise ValueError(f"未対応のチャンネル順です: {channel_order}")
+        self.pixels = pixels  # (H, W, 3 or 4) uint8, 4チャンネル目(X)は無視
+        self.channel_order = channel_order
+        self.timestamp = timestamp  # キャプチャ時刻 (任意)
+
+    @classmethod
+    def from_bgrx_buffer(cls, buffer, width: int, height: int,
+                         timestamp: Optional[float] = None) -> "Frame":
+        """BGRXのバッファをコピーせずにラップ"""
+        pixels = np.frombuffer(buffer, dtype=np.uint8).reshape(height, width, 4)
+        return cls(pixels, "BGR", timestamp)
+
+    @classmethod
+    def from_image(cls, image: Image.Image, timestamp: Optional[float] = None) -> "Frame":
+        """PIL Image から生成"""
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        return cls(np.asarray(image), "RGB", timestamp)
+
+    @property
+    def size(self) -> tuple[int, int]:
+        """(幅, 高さ) ※PIL Imageと同じ並び"""
+        return (self.pixels.shape[1], self.pixels.shape[0])
+
+    @property
+    def byte_count(self) -> int:
+        return self.pixels.nbytes
+
+    def order_color(self, rgb: tuple[int, int, int]) -> tuple[int, int, int]:
+        """RGBの色をこのフレームのチャンネル順に並べ替える"""
+        return order_color(rgb, self.channel_order)
+
+    def crop(self, box: tuple[int, int, int, int]) -> "Frame":
+        """box (left, top, right, bottom) 部分のビュー (コピーしない)"""
+        left, top, right, bottom = box
+        return Frame(self.pixels[top:bottom, left:right], self.channel_order, self.timestamp)
+
+    def area_mean(self, box: tuple[int, int, int, int]) -> tuple[int, int, int]:
+        """
+        box 部分の平均色 (フレームのチャンネル順)
+
+        PILのBOX縮小と同じく四捨五入した整数で返す。
+        """
+        left, top, right, bottom = box
+        region = self.pixels[top:bottom, left:right, :3]
+        mean = region.mean(axis=(0, 1))
+        return (int(mean[0] + 0.5), int(mean[1] + 0.5), int(mean[2] + 0.5))
+
+    def to_image(self) -> Image.Image:
+        """PIL Image (RGB) に変換 ※表示用。コピーが発生する"""
+        pixels = self.pixels
+        if self.channel_order == "RGB":
+            return Image.fromarray(np.ascontiguousarray(pixels[:, :, :3]), "RGB")
+        raw_mode = "BGRX" if pixels.shape[2] == 4 else "BGR"
+        height, width = pixels.shape[:2]
+        return Image.frombuffer("RGB", (width, height), np.ascontiguousarray(pixels),
+                                "raw", raw_mode, 0, 1)
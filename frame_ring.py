@@ -0,0 +1,238 @@
+"""
+AutoSplit GIEEE - フレームリングバッファ
+キャプチャ(生産側)と検知(消費側)を別スレッドにするための固定長バッファ
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+
+from frame import Frame
+from scheduler import FrameScheduler
+
+
+# バッファが埋まっているときの方針
+DROP_OLDEST = "drop_oldest"  # 一番古い未処理フレームを上書きする
+DROP_NEWEST = "drop_newest"  # 新しいフレームを捨てる (キャプチャ自体を省略)
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST)
+
+# スロットの状態
+_FREE = 0      # 空き
+_WRITING = 1   # 生産側が書き込み中
+_READY = 2     # 未処理フレームあり
+_IN_USE = 3    # 消費側が処理中
+
+
+@dataclass
+class FrameSlot:
+    """リングバッファの1スロット"""
+    index: int
+    buffer: Optional[np.ndarray] = None  # キャプチャ先として使い回す配列
+    frame: object = None  # Frame / SparseFrame
+    timestamp: float = 0.0  # フレームの時刻 (time.perf_counter。録画再生ではバックエンドが付けた時刻)
+    capture_seconds: float = 0.0  # キャプチャにかかった時間 (秒)
+    committed_at: float = 0.0  # commit() された時刻 (time.perf_counter)
+    sequence: int = 0  # 通し番号
+    state: int = _FREE
+
+
+class FrameRing:
+    """
+    事前確保したスロットを使い回すフレームのリングバッファ
+
+    生産側: acquire_write() -> (キャプチャ) -> commit() / abort()
+    消費側: take_latest() -> (検知) -> release()
+    """
+
+    def __init__(self, capacity: int = 3, policy: str = DROP_OLDEST):
+        if capacity < 2:
+            raise ValueError("capacity は2以上にしてください")
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"未知の方針です: {policy}")
+        self.capacity = capacity
+        self.policy = policy
+        self._slots = [FrameSlot(i) for i in range(capacity)]
+        self._cond = threading.Condition()
+        self._sequence = 0
+        self._closed = False
+
+        # 統計
+        self.produced = 0        # commit されたフレーム数
+        self.consumed = 0        # take_latest で取り出したフレーム数
+        self.dropped_oldest = 0  # 未処理のまま上書きされたフレーム数
+        self.dropped_newest = 0  # バッファが埋まっていて捨てたフレーム数
+        self.skipped = 0         # より新しいフレームがあったため読み飛ばしたフレーム数
+
+    def acquire_write(self) -> Optional[FrameSlot]:
+        """書き込み用のスロットを確保 (確保できなければNone)"""
+        with self._cond:
+            for slot in self._slots:
+                if slot.state == _FREE:
+                    slot.state = _WRITING
+                    return slot
+
+            if self.policy == DROP_NEWEST:
+                self.dropped_newest += 1
+                return None
+
+            # 一番古い未処理フレームを捨てて使う
+            ready = [slot for slot in self._slots if slot.state == _READY]
+            if not ready:
+                # 全スロットが書き込み中/処理中 (通常は起きない)
+                self.dropped_newest += 1
+                return None
+            oldest = min(ready, key=lambda s: s.sequence)
+            oldest.state = _WRITING
+            oldest.frame = None
+            self.dropped_oldest += 1
+            return oldest
+
+    def commit(self, slot: FrameSlot, frame, timestamp: float, capture_seconds: float = 0.0):
+        """書き込み完了"""
+        with self._cond:
+            self._sequence += 1
+            slot.frame = frame
+            slot.timestamp = timestamp
+            slot.capture_seconds = capture_seconds
+            slot.committed_at = time.perf_counter()
+            slot.sequence = self._sequence
+            slot.state = _READY
+            self.produced += 1
+            self._cond.notify_all()
+
+    def abort(self, slot: FrameSlot):
+        """書き込みを取りやめる (キャプチャ失敗時)"""
+        with self._cond:
+            slot.frame = None
+            slot.state = _FREE
+
+    def take_latest(self, timeout: Optional[float] = None) -> Optional[FrameSlot]:
+        """
+        最新の未処理フレームを取り出す
+
+        それより古い未処理フレームは読み飛ばして解放する。
+        timeout 秒待っても来なければ (または close 済みなら) None。
+        """
+        with self._cond:
+            deadline = None if timeout is None else time.perf_counter() + timeout
+            while True:
+                ready = [slot for slot in self._slots if slot.state == _READY]
+                if ready:
+                    break
+                if self._closed:
+                    return None
+                remaining = None if deadline is None else deadline - time.perf_counter()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+            latest = max(ready, key=lambda s: s.sequence)
+            for slot in ready:
+                if slot is not latest:
+                    slot.frame = None
+                    slot.state = _FREE
+                    self.skipped += 1
+            latest.state = _IN_USE
+            self.consumed += 1
+            return latest
+
+    def release(self, slot: FrameSlot):
+        """処理が終わったスロットを返す"""
+        with self._cond:
+            slot.frame = None
+            slot.state = _FREE
+
+    def discard_ready(self) -> int:
+        """未処理フレームを全部捨てる (キャプチャの設定が変わったとき用)。捨てた数を返す"""
+        with self._cond:
+            discarded = 0
+            for slot in self._slots:
+                if slot.state == _READY:
+                    slot.frame = None
+                    slot.state = _FREE
+                    discarded += 1
+            self.skipped += discarded
+            return discarded
+
+    def close(self):
+        """待機中の消費側を起こして終了させる"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stats(self) -> dict[str, int]:
+        """統計情報"""
+        with self._cond:
+            return {
+                "produced": self.produced,
+                "consumed": self.consumed,
+                "dropped_oldest": self.dropped_oldest,
+                "dropped_newest": self.dropped_newest,
+                "skipped": self.skipped,
+            }
+
+
+class CaptureProducer(threading.Thread):
+    """
+    一定間隔でキャプチャしてリングバッファに入れ続けるスレッド
+
+    grab(out) は Frame / SparseFrame を返す関数 (out は使い回し用の配列 or None)。
+    フレームの時刻は、バックエンドが timestamp を付けていればそれ (録画再生の時刻)、
+    なければキャプチャを始めた時刻 (time.perf_counter) にする。
+    周期は FrameScheduler で刻むので、キャプチャにかかった時間で周期がずれることはない。
+    """
+
+    def __init__(self, ring: FrameRing, grab: Callable, interval_ms: int,
+                 on_error: Optional[Callable[[str], None]] = None, spin_ms: float = 0.0):
+        super().__init__(daemon=True)
+        self._ring = ring
+        self._grab = grab
+        self.scheduler = FrameScheduler(interval_ms, spin_ms)
+        self._on_error = on_error
+        self._running = False
+        self.failures = 0  # キャプチャ失敗回数
+
+    @property
+    def interval_ms(self) -> float:
+        return self.scheduler.interval_ms
+
+    @interval_ms.setter
+    def interval_ms(self, value: float):
+        self.scheduler.interval_ms = value
+
+    def run(self):
+        self._running = True
+        self.scheduler.start()
+        while self._running:
+            self.scheduler.wait()
+            slot = self._ring.acquire_write()
+            if slot is not None:
+                timestamp = time.perf_counter()
+                try:
+                    frame = self._grab(slot.buffer)
+                except Exception as e:
+                    frame = None
+                    print(f"キャプチャスレッドでエラー: {e}")
+
+                if frame is None:
+                    self._ring.abort(slot)
+                    self.failures += 1
+                    if self._on_error:
+                        self._on_error("おっと、キャプチャに失敗しちゃいました...")
+                    time.sleep(1.0)
+                    self.scheduler.start()
+                    continue
+
+                # 全体キャプチャの配列は次回の書き込み先として使い回す
+                if isinstance(frame, Frame) and frame.pixels.flags.writeable:
+                    slot.buffer = frame.pixels
+                if frame.timestamp is None:
+                    frame.timestamp = timestamp
+                self._ring.commit(slot, frame, frame.timestamp, time.perf_counter() - timestamp)
+
+    def stop(self, timeout: float = 2.0):
+        self._running = False
+        if self.is_alive():
+            self.join(timeout)
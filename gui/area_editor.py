@@ -123,6 +123,7 @@ class AreaEditorWidget(QWidget):
             capture = ScreenCapture()
             capture.set_target_window(self._target_window)
             self._image = capture.capture()
+            capture.close()
             if self._image:
                 self._update_preview()
             else:
@@ -3,132 +3,46 @@ AutoSplit GIEEE - メインウィンドウ (システムトレイ常駐)
 """
 import sys
 import os
+import copy
 import time
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QPushButton, QSystemTrayIcon, QMenu, QFrame,
     QProgressBar, QMessageBox
 )
-from PyQt6.QtCore import Qt, QTimer, pyqtSignal, QThread
-from PyQt6.QtGui import QIcon, QPixmap, QAction, QPainter, QColor, QFont
+from PyQt6.QtCore import Qt, QTimer, QEvent, pyqtSignal, QThread
+from PyQt6.QtGui import QIcon, QPixmap, QAction, QPainter, QColor, QFont, QKeySequence, QShortcut
 from PIL import Image
 
 from config import AppConfig, load_config, save_config
-from capture import ScreenCapture, check_window_exists
-from detector import detect_all_patterns, DetectionResult, crop_timer_area, images_are_similar
+from capture import check_window_exists
+from monitor import MonitorThread
+from load_state import EVENT_SPLIT
+from livesplit_server import LiveSplitServerClient, TRANSPORT_LIVESPLIT_SERVER
 from hotkey import HotkeyManager
 from gui.settings_dialog import SettingsDialog
 from gui.styles import load_fonts, APP_STYLE_TEMPLATE
 from logger import TodaysSplitLogger
 
 
-class MonitorThread(QThread):
-    """
-    画面をじっと見つめ続ける監視役スレッドです。
-    """
-    
-    detection_result = pyqtSignal(object)  # (detected, best) -> 何か見つけたら報告
-    timer_status_changed = pyqtSignal(bool)  # True = 凍結中, False = 動いてる
-    error_occurred = pyqtSignal(str)
-    
-    def __init__(self, config: AppConfig, parent=None):
-        super().__init__(parent)
-        self.config = config
-        self._running = False
-        self._capture = ScreenCapture()
-        self._livesplit_capture = ScreenCapture()
-        
-        # タイムライン監視用の変数たち
-        self._last_timer_image = None
-        self._timer_frozen_since = None
-        self._is_frozen = False
-    
-    def run(self):
-        self._running = True
-        self._capture.set_target_window(self.config.target_window)
-        
-        # LiveSplitもチェックするなら準備します
-        if self.config.livesplit_window:
-            self._livesplit_capture.set_target_window(self.config.livesplit_window)
-        
-        while self._running:
-            try:
-                # ゲーム画面をパシャリ
-                image = self._capture.capture()
-                if image is None:
-                    self.error_occurred.emit("おっと、キャプチャに失敗しちゃいました...")
-                    self.msleep(1000)
-                    continue
-                
-                # 指定のパターンがあるか探します
-                detected, best = detect_all_patterns(
-                    image,
-                    self.config.patterns,
-                    self.config.area_size
-                )
-                
-                self.detection_result.emit((detected, best))
-                
-                # LiveSplitの方もチラ見します
-                if self.config.livesplit_window:
-                    self._check_timer_frozen()
-                
-            except Exception as e:
-                self.error_occurred.emit(f"何かエラーが起きちゃいました: {str(e)}")
-            
-            self.msleep(self.config.check_interval_ms)
-    
-    def _check_timer_frozen(self):
-        """LiveSplitのタイマーが止まってないかチェックします"""
-        try:
-            ls_image = self._livesplit_capture.capture()
-            if ls_image is None:
-                return
-            
-            # タイマーの部分だけ切り抜きます
-            ta = self.config.timer_area
-            timer_image = crop_timer_area(ls_image, ta.x, ta.y, ta.width, ta.height)
-            
-            if self._last_timer_image is not None:
-                # さっきと比べて変わったかな？
-                is_currently_similar = images_are_similar(self._last_timer_image, timer_image)
-                
-                if is_currently_similar:
-                    # 動いてない...
-                    if self._timer_frozen_since is None:
-                        self._timer_frozen_since = time.time()
-                    else:
-                        frozen_ms = (time.time() - self._timer_frozen_since) * 1000
-                        if frozen_ms >= self.config.timer_freeze_ms:
-                            if not self._is_frozen:
-                                self._is_frozen = True
-                                self.timer_status_changed.emit(True)
-                else:
-                    # 動いてる！
-                    self._timer_frozen_since = None
-                    if self._is_frozen:
-                        self._is_frozen = False
-                        self.timer_status_changed.emit(False)
-            
-            self._last_timer_image = timer_image
-        except Exception as e:
-            print(f"タイマー監視中に何か起きちゃいました: {e}")
-    
-    def stop(self):
-        self._running = False
-        self._running = False
-        # タイムアウト付き待機 (2秒) -> ダメなら強制終了
-        if not self.wait(2000):
-            self.terminate()
-            self.wait()
-        self._capture.close()
-        self._livesplit_capture.close()
-    
-    def update_config(self, config: AppConfig):
-        self.config = config
-        self._capture.set_target_window(config.target_window)
-        if config.livesplit_window:
-            self._livesplit_capture.set_target_window(config.livesplit_window)
+# 一致率プログレスバーのスタイル ({start}/{end} はバーのグラデーション色)
+PROGRESS_STYLE_TEMPLATE = """
+    QProgressBar {{
+        background-color: #333;
+        border: none;
+        border-radius: 8px;
+        height: 30px;
+        text-align: center;
+        color: white;
+        font-size: 16px;
+        font-weight: bold;
+    }}
+    QProgressBar::chunk {{
+        background: qlineargradient(x1:0, y1:0, x2:1, y2:0,
+            stop:0 {start}, stop:1 {end});
+        border-radius: 8px;
+    }}
+"""
 
 
 class StatusIndicator(QFrame):
@@ -167,14 +81,22 @@ class MainWindow(QMainWindow):
         super().__init__()
         self.config = load_config()
         self._monitor_thread = None
-        self._hotkey_manager = HotkeyManager()
-        self._last_detection_time = 0
+        self._last_monitor_thread = None  # 停止後もフライトレコーダーを保存できるように残しておく
+        # ホットキーは専用スレッドから送信 (送り終わったら遅延を表示)
+        self._hotkey_manager = HotkeyManager(
+            on_sent=lambda r: print(f"ホットキー送信失敗: {r.hotkey} ({r.error})" if r.error
+                                    else f"ホットキー送信: {r.hotkey} (遅延 {r.latency * 1000:.2f}ms)")
+        )
         self._hotkey_count = 0  # ホットキー送信回数
         
         # ロガーの準備 (ここでは初期化のみ)
         self._logger = None
-        self._is_loading = False # 現在ロード中（検知中）かどうか
-        self._load_start_time = 0.0 # ロード開始時刻
+        
+        # LiveSplit Server への接続 (使うパターンがあるときだけ)
+        self._livesplit_server = None
+        
+        # プログレスバーが閾値以上の色になっているか
+        self._progress_above = False
         
         self._setup_ui()
 
@@ -276,6 +198,16 @@ class MainWindow(QMainWindow):
         settings_btn.clicked.connect(self._open_settings)
         btn_layout.addWidget(settings_btn)
         
+        # 変なスプリットが起きたら直前の判定結果を保存 (Ctrl+Shift+D でも可)
+        flight_btn = QPushButton("🛩 直前を保存")
+        flight_btn.setMinimumHeight(50)
+        flight_btn.setCursor(Qt.CursorShape.PointingHandCursor)
+        flight_btn.setFocusPolicy(Qt.FocusPolicy.NoFocus) # キーボード操作無効化
+        flight_btn.setToolTip("直近の判定結果 (フライトレコーダー) をファイルに保存します (Ctrl+Shift+D)")
+        flight_btn.clicked.connect(self._dump_flight_recorder)
+        btn_layout.addWidget(flight_btn)
+        QShortcut(QKeySequence("Ctrl+Shift+D"), self, activated=self._dump_flight_recorder)
+        
         control_layout.addLayout(btn_layout)
         layout.addWidget(control_frame)
         
@@ -299,23 +231,7 @@ class MainWindow(QMainWindow):
         self.match_progress.setValue(0)
         self.match_progress.setTextVisible(True)
         self.match_progress.setFormat("%v%")
-        self.match_progress.setStyleSheet("""
-            QProgressBar {
-                background-color: #333;
-                border: none;
-                border-radius: 8px;
-                height: 30px;
-                text-align: center;
-                color: white;
-                font-size: 16px;
-                font-weight: bold;
-            }
-            QProgressBar::chunk {
-                background: qlineargradient(x1:0, y1:0, x2:1, y2:0,
-                    stop:0 #4CAF50, stop:1 #8BC34A);
-                border-radius: 8px;
-            }
-        """)
+        self.match_progress.setStyleSheet(PROGRESS_STYLE_TEMPLATE.format(start="#4CAF50", end="#8BC34A"))
         match_layout.addWidget(self.match_progress)
         
         # 詳細情報
@@ -377,7 +293,8 @@ class MainWindow(QMainWindow):
         
         # ウィンドウ存在チェック
         target_title = self.config.target_window
-        if target_title and not check_window_exists(target_title):
+        uses_screen = self.config.capture_backend == "win32"
+        if uses_screen and target_title and not check_window_exists(target_title):
             # エラー音とポップアップ
             QApplication.beep()
             QMessageBox.warning(self, "監視対象が見つかりません", 
@@ -388,18 +305,17 @@ class MainWindow(QMainWindow):
             self.detection_info.setText(f"❌ '{target_title}' が見つかりません")
             return
             
-        success_msg = f"✅ '{target_title}' を捕捉しました。監視中..." if target_title else "✅ 全画面を監視中..."
+        if not uses_screen:
+            success_msg = f"✅ {self.config.capture_backend} バックエンドで監視中..."
+        elif target_title:
+            success_msg = f"✅ '{target_title}' を捕捉しました。監視中..."
+        else:
+            success_msg = "✅ 全画面を監視中..."
         self.detection_info.setText(success_msg)
         
         # ホットキーカウントをリセット
         self._hotkey_count = 0
         
-        self._monitor_thread = MonitorThread(self.config)
-        self._monitor_thread.detection_result.connect(self._on_detection)
-        self._monitor_thread.timer_status_changed.connect(self._on_timer_status_changed)
-        self._monitor_thread.error_occurred.connect(self._on_error)
-        self._monitor_thread.start()
-        
         # タイマースタート & ロガー初期化 (設定がONなら)
         if self.config.csv_logging_enabled:
             print("CSVロガー: ON - 新しいセッションを開始します")
@@ -410,10 +326,28 @@ class MainWindow(QMainWindow):
         else:
             print("CSVロガー: OFF")
             self._logger = None
-            
-        self._is_loading = False
-        self._load_start_time = 0.0
-        self._pending_detection_start = None # 検知開始時刻（確定待ち）
+        
+        # 送信方法が LiveSplit Server のパターンがあれば接続を張っておく
+        if any(p.enabled and p.split_transport == TRANSPORT_LIVESPLIT_SERVER for p in self.config.patterns):
+            self._livesplit_server = LiveSplitServerClient(
+                self.config.livesplit_server_host, self.config.livesplit_server_port
+            )
+            self._livesplit_server.start()
+        
+        # ロード判定・ホットキー送信・CSV記録は監視スレッドが直接行う
+        self._monitor_thread = MonitorThread(
+            self.config,
+            send_hotkey=self._hotkey_manager.queue_hotkey,
+            logger=self._logger,
+            livesplit_server=self._livesplit_server
+        )
+        self._monitor_thread.detection_result.connect(self._on_detection)
+        self._monitor_thread.load_event.connect(self._on_load_event)
+        self._monitor_thread.timer_status_changed.connect(self._on_timer_status_changed)
+        self._monitor_thread.error_occurred.connect(self._on_error)
+        self._monitor_thread.flight_dumped.connect(self._on_flight_dumped)
+        self._update_display_enabled()
+        self._monitor_thread.start()
         
         self.timer_status_label.setText("Timer: Wait...")
         self.timer_status_label.setStyleSheet("color: #888; font-size: 11px; font-weight: bold; border: 1px solid #444; padding: 2px 6px; border-radius: 4px;")
@@ -431,7 +365,11 @@ class MainWindow(QMainWindow):
     def _stop_monitoring(self):
         if self._monitor_thread:
             self._monitor_thread.stop()
+            self._last_monitor_thread = self._monitor_thread
             self._monitor_thread = None
+        if self._livesplit_server:
+            self._livesplit_server.stop()
+            self._livesplit_server = None
         
         self.timer_status_label.setText("Timer: -")
         self.timer_status_label.setStyleSheet("color: #555; font-size: 11px; font-weight: bold; border: 1px solid #444; padding: 2px 6px; border-radius: 4px; background-color: #222;")
@@ -447,137 +385,73 @@ class MainWindow(QMainWindow):
 
         self.detection_info.setText("監視が停止されました")
         self.match_progress.setValue(0)
+        self._set_progress_above(False)
     
     def _on_detection(self, result_tuple):
-        """検知結果を受信"""
-        import time
-        
+        """検知結果を受信 (表示の更新のみ。監視スレッド側で ui_refresh_hz に間引き済み)"""
         detected, best = result_tuple
         
         # リアルタイムで一致率を表示
         if best and best.total_areas > 0:
             self.match_progress.setValue(int(best.match_percent))
-            self.match_pattern_label.setText(f"({best.pattern.name})")
+            pattern_text = f"({best.pattern.name})"
+            if pattern_text != self.match_pattern_label.text():
+                self.match_pattern_label.setText(pattern_text)
             self.detection_info.setText(
                 f"{best.matched_areas}/{best.total_areas}エリア一致 "
                 f"(閾値: {best.pattern.threshold_percent}%)"
             )
-        
-        
-            # プログレスバーの色を動的に変更
-            if best.match_percent >= best.pattern.threshold_percent:
-                self.match_progress.setStyleSheet("""
-                    QProgressBar {
-                        background-color: #333;
-                        border: none;
-                        border-radius: 8px;
-                        height: 30px;
-                        text-align: center;
-                        color: white;
-                        font-size: 16px;
-                        font-weight: bold;
-                    }
-                    QProgressBar::chunk {
-                        background: qlineargradient(x1:0, y1:0, x2:1, y2:0,
-                            stop:0 #FF9800, stop:1 #FFC107);
-                        border-radius: 8px;
-                    }
-                """)
-            else:
-                self.match_progress.setStyleSheet("""
-                    QProgressBar {
-                        background-color: #333;
-                        border: none;
-                        border-radius: 8px;
-                        height: 30px;
-                        text-align: center;
-                        color: white;
-                        font-size: 16px;
-                        font-weight: bold;
-                    }
-                    QProgressBar::chunk {
-                        background: qlineargradient(x1:0, y1:0, x2:1, y2:0,
-                            stop:0 #4CAF50, stop:1 #8BC34A);
-                        border-radius: 8px;
-                    }
-                """)
-        
-        # --- ロード時間計測ロジック (誤検知防止付き) ---
-        # 検知あり = ロード中
-        now_time = time.time()
-        
-        if detected:
-            if not self._is_loading:
-                # まだロード中判定ではない場合
-                if self._pending_detection_start is None:
-                    # 初めて検知した -> 保留開始
-                    self._pending_detection_start = now_time
-                
-                # 保留時間が基準を超えたかチェック
-                elapsed_ms = (now_time - self._pending_detection_start) * 1000
-                if elapsed_ms >= self.config.min_duration_ms:
-                    # ロード開始確定！
-                    self._is_loading = True
-                    # 開始時刻は検知開始時刻にバックデートして記録
-                    self._load_start_time = self._pending_detection_start
-                    # print(f"ロード開始確定: {self._load_start_time} (保留: {elapsed_ms:.1f}ms)")
-                    
-                    # --- ホットキー送信 & ログ記録 (ここで行う) ---
-                    self._check_and_send_hotkey(detected, self._pending_detection_start)
-                    
-                    self._pending_detection_start = None
-            else:
-                # 既にロード中なら何もしない（継続）
-                pass
-                
-        else:
-            # 検知なし
-            self._pending_detection_start = None # 保留はリセット
             
-            if self._is_loading:
-                # ロード終了
-                self._is_loading = False
-                duration = time.time() - self._load_start_time
-                if self._logger:
-                    self._logger.add_load_time(duration)
-                # print(f"ロード終了: duration={duration:.3f}")
-        
-
-        
-        if detected is None:
+            # プログレスバーの色は閾値を跨いだときだけ変更 (スタイルシートの再解析は重い)
+            self._set_progress_above(best.match_percent >= best.pattern.threshold_percent)
+    
+    def _set_progress_above(self, above: bool):
+        """プログレスバーの色 (閾値以上ならオレンジ、未満なら緑) を切り替える"""
+        if above == self._progress_above:
             return
-            
-        # クールダウンチェックなど（現在は_check_and_send_hotkey内で呼び出し元を制御しているため、ここはパス）
-        pass
-        
-    def _check_and_send_hotkey(self, detected, detection_time):
-        """ホットキー送信判定と送信処理"""
-        # クールダウンチェック
-        # detection_time (ロード開始確定時刻) と前回送信時刻を比較
-        if (detection_time - self._last_detection_time) * 1000 < self.config.cooldown_ms:
+        self._progress_above = above
+        if above:
+            style = PROGRESS_STYLE_TEMPLATE.format(start="#FF9800", end="#FFC107")
+        else:
+            style = PROGRESS_STYLE_TEMPLATE.format(start="#4CAF50", end="#8BC34A")
+        self.match_progress.setStyleSheet(style)
+    
+    def _update_display_enabled(self):
+        """最小化・非表示中は監視スレッドに表示用の結果を送らせない"""
+        if self._monitor_thread is not None:
+            self._monitor_thread.display_enabled = self.isVisible() and not self.isMinimized()
+    
+    def changeEvent(self, event):
+        if event.type() == QEvent.Type.WindowStateChange:
+            self._update_display_enabled()
+        super().changeEvent(event)
+    
+    def showEvent(self, event):
+        super().showEvent(event)
+        self._update_display_enabled()
+    
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self._update_display_enabled()
+    
+    def _on_load_event(self, event):
+        """監視スレッドからのロード状態の変化を受信"""
+        self._hotkey_count = event.hotkey_count
+        if event.kind != EVENT_SPLIT:
             return
-
-        # ホットキー送信
-        if self._hotkey_manager.send_hotkey(detected.pattern.hotkey):
-            self._last_detection_time = detection_time # 送信時刻ではなく「検知時刻」を基準に更新
-            self._hotkey_count += 1
-            self.status_indicator.set_status("detected")
-            self.detection_info.setText(
-                f"🎯 検知! {detected.pattern.name} → {detected.pattern.hotkey} 送信 (計{self._hotkey_count}回)"
-            )
-            
-            # --- ログ記録 ---
-            # ここで backdated time (detection_time) を渡して、正確な時刻で記録する
-            if self._logger:
-                # logger.record_split(split_time=detection_time) 
-                # ただし segment time は now - last_split なので、ここも detection_time を渡すべき。
-                seg_time, load_time = self._logger.record_split(split_time=detection_time)
-                print(f">>> Split! Segment: {seg_time:.2f}s, Load: {load_time:.2f}s")
-            
-            QTimer.singleShot(500, lambda: self.status_indicator.set_status("running"))
+        
+        self.status_indicator.set_status("detected")
+        if event.pattern.split_transport == TRANSPORT_LIVESPLIT_SERVER:
+            destination = "LiveSplit Server"
+        else:
+            destination = event.pattern.hotkey
+        self.detection_info.setText(
+            f"🎯 検知! {event.pattern.name} → {destination} 送信 (計{self._hotkey_count}回)"
+        )
+        QTimer.singleShot(500, lambda: self.status_indicator.set_status("running"))
         
         # タイマー凍結中かつ規定回数送信済みなら停止 (オートストップ有効時)
-        if self.config.auto_stop_enabled and self._monitor_thread and self._monitor_thread._is_frozen:
+        if self.config.auto_stop_enabled and self._monitor_thread and self._monitor_thread.is_timer_frozen:
             if self._hotkey_count >= self.config.min_hotkey_count:
                 self._handle_auto_stop()
     
@@ -603,22 +477,52 @@ class MainWindow(QMainWindow):
         
 
     
+    def _dump_flight_recorder(self):
+        """フライトレコーダーの中身を保存 (停止後なら最後に動いていた監視のもの)"""
+        monitor = self._monitor_thread or self._last_monitor_thread
+        if monitor is None:
+            self.detection_info.setText("⚠️ 保存できる記録がありません (監視を開始してください)")
+            return
+        monitor.request_flight_dump()
+    
+    def _on_flight_dumped(self, path: str):
+        self.detection_info.setText(f"🛩 直前の記録を保存しました: {os.path.basename(path)}")
+        print(f"フライトレコーダー: {path}")
+    
     def _on_error(self, error: str):
         self.status_indicator.set_status("error")
         self.detection_info.setText(f"❌ エラー: {error}")
     
     def _open_settings(self):
-        # 監視中なら停止
-        was_running = self._monitor_thread and self._monitor_thread.isRunning()
-        if was_running:
-            self._stop_monitoring()
-        
-        dialog = SettingsDialog(self.config, self)
+        # 監視は止めずに、保存したら監視スレッドに反映します
+        # (ダイアログには写しを渡すので、編集途中の設定を監視スレッドが読むことはありません)
+        dialog = SettingsDialog(copy.deepcopy(self.config), self)
         dialog.settings_changed.connect(self._on_settings_changed)
         dialog.exec()
     
     def _on_settings_changed(self, config: AppConfig):
+        old = self.config
         self.config = config
         self._update_patterns_display()
+        if self._monitor_thread is None or not self._monitor_thread.isRunning():
+            return
+        has_areas = any(pattern.areas for pattern in config.patterns if pattern.enabled)
+        if not has_areas or self._session_key(old) != self._session_key(config):
+            # CSVロガーとLiveSplit Serverの接続は監視を始めるときに作るので、監視をやり直します
+            self._stop_monitoring()
+            self._start_monitoring()
+        else:
+            self._monitor_thread.update_config(config)
+    
+    @staticmethod
+    def _session_key(config: AppConfig) -> tuple:
+        """監視を始めるときにだけ読む設定 (変わったら監視をやり直します)"""
+        return (
+            config.csv_logging_enabled,
+            config.csv_logging_path,
+            any(p.enabled and p.split_transport == TRANSPORT_LIVESPLIT_SERVER for p in config.patterns),
+            config.livesplit_server_host,
+            config.livesplit_server_port,
+        )
     
 
@@ -1,21 +1,52 @@
 """
 AutoSplit GIEEE - 設定ダイアログ
 """
+import copy
+
 from PyQt6.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
     QComboBox, QSpinBox, QGroupBox, QFormLayout, QLineEdit,
     QCheckBox, QTabWidget, QWidget, QScrollArea, QFrame,
     QSlider, QMessageBox, QFileDialog
 )
-from PyQt6.QtCore import Qt, pyqtSignal
+from PyQt6.QtCore import Qt, pyqtSignal, QThread
 from PyQt6.QtGui import QColor, QWheelEvent, QKeySequence
 
 from config import AppConfig, PatternConfig, DetectionArea, load_config, save_config, hex_to_rgb, rgb_to_hex
 from capture import ScreenCapture
 from hotkey import AVAILABLE_HOTKEYS
+from livesplit_server import TRANSPORT_HOTKEY, TRANSPORT_LIVESPLIT_SERVER
+from timer_monitor import TIMER_SOURCE_CAPTURE, TIMER_SOURCE_SERVER
 from gui.color_picker import ColorPickerWidget, ColorPreview
 from gui.area_editor import AreaEditorWidget
+from area_suggest import suggest_areas, load_images
+
+
+class AreaSuggestThread(QThread):
+    """画像の読み込みとエリアの自動提案を裏で行うスレッド (大きな画像でもGUIを止めない)"""
+    suggested = pyqtSignal(object)  # AreaSuggestion
+    failed = pyqtSignal(str)
+
+    def __init__(self, load_files, game_files, pattern: PatternConfig, area_size: int, parent=None):
+        super().__init__(parent)
+        self._load_files = load_files
+        self._game_files = game_files
+        self._pattern = copy.deepcopy(pattern)  # 実行中にダイアログで色を変えられても影響を受けないように
+        self._area_size = area_size
+
+    def run(self):
+        try:
+            load_frames = [img for f in self._load_files for img in load_images(f)]
+            game_frames = [img for f in self._game_files for img in load_images(f)]
+            suggestion = suggest_areas(load_frames, game_frames, self._pattern, self._area_size)
+        except (OSError, ValueError) as e:
+            self.failed.emit(str(e))
+            return
+        self.suggested.emit(suggestion)
+
 
+# 実行中の提案スレッド (ダイアログが先に閉じられても、終わるまで参照を持っておく)
+_suggest_threads: set = set()
 
 
 class NoWheelComboBox(QComboBox):
@@ -176,10 +207,11 @@ class PatternEditor(QFrame):
     pattern_changed = pyqtSignal()
     delete_requested = pyqtSignal()
     
-    def __init__(self, pattern: PatternConfig, target_window=None, parent=None):
+    def __init__(self, pattern: PatternConfig, target_window=None, area_size: int = 50, parent=None):
         super().__init__(parent)
         self.pattern = pattern
         self._target_window = target_window
+        self._area_size = area_size
         self._setup_ui()
     
     def _update_enabled_text(self, checked):
@@ -249,6 +281,37 @@ class PatternEditor(QFrame):
         tolerance_layout.addStretch()
         layout.addLayout(tolerance_layout)
         
+        # 判定方法 (平均色 or 画素ごと)
+        mode_layout = QHBoxLayout()
+        mode_layout.addWidget(QLabel("判定方法:"))
+        self.match_mode_combo = NoWheelComboBox()
+        self.match_mode_combo.addItem("平均色", "mean")
+        self.match_mode_combo.addItem("画素ごと (文字が重なっても検知)", "pixel")
+        idx = self.match_mode_combo.findData(self.pattern.match_mode)
+        self.match_mode_combo.setCurrentIndex(idx if idx >= 0 else 0)
+        self.match_mode_combo.currentIndexChanged.connect(self._on_match_mode_changed)
+        mode_layout.addWidget(self.match_mode_combo)
+        
+        mode_layout.addWidget(QLabel("一致画素:"))
+        self.pixel_percent_spin = NoWheelSpinBox()
+        self.pixel_percent_spin.setRange(1, 100)
+        self.pixel_percent_spin.setSuffix("%")
+        self.pixel_percent_spin.setValue(self.pattern.pixel_match_percent)
+        self.pixel_percent_spin.valueChanged.connect(self._on_pixel_percent_changed)
+        mode_layout.addWidget(self.pixel_percent_spin)
+        mode_layout.addStretch()
+        layout.addLayout(mode_layout)
+        
+        # 追加の色 (画素ごとのときだけ使う)
+        extra_layout = QHBoxLayout()
+        extra_layout.addWidget(QLabel("追加の色:"))
+        self.extra_colors_edit = QLineEdit(", ".join(self.pattern.extra_colors))
+        self.extra_colors_edit.setPlaceholderText("#RRGGBB, #RRGGBB ... (画素ごとのときだけ)")
+        self.extra_colors_edit.textChanged.connect(self._on_extra_colors_changed)
+        extra_layout.addWidget(self.extra_colors_edit, 1)
+        layout.addLayout(extra_layout)
+        self._update_pixel_widgets()
+        
         # 閾値スライダー
         threshold_layout = QHBoxLayout()
         threshold_layout.addWidget(QLabel("検知閾値:"))
@@ -277,6 +340,15 @@ class PatternEditor(QFrame):
         self.hotkey_btn.hotkey_changed.connect(self._on_hotkey_changed)
         hotkey_layout.addWidget(self.hotkey_btn)
         
+        # 送信方法 (ホットキー or LiveSplit Server)
+        self.transport_combo = NoWheelComboBox()
+        self.transport_combo.addItem("ホットキーで送信", TRANSPORT_HOTKEY)
+        self.transport_combo.addItem("LiveSplit Serverで送信", TRANSPORT_LIVESPLIT_SERVER)
+        idx = self.transport_combo.findData(self.pattern.split_transport)
+        self.transport_combo.setCurrentIndex(idx if idx >= 0 else 0)
+        self.transport_combo.currentIndexChanged.connect(self._on_transport_changed)
+        hotkey_layout.addWidget(self.transport_combo)
+        
         hotkey_layout.addStretch()
         layout.addLayout(hotkey_layout)
         
@@ -290,6 +362,12 @@ class PatternEditor(QFrame):
         self.area_editor.areas_changed.connect(self._on_areas_changed)
         area_layout.addWidget(self.area_editor)
         
+        # ロード画面とゲーム画面のスクショからエリアを自動で選ぶ
+        self.suggest_btn = QPushButton("✨ スクショから自動配置")
+        self.suggest_btn.setToolTip("ロード画面とゲーム画面の画像から、ロード中だけこの色になる場所を選びます")
+        self.suggest_btn.clicked.connect(self._suggest_areas)
+        area_layout.addWidget(self.suggest_btn)
+        
         layout.addWidget(area_group)
     
     def _on_enabled_changed(self, checked):
@@ -314,6 +392,33 @@ class PatternEditor(QFrame):
         self.pattern.tolerance = value
         self.pattern_changed.emit()
     
+    def _on_match_mode_changed(self, index):
+        self.pattern.match_mode = self.match_mode_combo.itemData(index)
+        self._update_pixel_widgets()
+        self.pattern_changed.emit()
+    
+    def _on_pixel_percent_changed(self, value):
+        self.pattern.pixel_match_percent = value
+        self.pattern_changed.emit()
+    
+    def _on_extra_colors_changed(self, text):
+        colors = [c.strip() for c in text.split(",") if c.strip()]
+        try:
+            for c in colors:
+                if len(c) != 7 or not c.startswith("#"):
+                    return
+                hex_to_rgb(c)
+        except ValueError:
+            return
+        self.pattern.extra_colors = colors
+        self.pattern_changed.emit()
+    
+    def _update_pixel_widgets(self):
+        """画素ごとの判定でしか使わない項目は、平均色のときは触れないようにする"""
+        pixel = self.pattern.match_mode == "pixel"
+        self.pixel_percent_spin.setEnabled(pixel)
+        self.extra_colors_edit.setEnabled(pixel)
+    
     def _on_threshold_changed(self, value):
         self.pattern.threshold_percent = value
         self.threshold_label.setText(f"{value}%")
@@ -323,10 +428,59 @@ class PatternEditor(QFrame):
         self.pattern.hotkey = text
         self.pattern_changed.emit()
     
+    def _on_transport_changed(self, index):
+        self.pattern.split_transport = self.transport_combo.itemData(index)
+        self.pattern_changed.emit()
+    
     def _on_areas_changed(self, areas):
         self.pattern.areas = areas
         self.pattern_changed.emit()
     
+    def _suggest_areas(self):
+        """サンプル画像を選んで、検知エリアの提案を裏で始める"""
+        image_filter = "画像 (*.png *.jpg *.jpeg *.bmp)"
+        load_files, _ = QFileDialog.getOpenFileNames(self, "ロード画面の画像を選択 (複数可)", "", image_filter)
+        if not load_files:
+            return
+        game_files, _ = QFileDialog.getOpenFileNames(
+            self, "ゲーム画面の画像を選択 (複数可・省略可)", "", image_filter
+        )
+        
+        thread = AreaSuggestThread(load_files, game_files, self.pattern, self._area_size)
+        thread.suggested.connect(self._on_suggested)
+        thread.failed.connect(self._on_suggest_failed)
+        thread.finished.connect(self._on_suggest_finished)
+        thread.finished.connect(lambda: _suggest_threads.discard(thread))
+        _suggest_threads.add(thread)
+        self.suggest_btn.setEnabled(False)
+        self.suggest_btn.setText("⏳ 自動配置中...")
+        thread.start()
+    
+    def _on_suggest_finished(self):
+        self.suggest_btn.setEnabled(True)
+        self.suggest_btn.setText("✨ スクショから自動配置")
+    
+    def _on_suggest_failed(self, error):
+        QMessageBox.warning(self, "自動配置", f"画像を読み込めませんでした: {error}")
+    
+    def _on_suggested(self, suggestion):
+        """提案されたエリアを確認して反映"""
+        if not suggestion.areas:
+            QMessageBox.warning(self, "自動配置", "この色になる場所が見つかりませんでした。色や許容値を確認してください")
+            return
+        
+        message = (f"{len(suggestion.areas)}個のエリアを選びました\n"
+                   f"ロード画面の検知: {suggestion.load_detection_rate:.0%} / "
+                   f"ゲーム画面の誤検知: {suggestion.gameplay_false_rate:.0%}")
+        if suggestion.warning:
+            message += f"\n({suggestion.warning})"
+        if not suggestion.reached:
+            message += "\n(目標に届いていません。サンプルを増やすか、色・許容値を見直してください)"
+        answer = QMessageBox.question(self, "自動配置", message + "\n\n今のエリアと置き換えますか？")
+        if answer == QMessageBox.StandardButton.Yes:
+            self.area_editor.set_areas(suggestion.areas)
+            self._on_areas_changed(self.area_editor.get_areas())
+    
     def _open_color_picker(self):
         """スポイトダイアログを開く"""
         dialog = QDialog(self)
@@ -704,6 +858,25 @@ class SettingsDialog(QDialog):
         # スタイル削除
         livesplit_layout.addRow("最低ホットキー回数:", self.min_hotkey_spin)
         
+        # LiveSplit Server (送信方法が「LiveSplit Serverで送信」のパターン用)
+        server_layout = QHBoxLayout()
+        self.server_host_edit = QLineEdit(self.config.livesplit_server_host)
+        self.server_host_edit.setPlaceholderText("localhost")
+        server_layout.addWidget(self.server_host_edit, 1)
+        self.server_port_spin = NoWheelSpinBox()
+        self.server_port_spin.setRange(1, 65535)
+        self.server_port_spin.setValue(self.config.livesplit_server_port)
+        server_layout.addWidget(self.server_port_spin)
+        livesplit_layout.addRow("LiveSplit Server:", server_layout)
+        
+        # タイマー状態の取得元 (画面キャプチャ or LiveSplit Server)
+        self.timer_source_combo = NoWheelComboBox()
+        self.timer_source_combo.addItem("タイマー領域をキャプチャ", TIMER_SOURCE_CAPTURE)
+        self.timer_source_combo.addItem("LiveSplit Serverに問い合わせ", TIMER_SOURCE_SERVER)
+        idx = self.timer_source_combo.findData(self.config.timer_source)
+        self.timer_source_combo.setCurrentIndex(idx if idx >= 0 else 0)
+        livesplit_layout.addRow("タイマー状態:", self.timer_source_combo)
+        
         layout.addWidget(livesplit_group)
         layout.addStretch()
         
@@ -712,7 +885,7 @@ class SettingsDialog(QDialog):
     def _add_pattern_editor(self, pattern: PatternConfig):
         # 現在選択中のウィンドウを取得
         target_window = self.window_combo.currentData() if hasattr(self, 'window_combo') else self.config.target_window
-        editor = PatternEditor(pattern, target_window=target_window)
+        editor = PatternEditor(pattern, target_window=target_window, area_size=self.config.area_size)
         editor.delete_requested.connect(lambda: self._remove_pattern(editor))
         self._pattern_editors.append(editor)
         
@@ -774,6 +947,9 @@ class SettingsDialog(QDialog):
         self.config.livesplit_window = self.livesplit_combo.currentData()
         # timer_areaはダイアログで直接更新されるのでそのまま
         self.config.min_hotkey_count = self.min_hotkey_spin.value()
+        self.config.livesplit_server_host = self.server_host_edit.text().strip() or "localhost"
+        self.config.livesplit_server_port = self.server_port_spin.value()
+        self.config.timer_source = self.timer_source_combo.currentData()
         
         save_config(self.config)
         self.settings_changed.emit(self.config)
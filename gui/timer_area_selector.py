@@ -102,6 +102,7 @@ class TimerAreaSelector(QDialog):
             capture = ScreenCapture()
             capture.set_target_window(self._window_title)
             self._image = capture.capture()
+            capture.close()
             if self._image:
                 self._update_preview()
             else:
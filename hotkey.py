@@ -1,45 +1,272 @@
 """
 AutoSplit GIEEE - ホットキー送信モジュール
 """
-from pynput.keyboard import Key, Controller
-from typing import Optional
+import ctypes
+import queue
+import threading
 import time
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+
+# キー操作の種類
+KEY_DOWN = "down"
+KEY_UP = "up"
+
+# テンキー (仮想キーコード) を押してから離すまでの時間 (秒)
+VK_HOLD_SECONDS = 0.05
+
+# 修飾キー
+MODIFIER_KEYS = ("ctrl", "alt", "shift")
+
+# SendInput 用の定数
+INPUT_KEYBOARD = 1
+KEYEVENTF_KEYUP = 0x0002
+
+
+class _KEYBDINPUT(ctypes.Structure):
+    _fields_ = [
+        ("wVk", ctypes.c_uint16),
+        ("wScan", ctypes.c_uint16),
+        ("dwFlags", ctypes.c_uint32),
+        ("time", ctypes.c_uint32),
+        ("dwExtraInfo", ctypes.c_size_t),
+    ]
+
+
+class _MOUSEINPUT(ctypes.Structure):
+    # INPUT の共用体のサイズを合わせるためだけに定義 (使わない)
+    _fields_ = [
+        ("dx", ctypes.c_int32),
+        ("dy", ctypes.c_int32),
+        ("mouseData", ctypes.c_uint32),
+        ("dwFlags", ctypes.c_uint32),
+        ("time", ctypes.c_uint32),
+        ("dwExtraInfo", ctypes.c_size_t),
+    ]
+
+
+class _INPUTUNION(ctypes.Union):
+    _fields_ = [("ki", _KEYBDINPUT), ("mi", _MOUSEINPUT)]
+
+
+class _INPUT(ctypes.Structure):
+    _fields_ = [("type", ctypes.c_uint32), ("union", _INPUTUNION)]
+
+
+@dataclass(frozen=True)
+class KeyStep:
+    """キー操作1回分"""
+    action: str  # KEY_DOWN / KEY_UP
+    key: tuple  # ("key", pynputのKey名) / ("vk", 仮想キーコード) / ("char", 文字)
+    hold: float = 0.0  # この操作の後に待つ時間 (秒)
+
+
+@dataclass
+class HotkeySendReport:
+    """ホットキー1回分の送信記録"""
+    hotkey: str
+    enqueued_at: float  # キューに入れた時刻 (time.perf_counter)
+    started_at: float = 0.0  # 最初のキー操作の時刻
+    finished_at: float = 0.0  # 最後のキー操作の時刻
+    error: Optional[str] = None
+
+    @property
+    def latency(self) -> float:
+        """キューに入れてから最初のキーが押されるまでの時間 (秒)"""
+        return self.started_at - self.enqueued_at
+
+
+class KeySink(ABC):
+    """
+    キー操作の送信先
+
+    実際にキーを送る PynputKeySink のほか、テストやベンチマーク用に差し替えられる。
+    送信に失敗したら例外を投げること (送信記録の error に入る)。
+    """
+
+    @abstractmethod
+    def key_down(self, key: tuple):
+        """キーを押す"""
+
+    @abstractmethod
+    def key_up(self, key: tuple):
+        """キーを離す"""
+
+
+class PynputKeySink(KeySink):
+    """
+    pynput と SendInput でキーを送信する (Windows用)
+
+    テンキーなど仮想キーコードで送るキーは SendInput を直接呼ぶ
+    (pynput の Controller も Windows では内部で SendInput を使っている)。
+    """
+
+    def __init__(self):
+        # ディスプレイのない環境でも hotkey.py 自体は読み込めるように、ここで読み込む
+        from pynput.keyboard import Key, Controller
+        self._key = Key
+        self.keyboard = Controller()
+        self._user32 = None
+
+    def _resolve(self, key: tuple):
+        kind, value = key
+        if kind == "key":
+            return getattr(self._key, value)
+        return value
+
+    def key_down(self, key: tuple):
+        if key[0] == "vk":
+            self._send_vk(key[1], 0)
+        else:
+            self.keyboard.press(self._resolve(key))
+
+    def key_up(self, key: tuple):
+        if key[0] == "vk":
+            self._send_vk(key[1], KEYEVENTF_KEYUP)
+        else:
+            self.keyboard.release(self._resolve(key))
+
+    def _send_vk(self, vk_code: int, flags: int):
+        """仮想キーコードでキーを送信 (SendInput使用)"""
+        if self._user32 is None:
+            self._user32 = ctypes.WinDLL("user32", use_last_error=True)
+        user32 = self._user32
+        # スキャンコード取得 (MAPVK_VK_TO_VSC = 0)
+        scan_code = user32.MapVirtualKeyW(vk_code, 0)
+        event = _INPUT(type=INPUT_KEYBOARD)
+        event.union.ki = _KEYBDINPUT(wVk=vk_code, wScan=scan_code, dwFlags=flags)
+        # 入力できたイベント数が返る (0 = UIPIなどで止められた)
+        if user32.SendInput(1, ctypes.byref(event), ctypes.sizeof(_INPUT)) != 1:
+            raise OSError(f"SendInputに失敗しました (エラー {ctypes.get_last_error()})")
+
+
+class RecordingKeySink(KeySink):
+    """キーを送らずに操作を記録するだけの送信先 (テスト・ベンチマーク用)"""
+
+    def __init__(self):
+        self.events: list[tuple[float, str, tuple]] = []  # (時刻, KEY_DOWN/KEY_UP, キー)
+
+    def key_down(self, key: tuple):
+        self.events.append((time.perf_counter(), KEY_DOWN, key))
+
+    def key_up(self, key: tuple):
+        self.events.append((time.perf_counter(), KEY_UP, key))
+
+
+class HotkeyDispatcher(threading.Thread):
+    """
+    ホットキーを専用スレッドから送信する
+
+    submit() はキューに入れてすぐ戻るので、呼び出し側 (監視スレッド) は
+    キーを押してから離すまでの待ち時間でブロックされない。
+    """
+
+    def __init__(self, sink: KeySink, history: int = 100,
+                 on_sent: Optional[Callable[[HotkeySendReport], None]] = None):
+        super().__init__(daemon=True)
+        self._sink = sink
+        self._queue: queue.Queue = queue.Queue()
+        self._on_sent = on_sent
+        self.reports: deque[HotkeySendReport] = deque(maxlen=history)
+        self.submitted = 0
+        self.sent = 0
+
+    def submit(self, hotkey: str, steps: tuple[KeyStep, ...]) -> HotkeySendReport:
+        """送信を予約する (すぐ戻る)"""
+        report = HotkeySendReport(hotkey, time.perf_counter())
+        self.submitted += 1
+        self._queue.put((report, steps))
+        return report
+
+    def run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            report, steps = item
+            try:
+                self._play(report, steps)
+            except Exception as e:
+                report.error = str(e)
+                print(f"ホットキー送信エラー: {e}")
+            report.finished_at = time.perf_counter()
+            self.reports.append(report)
+            self.sent += 1
+            if self._on_sent:
+                self._on_sent(report)
+
+    def _play(self, report: HotkeySendReport, steps: tuple[KeyStep, ...]):
+        for i, step in enumerate(steps):
+            if step.action == KEY_DOWN:
+                self._sink.key_down(step.key)
+            else:
+                self._sink.key_up(step.key)
+            if i == 0:
+                report.started_at = time.perf_counter()
+            if step.hold > 0:
+                time.sleep(step.hold)
+
+    def flush(self, timeout: float = 2.0) -> bool:
+        """キューが空になるまで待つ (テスト用)"""
+        deadline = time.perf_counter() + timeout
+        while self.sent < self.submitted:
+            if time.perf_counter() > deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def stop(self, timeout: float = 2.0):
+        self._queue.put(None)
+        if self.is_alive():
+            self.join(timeout)
+
+    def stats(self) -> dict[str, float]:
+        """直近の送信の遅延 (キューに入れてから最初のキーが押されるまで)"""
+        latencies = [r.latency for r in self.reports if r.error is None]
+        return {
+            "sent": self.sent,
+            "mean_latency_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+            "max_latency_ms": max(latencies) * 1000 if latencies else 0.0,
+        }
 
 
 class HotkeyManager:
     """ホットキーの送信を管理するクラス"""
 
-    # キー名とpynputキーのマッピング
+    # キー名とpynputキー (Key の属性名) のマッピング
     KEY_MAP = {
         # ファンクションキー
-        "f1": Key.f1, "f2": Key.f2, "f3": Key.f3, "f4": Key.f4,
-        "f5": Key.f5, "f6": Key.f6, "f7": Key.f7, "f8": Key.f8,
-        "f9": Key.f9, "f10": Key.f10, "f11": Key.f11, "f12": Key.f12,
+        "f1": "f1", "f2": "f2", "f3": "f3", "f4": "f4",
+        "f5": "f5", "f6": "f6", "f7": "f7", "f8": "f8",
+        "f9": "f9", "f10": "f10", "f11": "f11", "f12": "f12",
         # テンキー
-        "numpad0": Key.num_lock if hasattr(Key, 'num_lock') else None,  # フォールバック
+        "numpad0": "num_lock",  # フォールバック
         # numpad1-9 は NUMPAD_VK で処理するため削除
 
         # 特殊キー
-        "space": Key.space,
-        "enter": Key.enter,
-        "tab": Key.tab,
-        "escape": Key.esc,
-        "esc": Key.esc,
-        "backspace": Key.backspace,
-        "delete": Key.delete,
-        "insert": Key.insert,
-        "home": Key.home,
-        "end": Key.end,
-        "pageup": Key.page_up,
-        "pagedown": Key.page_down,
-        "up": Key.up,
-        "down": Key.down,
-        "left": Key.left,
-        "right": Key.right,
+        "space": "space",
+        "enter": "enter",
+        "tab": "tab",
+        "escape": "esc",
+        "esc": "esc",
+        "backspace": "backspace",
+        "delete": "delete",
+        "insert": "insert",
+        "home": "home",
+        "end": "end",
+        "pageup": "page_up",
+        "pagedown": "page_down",
+        "up": "up",
+        "down": "down",
+        "left": "left",
+        "right": "right",
         # 修飾キー
-        "ctrl": Key.ctrl,
-        "alt": Key.alt,
-        "shift": Key.shift,
+        "ctrl": "ctrl",
+        "alt": "alt",
+        "shift": "shift",
     }
 
     # テンキーの仮想キーコード (VK_NUMPAD0 = 0x60)
@@ -55,8 +282,17 @@ class HotkeyManager:
         "decimal": 0x6E,  # VK_DECIMAL (.)
     }
 
-    def __init__(self):
-        self.keyboard = Controller()
+    def __init__(self, sink: Optional[KeySink] = None,
+                 on_sent: Optional[Callable[[HotkeySendReport], None]] = None):
+        """
+        Args:
+            sink: キーの送信先 (省略時は PynputKeySink)
+            on_sent: 送信し終わるたびに送信スレッドから呼ばれる関数
+        """
+        self._sink = sink if sink is not None else PynputKeySink()
+        self._dispatcher = HotkeyDispatcher(self._sink, on_sent=on_sent)
+        self._dispatcher.start()
+        self._compiled: dict[str, tuple[KeyStep, ...]] = {}
         self._last_send_time: dict[str, float] = {}
 
     def parse_hotkey(self, hotkey_str: str) -> list:
@@ -67,35 +303,64 @@ class HotkeyManager:
             hotkey_str: "ctrl+shift+f5" 形式
         
         Returns:
-            キーのリスト
+            キーのリスト (("key", 名前) / ("vk", 仮想キーコード) / ("char", 文字))
         """
         parts = hotkey_str.lower().replace(" ", "").split("+")
         keys = []
         
         for part in parts:
             if part in self.KEY_MAP and self.KEY_MAP[part] is not None:
-                keys.append(self.KEY_MAP[part])
+                keys.append(("key", self.KEY_MAP[part]))
             elif part in self.NUMPAD_VK:
                 # テンキーは仮想キーコードで処理
                 keys.append(("vk", self.NUMPAD_VK[part]))
             elif len(part) == 1:
                 # 単一文字キー
-                keys.append(part)
+                keys.append(("char", part))
             else:
                 print(f"未知のキー: {part}")
         
         return keys
 
-    def send_hotkey(self, hotkey_str: str, cooldown_ms: int = 0) -> bool:
+    def compile_hotkey(self, hotkey_str: str) -> tuple[KeyStep, ...]:
+        """
+        ホットキー文字列をキー操作の列に変換 (1回変換したら使い回す)
+        
+        修飾キーを押す -> 通常キーを押して離す -> 修飾キーを離す (逆順)
+        """
+        steps = self._compiled.get(hotkey_str)
+        if steps is not None:
+            return steps
+        
+        keys = self.parse_hotkey(hotkey_str)
+        modifiers = [k for k in keys if k[0] == "key" and k[1] in MODIFIER_KEYS]
+        regular_keys = [k for k in keys if k not in modifiers]
+        
+        compiled = [KeyStep(KEY_DOWN, mod) for mod in modifiers]
+        for key in regular_keys:
+            # 仮想キーコードは押しっぱなしの時間を取る
+            hold = VK_HOLD_SECONDS if key[0] == "vk" else 0.0
+            compiled.append(KeyStep(KEY_DOWN, key, hold))
+            compiled.append(KeyStep(KEY_UP, key))
+        compiled.extend(KeyStep(KEY_UP, mod) for mod in reversed(modifiers))
+        
+        steps = tuple(compiled)
+        self._compiled[hotkey_str] = steps
+        return steps
+
+    def queue_hotkey(self, hotkey_str: str, cooldown_ms: int = 0) -> bool:
         """
-        ホットキーを送信
+        ホットキーの送信を予約 (送信スレッドに任せてすぐ戻る)
+        
+        実際に送れたかどうかはまだ分からない。送り終わったら on_sent に
+        HotkeySendReport が渡される (失敗していたら error が入る)。
         
         Args:
             hotkey_str: ホットキー文字列
             cooldown_ms: クールダウン時間 (ミリ秒)
         
         Returns:
-            送信成功したか (クールダウン中はFalse)
+            予約を受け付けたか (クールダウン中・未知のキーはFalse)
         """
         # クールダウンチェック
         now = time.time()
@@ -104,70 +369,30 @@ class HotkeyManager:
             if elapsed_ms < cooldown_ms:
                 return False
         
-        keys = self.parse_hotkey(hotkey_str)
-        if not keys:
+        steps = self.compile_hotkey(hotkey_str)
+        if not steps:
             return False
         
-        try:
-            self._send_keys(keys)
-            self._last_send_time[hotkey_str] = now
-            return True
-        except Exception as e:
-            print(f"ホットキー送信エラー: {e}")
-            return False
+        self._dispatcher.submit(hotkey_str, steps)
+        self._last_send_time[hotkey_str] = now
+        return True
 
-    def _send_keys(self, keys: list):
-        """キーを送信 (内部用)"""
-        import ctypes
-        
-        # 修飾キーを押す
-        modifiers = []
-        regular_keys = []
-        
-        for key in keys:
-            if isinstance(key, Key) and key in (Key.ctrl, Key.alt, Key.shift):
-                modifiers.append(key)
-            else:
-                regular_keys.append(key)
-        
-        # 修飾キーを押す
-        for mod in modifiers:
-            self.keyboard.press(mod)
-        
-        # 通常キーを押す
-        for key in regular_keys:
-            if isinstance(key, tuple) and key[0] == "vk":
-                # 仮想キーコードを使用
-                self._send_vk(key[1])
-            elif isinstance(key, Key):
-                self.keyboard.press(key)
-                self.keyboard.release(key)
-            else:
-                self.keyboard.press(key)
-                self.keyboard.release(key)
-        
-        # 修飾キーを離す (逆順)
-        for mod in reversed(modifiers):
-            self.keyboard.release(mod)
+    @property
+    def last_report(self) -> Optional[HotkeySendReport]:
+        """直近に送信し終わったホットキーの記録"""
+        reports = self._dispatcher.reports
+        return reports[-1] if reports else None
 
-    def _send_vk(self, vk_code: int):
-        """仮想キーコードでキーを送信 (keybd_event使用)"""
-        import ctypes
-        
-        user32 = ctypes.windll.user32
-        
-        # スキャンコード取得
-        scan_code = user32.MapVirtualKeyW(vk_code, 0)
-        
-        # keybd_event(bVk, bScan, dwFlags, dwExtraInfo)
-        # KEYEVENTF_EXTENDEDKEY = 0x0001
-        # KEYEVENTF_KEYUP = 0x0002
-        
-        # キーダウン
-        user32.keybd_event(vk_code, scan_code, 0, 0)
-        time.sleep(0.05)
-        # キーアップ
-        user32.keybd_event(vk_code, scan_code, 0x0002, 0)
+    def stats(self) -> dict[str, float]:
+        """送信の遅延の統計"""
+        return self._dispatcher.stats()
+
+    def flush(self, timeout: float = 2.0) -> bool:
+        """予約済みのホットキーを送り終わるまで待つ"""
+        return self._dispatcher.flush(timeout)
+
+    def close(self):
+        self._dispatcher.stop()
 
 
 # 使用可能なホットキーの一覧
@@ -196,3 +421,22 @@ AVAILABLE_HOTKEYS = [
     # 記号 (一部)
     "-", "=", "[", "]", "\\", ";", "'", ",", ".", "/",
 ]
+
+
+if __name__ == "__main__":
+    # キーを送らずに、送信スレッドの遅延だけを測ります
+    sink = RecordingKeySink()
+    manager = HotkeyManager(sink=sink)
+    count = 200
+    started = time.perf_counter()
+    for i in range(count):
+        manager.queue_hotkey("ctrl+f11")
+    enqueue_elapsed = time.perf_counter() - started
+    manager.flush()
+    manager.close()
+
+    stats = manager.stats()
+    print(f"{count}回の送信予約: {enqueue_elapsed * 1000:.3f}ms "
+          f"(1回 {enqueue_elapsed / count * 1e6:.1f}us)")
+    print(f"遅延: 平均 {stats['mean_latency_ms']:.3f}ms / 最大 {stats['max_latency_ms']:.3f}ms "
+          f"/ キー操作 {len(sink.events)}回")
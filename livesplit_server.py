@@ -0,0 +1,437 @@
+"""
+AutoSplit GIEEE - LiveSplit Server クライアント
+LiveSplit Server コンポーネントにTCPでコマンドを送る (キー入力を使わない送信方法)
+"""
+import select
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+
+# パターンごとの送信方法
+TRANSPORT_HOTKEY = "hotkey"  # ホットキー (キー入力)
+TRANSPORT_LIVESPLIT_SERVER = "livesplit_server"  # LiveSplit Server (TCP)
+TRANSPORTS = (TRANSPORT_HOTKEY, TRANSPORT_LIVESPLIT_SERVER)
+
+# LiveSplit Server のコマンド
+CMD_START_OR_SPLIT = "startorsplit"
+CMD_PAUSE_GAME_TIME = "pausegametime"
+CMD_UNPAUSE_GAME_TIME = "unpausegametime"
+CMD_GET_GAME_TIME = "getcurrentgametime"
+CMD_SET_GAME_TIME = "setgametime"
+
+DEFAULT_PORT = 16834  # LiveSplit Server の既定ポート
+RECONNECT_INTERVAL = 2.0  # 再接続を試す間隔 (秒)
+
+_IDLE = object()  # 送るものがないまま RECONNECT_INTERVAL 経った
+
+
+@dataclass
+class ServerCommandReport:
+    """コマンド1回分の送信記録"""
+    command: str
+    enqueued_at: float  # キューに入れた時刻 (time.perf_counter)
+    sent_at: float = 0.0  # ソケットに書き込んだ時刻
+    response: Optional[str] = None  # 応答 (問い合わせのみ)
+    responded_at: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def latency(self) -> float:
+        """キューに入れてから送信するまでの時間 (秒)"""
+        return self.sent_at - self.enqueued_at
+
+    @property
+    def round_trip(self) -> float:
+        """問い合わせの往復時間 (秒)"""
+        return self.responded_at - self.sent_at
+
+
+class _Request:
+    """問い合わせの応答待ち"""
+
+    def __init__(self, report: ServerCommandReport):
+        self.report = report
+        self.done = threading.Event()
+        self.abandoned = False  # 呼び出し側が待つのをやめた (もう送らなくてよい)
+
+
+class _GameTimeAdjustment:
+    """ゲームタイムの補正 (今のゲームタイムを問い合わせて delta 秒ずらす)"""
+
+    def __init__(self, delta: float):
+        self.delta = delta
+
+
+class LiveSplitServerClient(threading.Thread):
+    """
+    LiveSplit Server との接続を張りっぱなしにして、専用スレッドからコマンドを送る
+
+    接続が切れていたら RECONNECT_INTERVAL ごとに張り直す。
+    send() はキューに入れてすぐ戻るので、監視スレッドが接続待ちでブロックされることはない。
+
+    コマンド (send / adjust_game_time) と問い合わせ (query) は別のキューに入れて、
+    コマンドが残っている間は問い合わせを送らない。問い合わせは失敗しても送り直さないので、
+    タイマー状態の問い合わせでスプリットが遅れることはない。
+    """
+
+    def __init__(self, host: str = "localhost", port: int = DEFAULT_PORT,
+                 timeout: float = 1.0, history: int = 100):
+        super().__init__(daemon=True)
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._commands: deque = deque()  # (ServerCommandReport, None / _GameTimeAdjustment)
+        self._queries: deque[_Request] = deque()
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+        self._next_connect = 0.0
+        self._running = True
+        self.reports: deque[ServerCommandReport] = deque(maxlen=history)
+        self.connects = 0  # 接続した回数
+        self.failures = 0  # 送信に失敗した回数
+
+    @property
+    def connected(self) -> bool:
+        return self._sock is not None
+
+    def send(self, command: str) -> bool:
+        """コマンドを送信する (すぐ戻る)"""
+        if not self._running:
+            return False
+        self._put_command(ServerCommandReport(command, time.perf_counter()), None)
+        return True
+
+    def adjust_game_time(self, delta: float) -> bool:
+        """
+        ゲームタイムを delta 秒ずらす (すぐ戻る)
+
+        送信スレッドで getcurrentgametime を問い合わせて setgametime で設定し直す。
+        問い合わせと設定の間もゲームタイムが進まないように、pausegametime で止めている間に呼ぶこと。
+        """
+        if not self._running:
+            return False
+        report = ServerCommandReport(CMD_GET_GAME_TIME, time.perf_counter())
+        self._put_command(report, _GameTimeAdjustment(delta))
+        return True
+
+    def _put_command(self, report: ServerCommandReport,
+                     adjustment: Optional[_GameTimeAdjustment]):
+        with self._cond:
+            self._commands.append((report, adjustment))
+            self._cond.notify()
+
+    def query(self, command: str, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        応答のあるコマンドを送って応答を待つ
+
+        Returns:
+            応答の1行 (接続できない・タイムアウトならNone)
+        """
+        if not self._running:
+            return None
+        request = _Request(ServerCommandReport(command, time.perf_counter()))
+        with self._cond:
+            self._queries.append(request)
+            self._cond.notify()
+        if not request.done.wait(self.timeout if timeout is None else timeout):
+            request.abandoned = True
+            return None
+        return request.report.response
+
+    def _next_item(self):
+        """
+        次に送るものを取り出す (コマンドが先)
+
+        Returns:
+            (ServerCommandReport, None / _GameTimeAdjustment) / _Request /
+            _IDLE (しばらく何もない) / None (止めるとき)
+        """
+        with self._cond:
+            while True:
+                if self._commands:
+                    return self._commands.popleft()
+                if not self._running:
+                    return None
+                while self._queries:
+                    request = self._queries.popleft()
+                    if not request.abandoned:
+                        return request
+                if not self._cond.wait(RECONNECT_INTERVAL):
+                    return _IDLE
+
+    def run(self):
+        while True:
+            item = self._next_item()
+            if item is None:
+                break
+            if item is _IDLE:
+                # 暇なうちに接続しておく
+                self._ensure_connected()
+            elif isinstance(item, _Request):
+                self._process(item.report, wants_response=True, retry=False)
+                self.reports.append(item.report)
+                item.done.set()
+            else:
+                report, adjustment = item
+                self._process(report, wants_response=adjustment is not None)
+                self.reports.append(report)
+                if adjustment is not None:
+                    self._set_adjusted_game_time(report, adjustment.delta)
+        # 残っている問い合わせは待たせない
+        with self._cond:
+            for request in self._queries:
+                request.done.set()
+            self._queries.clear()
+        self._disconnect()
+
+    def _set_adjusted_game_time(self, report: ServerCommandReport, delta: float):
+        """問い合わせたゲームタイムを delta 秒ずらして設定する"""
+        current = parse_time(report.response) if report.error is None else None
+        if current is None:
+            print(f"ゲームタイムを補正できませんでした (応答: {report.response or report.error})")
+            return
+        target = max(0.0, current + delta)
+        set_report = ServerCommandReport(f"{CMD_SET_GAME_TIME} {format_time(target, 3)}",
+                                         time.perf_counter())
+        self._process(set_report, False)
+        self.reports.append(set_report)
+
+    def _process(self, report: ServerCommandReport, wants_response: bool, retry: bool = True):
+        # 切れていたら1回だけ張り直して送り直す (問い合わせは送り直さない)
+        for _ in range(2 if retry else 1):
+            if not self._ensure_connected():
+                report.error = "接続できません"
+                break
+            try:
+                self._sock.sendall(f"{report.command}\r\n".encode("utf-8"))
+                report.sent_at = time.perf_counter()
+                if wants_response:
+                    line = self._reader.readline()
+                    if not line:
+                        raise ConnectionError("接続が切れました")
+                    report.response = line.decode("utf-8").strip()
+                    report.responded_at = time.perf_counter()
+                report.error = None
+                return
+            except OSError as e:
+                report.error = str(e)
+                self._disconnect()
+                # すぐに張り直してよい
+                self._next_connect = 0.0
+        self.failures += 1
+
+    def _ensure_connected(self) -> bool:
+        if self._sock is not None and self._peer_closed():
+            # LiveSplitが閉じられた -> 書き込む前に気づいて張り直す
+            self._disconnect()
+            self._next_connect = 0.0
+        if self._sock is not None:
+            return True
+        now = time.perf_counter()
+        if now < self._next_connect:
+            return False
+        self._next_connect = now + RECONNECT_INTERVAL
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            return False
+        self._sock = sock
+        self._reader = sock.makefile("rb")
+        self.connects += 1
+        return True
+
+    def _peer_closed(self) -> bool:
+        """相手が接続を閉じたか (読めるデータがEOFなら閉じている)"""
+        try:
+            readable, _, _ = select.select([self._sock], [], [], 0)
+            if not readable:
+                return False
+            return self._sock.recv(1, socket.MSG_PEEK) == b""
+        except OSError:
+            return True
+
+    def _disconnect(self):
+        if self._sock is not None:
+            try:
+                self._reader.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._reader = None
+
+    def stop(self, timeout: float = 2.0):
+        """送っていないコマンドを送り終えてから止める (問い合わせは捨てる)"""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self.is_alive():
+            self.join(timeout)
+
+    def stats(self) -> dict[str, float]:
+        """直近の送信の遅延と往復時間"""
+        sent = [r for r in self.reports if r.error is None]
+        latencies = [r.latency for r in sent]
+        round_trips = [r.round_trip for r in sent if r.response is not None]
+        return {
+            "sent": len(sent),
+            "failures": self.failures,
+            "connects": self.connects,
+            "mean_latency_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+            "mean_round_trip_ms": sum(round_trips) / len(round_trips) * 1000 if round_trips else 0.0,
+        }
+
+
+class _StandInHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server: "StandInLiveSplitServer" = self.server
+        server.connections.append(self.connection)
+        for line in self.rfile:
+            command = line.decode("utf-8").strip()
+            if not command:
+                continue
+            server.commands.append((time.perf_counter(), command))
+            response = server.respond(command)
+            if response is not None:
+                self.wfile.write(f"{response}\r\n".encode("utf-8"))
+                self.wfile.flush()
+
+
+class StandInLiveSplitServer(socketserver.ThreadingTCPServer):
+    """
+    テスト・ベンチマーク用の LiveSplit Server の代わり
+
+    受け取ったコマンドを (受信時刻, コマンド) で commands に記録し、
+    タイマーの状態を簡単に真似して問い合わせに答える。
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _StandInHandler)
+        self.commands: list[tuple[float, str]] = []
+        self.connections: list[socket.socket] = []
+        self.phase = "NotRunning"
+        self.game_time_paused = False
+        self.split_index = -1
+        self._started_at = 0.0
+        self._game_time_base = 0.0  # 最後に止めた (設定した) ときのゲームタイム
+        self._game_time_since = 0.0  # ゲームタイムが進み始めた時刻
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def respond(self, command: str) -> Optional[str]:
+        """コマンドを反映して応答を返す (応答のないコマンドはNone)"""
+        name, _, argument = command.partition(" ")
+        now = time.perf_counter()
+        if name == CMD_START_OR_SPLIT:
+            if self.phase == "NotRunning":
+                self.phase = "Running"
+                self._started_at = now
+                self._game_time_base = 0.0
+                self._game_time_since = now
+            self.split_index += 1
+        elif name == CMD_PAUSE_GAME_TIME:
+            if not self.game_time_paused:
+                self._game_time_base = self.game_time(now)
+            self.game_time_paused = True
+        elif name == CMD_UNPAUSE_GAME_TIME:
+            if self.game_time_paused:
+                self._game_time_since = now
+            self.game_time_paused = False
+        elif name == CMD_SET_GAME_TIME:
+            value = parse_time(argument)
+            if value is not None:
+                self._game_time_base = value
+                self._game_time_since = now
+        elif name == CMD_GET_GAME_TIME:
+            return format_time(self.game_time(now))
+        elif name == "getcurrenttimerphase":
+            return self.phase
+        elif name == "getsplitindex":
+            return str(self.split_index)
+        elif name == "getcurrenttime":
+            elapsed = time.perf_counter() - self._started_at if self.phase != "NotRunning" else 0.0
+            return format_time(elapsed)
+        return None
+
+    def game_time(self, now: Optional[float] = None) -> float:
+        """今のゲームタイム (秒)"""
+        if self.phase == "NotRunning":
+            return 0.0
+        if self.game_time_paused:
+            return self._game_time_base
+        if now is None:
+            now = time.perf_counter()
+        return self._game_time_base + now - self._game_time_since
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """サーバーを止めて、つながっているクライアントも切断する"""
+        self.shutdown()
+        self.server_close()
+        for conn in self.connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def format_time(seconds: float, decimals: int = 2) -> str:
+    """秒を LiveSplit Server の時刻表記 (H:MM:SS.ff) にする"""
+    minutes, secs = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return f"{hours}:{minutes:02d}:{secs:0{decimals + 3}.{decimals}f}"
+
+
+def parse_time(text: Optional[str]) -> Optional[float]:
+    """LiveSplit Server の時刻表記 (H:MM:SS.ff / M:SS.ff / SS.ff) を秒にする (読めなければNone)"""
+    if not text:
+        return None
+    seconds = 0.0
+    try:
+        for part in text.strip().split(":"):
+            seconds = seconds * 60 + float(part)
+    except ValueError:
+        return None
+    return seconds
+
+
+if __name__ == "__main__":
+    # 代わりのサーバーを立てて、送信の遅延と往復時間を測ります
+    server = StandInLiveSplitServer()
+    server.start()
+    client = LiveSplitServerClient("127.0.0.1", server.port)
+    client.start()
+
+    count = 200
+    for i in range(count):
+        client.send(CMD_START_OR_SPLIT)
+    phase = client.query("getcurrenttimerphase")
+    time.sleep(0.2)
+
+    client.stop()
+    server.stop()
+
+    stats = client.stats()
+    received = [t for t, c in server.commands if c == CMD_START_OR_SPLIT]
+    enqueued = [r.enqueued_at for r in client.reports if r.command == CMD_START_OR_SPLIT]
+    delays = [(t - e) * 1000 for t, e in zip(received, enqueued)]
+    print(f"{len(received)}/{count}コマンド受信 / タイマー状態: {phase}")
+    print(f"送信まで: 平均 {stats['mean_latency_ms']:.3f}ms / "
+          f"サーバー到着まで: 平均 {sum(delays) / len(delays):.3f}ms 最大 {max(delays):.3f}ms / "
+          f"往復: {stats['mean_round_trip_ms']:.3f}ms")
@@ -0,0 +1,259 @@
+"""
+AutoSplit GIEEE - ロード状態管理
+検知結果からロード開始/終了を判定して、ホットキー送信とCSV記録を行う (Qtに依存しない)
+"""
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from config import AppConfig, PatternConfig
+from detector import DetectionResult
+from livesplit_server import (
+    TRANSPORT_LIVESPLIT_SERVER, CMD_START_OR_SPLIT, CMD_PAUSE_GAME_TIME, CMD_UNPAUSE_GAME_TIME
+)
+
+
+# イベントの種類
+EVENT_LOAD_START = "load_start"  # ロード開始確定
+EVENT_LOAD_END = "load_end"  # ロード終了
+EVENT_SPLIT = "split"  # ホットキー送信
+
+# 状態 (フライトレコーダー用)
+STATE_IDLE = 0  # 検知なし
+STATE_PENDING = 1  # 検知したが確定待ち
+STATE_LOADING = 2  # ロード中
+
+# ロードの境界をどこに置くか
+BOUNDARY_FRAME = "frame"  # 状態が変わった最初のフレームの時刻
+BOUNDARY_MIDPOINT = "midpoint"  # 変わる前の最後のフレームと変わった最初のフレームの中間
+BOUNDARY_MODES = (BOUNDARY_FRAME, BOUNDARY_MIDPOINT)
+
+
+@dataclass
+class LoadEvent:
+    """GUIに知らせる状態変化"""
+    kind: str
+    time: float  # イベントの時刻 (time.perf_counter、フレームのキャプチャ時刻基準)
+    pattern: Optional[PatternConfig] = None
+    duration: float = 0.0  # load_end: ロード時間 (秒)
+    error: float = 0.0  # time / duration の誤差の上限 (秒)
+    hotkey_count: int = 0  # これまでのホットキー送信回数
+    segment_time: float = 0.0  # split: 区間タイム (秒)
+    load_time: float = 0.0  # split: 区間内のロード時間合計 (秒)
+
+
+def boundary_time(before: Optional[float], after: float, mode: str) -> tuple[float, float]:
+    """
+    状態が切り替わった時刻とその誤差の上限
+
+    本当の切り替わりは before (変わる前の最後のフレーム) と after (変わった最初のフレーム) の間のどこか。
+
+    Args:
+        before: 変わる前の最後のフレームの時刻 (不明ならNone)
+        after: 変わった最初のフレームの時刻
+        mode: BOUNDARY_FRAME / BOUNDARY_MIDPOINT
+
+    Returns:
+        (境界の時刻, 誤差の上限)
+    """
+    if before is None or before >= after:
+        return after, 0.0
+    gap = after - before
+    if mode == BOUNDARY_MIDPOINT:
+        return before + gap / 2, gap / 2
+    return after, gap
+
+
+class LoadStateMachine:
+    """
+    検知結果を1フレームずつ受け取り、ロード状態を管理する
+
+    - min_duration_ms 以上続けて検知されたらロード開始を確定 (開始時刻は検知開始フレームの時刻)
+    - ロード開始確定時にクールダウンを確認してホットキーを送信し、ロガーに記録
+    - 検知が途切れたらロード終了としてロード時間をロガーに積み立て
+    - 送信方法が LiveSplit Server のパターンは、ホットキーの代わりに startorsplit を送り、
+      ロード中は pausegametime / unpausegametime でゲームタイムを止める
+      (止めるのはロード開始の確定時なので、ロード終了時に setgametime で
+      確定待ちの間に進んだ分を戻す)
+
+    時刻はすべてフレームのキャプチャ時刻 (time.perf_counter) で扱うので、
+    スレッドやGUIの遅れはロード時間に入らない (誤差は1フレーム間隔以内)。
+
+    update() は状態が変わったときだけ LoadEvent のリストを返す。
+    """
+
+    def __init__(self, config: AppConfig,
+                 send_hotkey: Optional[Callable[[str], bool]] = None,
+                 logger=None, server=None):
+        """
+        Args:
+            config: アプリ設定
+            send_hotkey: ホットキー送信関数 (送信を受け付けたらTrue)。Noneなら送信せず成功扱い
+            logger: TodaysSplitLogger (任意)
+            server: LiveSplitServerClient (送信方法が LiveSplit Server のパターン用)
+        """
+        self.config = config
+        self._send_hotkey = send_hotkey
+        self._logger = logger
+        self._server = server
+
+        self.is_loading = False
+        self.load_start_time = 0.0
+        self.load_start_error = 0.0
+        self.load_pattern: Optional[PatternConfig] = None
+        self.hotkey_count = 0
+        self._pending_start: Optional[float] = None  # 検知開始フレームの時刻 (確定待ち)
+        self._pending_error = 0.0
+        self._last_frame_time: Optional[float] = None  # 直前のフレームの時刻
+        self._last_split_time: Optional[float] = None  # 前回送信した検知時刻 (クールダウン用)
+        self._game_time_paused = False  # pausegametime を送ったか
+        self._paused_at = 0.0  # pausegametime を送ったフレームの時刻
+
+    @property
+    def state(self) -> int:
+        """STATE_IDLE / STATE_PENDING / STATE_LOADING"""
+        if self.is_loading:
+            return STATE_LOADING
+        if self._pending_start is not None:
+            return STATE_PENDING
+        return STATE_IDLE
+
+    def update(self, detected: Optional[DetectionResult],
+               now: Optional[float] = None) -> list[LoadEvent]:
+        """
+        1フレーム分の検知結果を反映する
+
+        Args:
+            detected: 検知したパターンの結果 (なければNone)
+            now: フレームのキャプチャ時刻 (time.perf_counter。省略時は現在時刻)
+
+        Returns:
+            発生したイベントのリスト (状態が変わらなければ空)
+        """
+        if now is None:
+            now = time.perf_counter()
+        previous = self._last_frame_time
+        self._last_frame_time = now
+        events: list[LoadEvent] = []
+        mode = self.config.load_boundary_mode
+
+        if detected:
+            if self.is_loading:
+                # 既にロード中なら継続
+                return events
+            if self._pending_start is None:
+                # 初めて検知した -> 保留開始
+                self._pending_start, self._pending_error = boundary_time(previous, now, mode)
+
+            elapsed_ms = (now - self._pending_start) * 1000
+            if elapsed_ms >= self.config.min_duration_ms:
+                # ロード開始確定 (開始時刻は検知開始時刻にバックデート)
+                start = self._pending_start
+                self._pending_start = None
+                self.is_loading = True
+                self.load_start_time = start
+                self.load_start_error = self._pending_error
+                self.load_pattern = detected.pattern
+                events.append(LoadEvent(EVENT_LOAD_START, start, detected.pattern,
+                                        error=self.load_start_error,
+                                        hotkey_count=self.hotkey_count))
+                split = self._split(detected.pattern, start)
+                if split is not None:
+                    events.append(split)
+                self._game_time_paused = self._send_server(detected.pattern, CMD_PAUSE_GAME_TIME)
+                self._paused_at = now
+        else:
+            # 検知なし -> 保留はリセット
+            self._pending_start = None
+            if self.is_loading:
+                self.is_loading = False
+                end, end_error = boundary_time(previous, now, mode)
+                duration = end - self.load_start_time
+                error = self.load_start_error + end_error
+                if self._logger:
+                    self._logger.add_load_time(duration, error)
+                if self._game_time_paused:
+                    self._correct_game_time(end, now)
+                    self._game_time_paused = False
+                self._send_server(self.load_pattern, CMD_UNPAUSE_GAME_TIME)
+                events.append(LoadEvent(EVENT_LOAD_END, end, duration=duration, error=error,
+                                        hotkey_count=self.hotkey_count))
+
+        return events
+
+    def finish(self, now: Optional[float] = None) -> list[LoadEvent]:
+        """
+        監視を止めるときに呼ぶ。ロード中ならそこで終わったことにして止めたゲームタイムを戻す
+
+        unpausegametime を送らずに止めると LiveSplit のゲームタイムが止まったままになるため。
+        ロードの終わりは最後に見たフレームの時刻にする (ロガーには記録しない)。
+
+        Args:
+            now: 終了時刻 (省略時は直前のフレームの時刻、それもなければ現在時刻)
+
+        Returns:
+            発生したイベントのリスト (ロード中でなければ空)
+        """
+        self._pending_start = None
+        if not self.is_loading:
+            return []
+        if now is None:
+            now = self._last_frame_time if self._last_frame_time is not None else time.perf_counter()
+        self.is_loading = False
+        duration = now - self.load_start_time
+        if self._game_time_paused:
+            self._correct_game_time(now, now)
+            self._game_time_paused = False
+        self._send_server(self.load_pattern, CMD_UNPAUSE_GAME_TIME)
+        return [LoadEvent(EVENT_LOAD_END, now, duration=duration, error=self.load_start_error,
+                          hotkey_count=self.hotkey_count)]
+
+    def _split(self, pattern: PatternConfig, detection_time: float) -> Optional[LoadEvent]:
+        """クールダウンを確認してホットキーを送信し、ロガーに記録する"""
+        # 前回送信時の検知時刻と比較
+        if (self._last_split_time is not None
+                and (detection_time - self._last_split_time) * 1000 < self.config.cooldown_ms):
+            return None
+
+        if pattern.split_transport == TRANSPORT_LIVESPLIT_SERVER:
+            if not self._send_server(pattern, CMD_START_OR_SPLIT):
+                return None
+        elif self._send_hotkey is not None and not self._send_hotkey(pattern.hotkey):
+            return None
+
+        # 送信時刻ではなく「検知時刻」を基準に更新
+        self._last_split_time = detection_time
+        self.hotkey_count += 1
+
+        segment_time = load_time = 0.0
+        if self._logger:
+            # バックデートした時刻で記録する
+            segment_time, load_time = self._logger.record_split(split_time=detection_time)
+            print(f">>> Split! Segment: {segment_time:.2f}s, Load: {load_time:.2f}s")
+
+        return LoadEvent(EVENT_SPLIT, detection_time, pattern,
+                         error=self.load_start_error,
+                         hotkey_count=self.hotkey_count,
+                         segment_time=segment_time, load_time=load_time)
+
+    def _correct_game_time(self, end: float, now: float):
+        """
+        止めていた間のゲームタイムをロード時間に合わせる (unpausegametime の前に呼ぶ)
+
+        ゲームタイムは確定待ちの間 (検知開始〜確定) も進んでいて、
+        境界の時刻 end から検知が途切れたフレーム now までは止まったままなので、その差だけずらす。
+        """
+        delta = (now - end) - (self._paused_at - self.load_start_time)
+        if abs(delta) >= 0.001:
+            self._server.adjust_game_time(delta)
+
+    def _send_server(self, pattern: Optional[PatternConfig], command: str) -> bool:
+        """送信方法が LiveSplit Server のパターンならコマンドを送る"""
+        if pattern is None or pattern.split_transport != TRANSPORT_LIVESPLIT_SERVER:
+            return False
+        if self._server is None:
+            return False
+        return self._server.send(command)
+
+    def update_config(self, config: AppConfig):
+        self.config = config
@@ -8,14 +8,21 @@ import datetime
 import os
 import csv
 
+# CSVの形式。列を増やしたらバージョンを上げて、ファイル名を変える
+# (古い形式のファイルを読むツールが、知らない形式のファイルを読まないように)
+# v1 (ファイル名に _v なし): Segment_Time, Load_Time
+# v2: v1 の列の後ろに Load_Error
+CSV_VERSION = 2
+CSV_COLUMNS = ["Segment_Time", "Load_Time", "Load_Error"]
+
 class TodaysSplitLogger:
     """
     その日の区間タイムとロード時間をペアにして記録するクラス
     """
     def __init__(self, output_dir=None):
-        # ファイル名は日時で作る (例: 20260118_102030_GIEEE_split.csv)
+        # ファイル名は日時と形式のバージョンで作る (例: 20260118_102030_GIEEE_split_v2.csv)
         date_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{date_str}_GIEEE_split.csv"
+        filename = f"{date_str}_GIEEE_split_v{CSV_VERSION}.csv"
         
         # 出力先ディレクトリの指定があれば結合
         if output_dir:
@@ -32,31 +39,36 @@ class TodaysSplitLogger:
         # 状態管理用の変数
         self.last_split_time = None       # 前回のSplit時刻
         self.current_segment_load_time = 0.0 # 今の区間のロード時間合計
+        self.current_segment_load_error = 0.0 # 今の区間のロード時間の誤差の上限
         
         # ファイルの準備（ヘッダーがあったほうがExcelで見たとき分かりやすい）
         try:
             with open(self.filename, "w", encoding='utf-8', newline='') as f:
                 writer = csv.writer(f)
-                writer.writerow(["Segment_Time", "Load_Time"])
+                writer.writerow(CSV_COLUMNS)
             print(f"今日のカルテを用意しました: {self.filename}")
         except Exception as e:
             print(f"初期化エラー: {e}")
 
-    def start_timer(self):
+    def start_timer(self, start_time=None):
         """
         RTA開始時（最初のStart）に呼ぶ
+        start_time: 開始時刻 (time.perf_counter)。録画を解析するときは動画の時刻を渡す
         """
-        self.last_split_time = time.time()
+        self.last_split_time = start_time if start_time is not None else time.perf_counter()
         self.current_segment_load_time = 0.0
+        self.current_segment_load_error = 0.0
         print(">>> 計測開始！ (Logger)")
 
-    def add_load_time(self, duration):
+    def add_load_time(self, duration, error=0.0):
         """
         ロードが終わるたびに呼んで、時間を積み立てる
         duration: その1回のロードにかかった秒数
+        error: duration の誤差の上限 (秒)。フレーム間隔で決まる
         """
         if self.last_split_time is not None:
             self.current_segment_load_time += duration
+            self.current_segment_load_error += error
             # print(f"ロード時間を積み立て: +{duration:.3f}s (合計: {self.current_segment_load_time:.3f}s)")
 
     def record_split(self, split_time=None) -> tuple[float, float]:
@@ -64,11 +76,11 @@ class TodaysSplitLogger:
         Split（ホットキー送信）のタイミングで呼ぶ
         
         Args:
-            split_time: Splitした時刻 (Unix Timestamp). Noneの場合は現在時刻を使う
+            split_time: Splitした時刻 (time.perf_counter). Noneの場合は現在時刻を使う
                         誤検知フィルターで遅延した分を補正するために指定する
         
         1. 前回のSplitからの経過時間（区間タイム）を計算
-        2. 積み立てたロード時間と一緒に書き込み
+        2. 積み立てたロード時間 (と誤差の上限) と一緒に書き込み
         3. 次の区間のためにリセット
         
         Returns:
@@ -78,28 +90,29 @@ class TodaysSplitLogger:
             print("まだタイマーが始まっていません。start_timer() を呼んでください")
             return 0.0, 0.0
 
-        now = split_time if split_time is not None else time.time()
+        now = split_time if split_time is not None else time.perf_counter()
         
         # 区間タイム = 現在時刻 - 前回時刻
         segment_time = now - self.last_split_time
         load_time = self.current_segment_load_time
         
         # ファイルに書き込む
-        self._save_to_file(segment_time, load_time)
+        self._save_to_file(segment_time, load_time, self.current_segment_load_error)
         
         # --- 次の区間の準備 ---
         self.last_split_time = now
         self.current_segment_load_time = 0.0  # ロード時間はリセット
+        self.current_segment_load_error = 0.0
         
         return segment_time, load_time
 
-    def _save_to_file(self, segment, load):
+    def _save_to_file(self, segment, load, load_error=0.0):
         try:
             with open(self.filename, "a", encoding='utf-8', newline='') as f:
                 writer = csv.writer(f)
-                writer.writerow([f"{segment:.3f}", f"{load:.3f}"])
+                writer.writerow([f"{segment:.3f}", f"{load:.3f}", f"{load_error:.3f}"])
             
-            print(f"記録保存: 区間 {segment:.3f}秒 / ロード {load:.3f}秒")
+            print(f"記録保存: 区間 {segment:.3f}秒 / ロード {load:.3f}秒 (±{load_error:.3f}秒)")
         except Exception as e:
             print(f"書き込みエラー: {e}")
 
@@ -0,0 +1,428 @@
+"""
+AutoSplit GIEEE - 監視スレッド
+GUIに依存しないので、リプレイバックエンドと組み合わせればCI上でも動かせます
+"""
+import time
+import datetime
+from pathlib import Path
+import numpy as np
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from config import AppConfig, get_app_dir
+from capture import create_backend
+from roi import ROI_MODE_OFF, compute_roi_rects
+from frame_ring import FrameRing, CaptureProducer
+from detector import (
+    detect_all_patterns_frame, EvaluationStats, PatternHitTracker
+)
+from detection_engine import PlanCache, frame_regions, compute_area_means
+from timer_monitor import TimerMonitor, ServerTimerMonitor, TIMER_SOURCE_SERVER
+from load_state import LoadStateMachine
+from roi_recorder import RoiRecorder, FILE_SUFFIX
+from flight_recorder import FlightRecorder, STAGES, UNAVAILABLE
+from area_sampling import AreaSampler
+
+
+class MonitorThread(QThread):
+    """
+    画面をじっと見つめ続ける監視役スレッドです。
+    """
+    
+    detection_result = pyqtSignal(object)  # (detected, best) -> 何か見つけたら報告
+    load_event = pyqtSignal(object)  # LoadEvent -> ロード開始/終了/送信のときだけ報告
+    timer_status_changed = pyqtSignal(bool)  # True = 凍結中, False = 動いてる
+    error_occurred = pyqtSignal(str)
+    flight_dumped = pyqtSignal(str)  # フライトレコーダーを保存したファイルのパス
+    
+    def __init__(self, config: AppConfig, parent=None, send_hotkey=None, logger=None,
+                 livesplit_server=None):
+        super().__init__(parent)
+        self.config = config
+        self._running = False
+        self._capture = create_backend(config)
+        
+        # 表示用の結果は ui_refresh_hz に間引いて送ります (GUIが隠れてる間は送りません)
+        self.display_enabled = True
+        self._last_display_time = 0.0
+        
+        # ロード判定とホットキー送信はこのスレッドで直接行います (GUIが忙しくても遅れません)
+        self.load_state = LoadStateMachine(config, send_hotkey, logger, livesplit_server)
+        self._livesplit_server = livesplit_server
+        
+        # キャプチャスレッドとリングバッファ (run() で作ります)
+        self._ring = None
+        self._producer = None
+        
+        # 検知プラン (フレームサイズ/設定リビジョンごとにキャッシュ)
+        self._plans = PlanCache()
+        
+        # 早期終了モード用 (検知されやすい順の履歴と、省略したエリア数)
+        self._hit_tracker = PatternHitTracker()
+        self.evaluation_stats = EvaluationStats()
+        
+        # エリアの平均色を間引いて求める場合の設定と、全画素とのずれの記録 (間引かないなら None)
+        self.sampler = AreaSampler.from_config(config)
+        
+        # ROIキャプチャ用 (フレームサイズが変わったら作り直す)
+        self._roi_key = None
+        self._roi_rects = []
+        
+        # LiveSplitのタイマー監視 (ゲーム画面とは別スレッド・別周期で動きます)
+        self._timer_monitor = None
+        
+        # ROI録画 (recording_enabled のときだけ run() で作ります)
+        self._recorder = None
+        
+        # フライトレコーダー (直近の判定結果をずっと持っておきます)
+        self._flight = None
+        self._flight_key = None  # 今のフライトレコーダーの _flight_layout
+        self._stage_ms = np.zeros(len(STAGES), dtype=np.float32)  # 毎フレーム使い回します
+        self._dump_requested = False
+        
+        # 監視中に変わった設定 (監視スレッドが次のフレームの前に反映します)
+        self._pending_config = None
+    
+    @property
+    def is_timer_frozen(self) -> bool:
+        """LiveSplitのタイマーが止まってるかどうか"""
+        return self._timer_monitor is not None and self._timer_monitor.is_frozen
+    
+    def run(self):
+        self._running = True
+        self._capture.set_target_window(self.config.target_window)
+        
+        # LiveSplitもチェックするなら専用スレッドに任せます
+        self._start_timer_monitor()
+        
+        # 誤検知の原因を後で調べられるように、検知エリア周辺を録画します
+        if self.config.recording_enabled:
+            self._recorder = self._open_recorder()
+        if self.config.flight_recorder_enabled:
+            self._flight = self._create_flight_recorder()
+        self._flight_key = self._flight_layout(self.config)
+        
+        # キャプチャは専用スレッドに任せて、こっちは最新フレームを検知するだけにします
+        self._ring = FrameRing(self.config.frame_ring_size, self.config.frame_drop_policy)
+        self._start_producer()
+        
+        while self._running:
+            if self._pending_config is not None:
+                self._apply_config(self._pending_config)
+            if self._dump_requested:
+                self._dump_flight()
+            
+            slot = self._ring.take_latest(timeout=0.5)
+            if slot is None:
+                continue
+            
+            try:
+                taken = time.perf_counter()
+                # 指定のパターンがあるか探します
+                frame = slot.frame
+                # 一致率を表示しないフレームではベストマッチは求めません
+                need_best = self._display_due()
+                matched_counts = None
+                area_means = None
+                plan = None
+                flight_counts = flight_totals = None
+                if self.config.detection_engine == "integral":
+                    # 検知プランはウィンドウサイズか設定が変わったときだけ作り直します
+                    plan = self._plans.get(self.config, frame.size, frame.channel_order)
+                    if self._flight is not None and self._flight.thumbnails is not None:
+                        # 平均色もフライトレコーダーに残したいので、途中の結果をもらいます
+                        area_means = compute_area_means(frame, plan.boxes)
+                        matched_counts = plan.count_matches(frame, area_means)
+                    else:
+                        matched_counts = plan.count_matches(frame, sampler=self.sampler)
+                    detected, best = plan.results_from_counts(matched_counts, need_best)
+                    flight_counts, flight_totals = matched_counts, plan.totals
+                else:
+                    # フライトレコーダー用にパターンごとの結果ももらいます
+                    pattern_results = [] if self._flight is not None else None
+                    detected, best = detect_all_patterns_frame(
+                        frame,
+                        self.config.patterns,
+                        self.config.area_size,
+                        fast=self.config.fast_evaluation,
+                        need_best=need_best,
+                        tracker=self._hit_tracker,
+                        stats=self.evaluation_stats,
+                        sampler=self.sampler,
+                        results_out=pattern_results
+                    )
+                    if pattern_results is not None:
+                        flight_counts, flight_totals = self._area_counts(pattern_results)
+                detected_at = time.perf_counter()
+                
+                # ロード判定 -> 確定したらここでホットキー送信まで済ませます
+                # 時刻はGUIに届いた時刻ではなくフレームをキャプチャした時刻を使います
+                for event in self.load_state.update(detected, slot.timestamp):
+                    self.load_event.emit(event)
+                
+                if self._flight is not None:
+                    stage_ms = self._stage_ms
+                    stage_ms[0] = slot.capture_seconds * 1000
+                    stage_ms[1] = (taken - slot.committed_at) * 1000
+                    stage_ms[2] = (detected_at - taken) * 1000
+                    stage_ms[3] = (time.perf_counter() - detected_at) * 1000
+                    self._flight.record(
+                        slot.timestamp, self.load_state.state, stage_ms,
+                        flight_counts, flight_totals, area_means
+                    )
+                
+                if need_best:
+                    self._last_display_time = time.perf_counter()
+                    self.detection_result.emit((detected, best))
+                
+                if self._recorder is not None:
+                    self._record(frame, slot.timestamp, matched_counts)
+                
+            except Exception as e:
+                self.error_occurred.emit(f"何かエラーが起きちゃいました: {str(e)}")
+            finally:
+                self._ring.release(slot)
+        
+        # ロード中に止めたら、LiveSplitのゲームタイムを止めたままにしないよう戻しておきます
+        for event in self.load_state.finish():
+            self.load_event.emit(event)
+        self._producer.stop()
+        self._stop_timer_monitor()
+        if self.sampler is not None:
+            print(self.sampler.summary())
+        if self._recorder is not None:
+            self._recorder.close()
+            print(f"ROI録画: {self._recorder.frames}フレーム保存しました ({self._recorder.path})")
+            self._recorder = None
+        if self._dump_requested:
+            self._dump_flight()
+    
+    def request_flight_dump(self):
+        """フライトレコーダーの中身を保存します (監視スレッドが次のフレームの前に書き出します)"""
+        if not self.isRunning():
+            self._dump_flight()
+            return
+        self._dump_requested = True
+    
+    def _create_flight_recorder(self):
+        """直近 flight_recorder_seconds 秒分のフライトレコーダーを作ります"""
+        max_areas = sum(len(p.areas) for p in self.config.patterns)
+        recorder = FlightRecorder.for_duration(
+            self.config.flight_recorder_seconds,
+            self.config.check_interval_ms,
+            [p.name for p in self.config.patterns],
+            max_areas=max_areas,
+            thumbnails=self.config.flight_recorder_thumbnails
+        )
+        print(f"フライトレコーダー: {recorder.capacity}フレーム分 ({recorder.byte_count / 1024:.0f}KB)")
+        return recorder
+    
+    def _update_sampler(self, config: AppConfig):
+        """間引きサンプリングの設定が変わったら作り直します (変わらなければ誤差の記録を続けます)"""
+        sampler = self.sampler
+        current = None if sampler is None else (
+            sampler.step, sampler.pattern, sampler.base_margin, sampler.audit_frames
+        )
+        wanted = None if config.area_sampling_step <= 1 else (
+            config.area_sampling_step, config.area_sampling_pattern,
+            config.area_sampling_margin, config.area_sampling_audit_frames
+        )
+        if wanted == current:
+            return
+        if sampler is not None and self._running:
+            print(sampler.summary())
+        self.sampler = AreaSampler.from_config(config)
+    
+    @staticmethod
+    def _flight_layout(config: AppConfig) -> tuple:
+        """フライトレコーダーの配列の形を決める設定 (変わったら作り直すので、それまでの記録は消えます)"""
+        return (
+            config.flight_recorder_enabled,
+            config.flight_recorder_seconds,
+            config.check_interval_ms,
+            config.flight_recorder_thumbnails,
+            tuple((p.name, len(p.areas)) for p in config.patterns),
+        )
+    
+    def _area_counts(self, results) -> tuple[np.ndarray, np.ndarray]:
+        """エリア方式のパターンごとの結果を、フライトレコーダー用の一致エリア数とエリア数にします"""
+        matched = np.full(len(results), UNAVAILABLE, dtype=np.int32)
+        totals = np.array([len(p.areas) if p.enabled else 0 for p in self.config.patterns],
+                          dtype=np.int32)
+        for i, result in enumerate(results):
+            if result is not None:
+                # 途中で打ち切ったパターン (None) は数えていないので UNAVAILABLE のまま
+                matched[i] = result.matched_areas
+        return matched, totals
+    
+    def _dump_flight(self):
+        self._dump_requested = False
+        if self._flight is None or self._flight.count == 0:
+            self.error_occurred.emit("フライトレコーダーにまだ何も記録されていません")
+            return
+        folder = Path(self.config.flight_recorder_path) if self.config.flight_recorder_path else get_app_dir() / "flight"
+        try:
+            path = self._flight.dump(folder)
+        except OSError as e:
+            self.error_occurred.emit(f"フライトレコーダーを保存できませんでした: {e}")
+            return
+        self.flight_dumped.emit(str(path))
+    
+    def _open_recorder(self):
+        """ROI録画ファイルを作ります"""
+        folder = Path(self.config.recording_path) if self.config.recording_path else get_app_dir() / "recordings"
+        try:
+            folder.mkdir(parents=True, exist_ok=True)
+            name = datetime.datetime.now().strftime("%Y%m%d_%H%M%S") + f"_GIEEE_roi{FILE_SUFFIX}"
+            return RoiRecorder(
+                folder / name,
+                [p.name for p in self.config.patterns],
+                max_bytes=self.config.recording_max_mb * 1024 * 1024,
+                compress=self.config.recording_compression
+            )
+        except (OSError, ValueError) as e:
+            self.error_occurred.emit(f"録画ファイルを作れませんでした: {e}")
+            return None
+    
+    def _record(self, frame, timestamp, matched_counts):
+        """検知エリア周辺のピクセルと判定結果を録画ファイルに追記します"""
+        plan = self._plans.get(self.config, frame.size, frame.channel_order)
+        totals = plan.totals if matched_counts is not None else None
+        self._recorder.append(timestamp, frame.size, frame_regions(frame, plan.boxes),
+                              matched_counts, totals)
+        if self._recorder.full:
+            print(f"ROI録画: 上限 {self.config.recording_max_mb}MB に達したので録画を止めます")
+            self._recorder.close()
+            self._recorder = None
+    
+    def _display_due(self) -> bool:
+        """このフレームの結果をGUIに送るかどうか"""
+        if not self.display_enabled or self.receivers(self.detection_result) == 0:
+            return False
+        hz = self.config.ui_refresh_hz
+        if hz <= 0:
+            return True
+        return time.perf_counter() - self._last_display_time >= 1.0 / hz
+    
+    def _start_timer_monitor(self):
+        if self._timer_monitor is not None:
+            return
+        if self.config.timer_source == TIMER_SOURCE_SERVER:
+            # LiveSplit Server に聞きます (分割送信用の接続があれば使い回します)
+            self._timer_monitor = ServerTimerMonitor(
+                self.config, self.timer_status_changed.emit, self._livesplit_server,
+                on_error=self.error_occurred.emit
+            )
+        elif self.config.livesplit_window:
+            self._timer_monitor = TimerMonitor(self.config, self.timer_status_changed.emit,
+                                               on_error=self.error_occurred.emit)
+        else:
+            return
+        self._timer_monitor.start()
+    
+    def _stop_timer_monitor(self):
+        if self._timer_monitor is not None:
+            self._timer_monitor.stop()
+            self._timer_monitor = None
+    
+    def _grab_frame(self, out=None):
+        """ゲーム画面をキャプチャします (ROIモードなら検知エリア周辺だけ)"""
+        mode = self.config.roi_capture_mode
+        if mode == ROI_MODE_OFF:
+            return self._capture.capture_frame(out)
+        
+        size = self._capture.get_frame_size()
+        if size is None:
+            return None
+        
+        key = (size, mode, self.config.area_size)
+        if key != self._roi_key:
+            self._roi_rects = compute_roi_rects(
+                self.config.patterns, size, self.config.area_size, mode
+            )
+            self._roi_key = key
+        
+        if not self._roi_rects:
+            return self._capture.capture_frame(out)
+        return self._capture.capture_regions(self._roi_rects, size)
+    
+    def stop(self):
+        self._running = False
+        if self._ring is not None:
+            self._ring.close()
+        # タイムアウト付き待機 (2秒) -> ダメなら強制終了
+        if not self.wait(2000):
+            self.terminate()
+            self.wait()
+        self._stop_timer_monitor()
+        self._capture.close()
+    
+    def get_pipeline_stats(self) -> dict[str, float]:
+        """キャプチャ/検知パイプラインの統計 (フレーム落ちの確認用)"""
+        stats = self._ring.stats() if self._ring is not None else {}
+        if self._producer is not None:
+            stats["capture_failures"] = self._producer.failures
+            stats.update(self._producer.scheduler.stats())
+        return stats
+    
+    def _start_producer(self):
+        """キャプチャスレッドを作って動かします"""
+        self._producer = CaptureProducer(
+            self._ring, self._grab_frame, self.config.check_interval_ms,
+            on_error=self.error_occurred.emit, spin_ms=self.config.scheduler_spin_ms
+        )
+        self._producer.start()
+    
+    def update_config(self, config: AppConfig):
+        """
+        設定を変えます
+        
+        監視中はキャプチャスレッドがキャプチャを使っている最中かもしれないので、
+        ここでは預かるだけにして、監視スレッドが次のフレームの前に反映します。
+        """
+        config.bump_revision()
+        if self.isRunning():
+            self._pending_config = config
+            return
+        self._apply_config(config)
+    
+    def _apply_config(self, config: AppConfig):
+        """設定を反映します (監視中なら監視スレッドから呼びます)"""
+        self._pending_config = None
+        
+        # キャプチャやリングバッファを差し替える間はキャプチャスレッドを止めておきます
+        producer_running = self._producer is not None and self._producer.is_alive()
+        if producer_running:
+            self._producer.stop()
+        
+        if config.capture_backend != self.config.capture_backend:
+            self._capture.close()
+            self._capture = create_backend(config)
+        self.config = config
+        self.load_state.update_config(config)
+        self._roi_key = None
+        self._update_sampler(config)
+        if self._running and self._flight_layout(config) != self._flight_key:
+            # パターンや記録秒数が変わると配列の形が合わないので作り直します
+            self._flight = self._create_flight_recorder() if config.flight_recorder_enabled else None
+            self._flight_key = self._flight_layout(config)
+        self._capture.set_target_window(config.target_window)
+        
+        if producer_running:
+            if (self._ring.capacity, self._ring.policy) != (config.frame_ring_size, config.frame_drop_policy):
+                # 監視スレッドはスロットを持っていないので、そのまま作り直せます
+                self._ring = FrameRing(config.frame_ring_size, config.frame_drop_policy)
+            else:
+                # 前の設定 (ROI) でキャプチャしたフレームは新しいエリアを含まないかもしれないので捨てます
+                self._ring.discard_ready()
+            self._start_producer()
+        
+        # LiveSplitのウィンドウか取得元が変わったらタイマー監視を作り直します
+        if self._timer_monitor is not None:
+            old = self._timer_monitor.config
+            if (config.livesplit_window == old.livesplit_window
+                    and config.timer_source == old.timer_source):
+                self._timer_monitor.update_config(config)
+            else:
+                self._stop_timer_monitor()
+        if self._running:
+            self._start_timer_monitor()
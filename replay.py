@@ -0,0 +1,362 @@
+"""
+AutoSplit GIEEE - リプレイキャプチャモジュール
+録画済みのフレームをゲーム画面の代わりに再生する
+(ゲームもディスプレイもないCI環境での動作確認・計測用)
+"""
+import csv
+import importlib
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+from capture import CaptureBackend, register_backend
+from frame import Frame
+
+# 動画ファイルの読み込みは OpenCV があるときだけ (なくても他のソースは使える)
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+TIMESTAMP_FILE = "timestamps.csv"  # PNGフォルダ内のタイムスタンプ (filename, timestamp)
+DEFAULT_FPS = 20.0  # タイムスタンプがない場合のフレーム間隔
+
+
+class FrameSourceEnded(IndexError):
+    """
+    フレーム数より手前で読めなくなった
+
+    動画のフレーム数 (CAP_PROP_FRAME_COUNT) はヘッダーの推定値で、実際より多いことがある。
+    これを投げたソースは len() を読めたところまでに縮めているので、呼び出し側はそこで終わりにする。
+    """
+
+
+class FrameSource(ABC):
+    """録画フレームの読み出し元"""
+
+    @classmethod
+    @abstractmethod
+    def can_open(cls, path: Path) -> bool:
+        """このクラスで開けるパスならTrue"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """フレーム数"""
+
+    @abstractmethod
+    def timestamp(self, index: int) -> float:
+        """フレームの元のタイムスタンプ (秒)"""
+
+    @abstractmethod
+    def load(self, index: int) -> Image.Image:
+        """フレームを読み込む (読めなければ len() を縮めて FrameSourceEnded)"""
+
+    def load_frame(self, index: int) -> Frame:
+        """フレームを Frame として読み込む (変換せずに読めるソースは上書きする)"""
+        return Frame.from_image(self.load(index), self.timestamp(index))
+
+    def close(self):
+        pass
+
+
+# 登録済みのフレームソース (先に登録したものから順に試す)
+_FRAME_SOURCES: list[type[FrameSource]] = []
+
+
+def register_frame_source(cls: type[FrameSource]) -> type[FrameSource]:
+    """フレームソースを登録するデコレータ"""
+    _FRAME_SOURCES.append(cls)
+    return cls
+
+
+# 組み込みのフレームソースのうち、初回利用時に読み込むモジュール
+_BUILTIN_SOURCE_MODULES = ("roi_recorder",)
+
+
+def open_frame_source(path, fps: float = DEFAULT_FPS) -> FrameSource:
+    """パスに対応するフレームソースを開く"""
+    path = Path(path)
+    for module in _BUILTIN_SOURCE_MODULES:
+        importlib.import_module(module)
+    for cls in _FRAME_SOURCES:
+        if cls.can_open(path):
+            return cls(path, fps=fps)
+    raise ValueError(f"再生できないファイルです: {path}")
+
+
+@register_frame_source
+class ImageDirectorySource(FrameSource):
+    """
+    PNG連番フォルダ
+
+    フォルダ内に timestamps.csv (filename, timestamp) があればその時刻を使い、
+    なければ fps 間隔で並んでいるものとして扱う。
+    """
+
+    def __init__(self, path: Path, fps: float = DEFAULT_FPS):
+        self.path = path
+        files = sorted(path.glob("*.png"))
+        timestamps = self._read_timestamps(path / TIMESTAMP_FILE)
+
+        if timestamps:
+            files = [f for f in files if f.name in timestamps]
+            self._timestamps = [timestamps[f.name] for f in files]
+        else:
+            self._timestamps = [i / fps for i in range(len(files))]
+        self._files = files
+
+    @staticmethod
+    def _read_timestamps(csv_path: Path) -> dict[str, float]:
+        if not csv_path.exists():
+            return {}
+        timestamps = {}
+        with open(csv_path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.reader(f):
+                if len(row) < 2:
+                    continue
+                try:
+                    timestamps[row[0]] = float(row[1])
+                except ValueError:
+                    continue  # ヘッダー行
+        return timestamps
+
+    @classmethod
+    def can_open(cls, path: Path) -> bool:
+        return path.is_dir()
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def timestamp(self, index: int) -> float:
+        return self._timestamps[index]
+
+    def load(self, index: int) -> Image.Image:
+        with Image.open(self._files[index]) as img:
+            return img.convert("RGB")
+
+
+@register_frame_source
+class MultiFrameImageSource(FrameSource):
+    """
+    複数フレームを持つ画像ファイル (APNG / GIF / TIFF)
+
+    各フレームの duration (ms) から元のタイムスタンプを復元する。
+    """
+
+    SUFFIXES = (".png", ".apng", ".gif", ".tif", ".tiff")
+
+    def __init__(self, path: Path, fps: float = DEFAULT_FPS):
+        self.path = path
+        self._image = Image.open(path)
+        self._timestamps = []
+        t = 0.0
+        for frame in ImageSequence.Iterator(self._image):
+            self._timestamps.append(t)
+            duration = frame.info.get("duration")
+            t += (duration / 1000) if duration else (1 / fps)
+
+    @classmethod
+    def can_open(cls, path: Path) -> bool:
+        return path.is_file() and path.suffix.lower() in cls.SUFFIXES
+
+    def __len__(self) -> int:
+        return len(self._timestamps)
+
+    def timestamp(self, index: int) -> float:
+        return self._timestamps[index]
+
+    def load(self, index: int) -> Image.Image:
+        self._image.seek(index)
+        return self._image.convert("RGB")
+
+    def close(self):
+        self._image.close()
+
+
+@register_frame_source
+class VideoFileSource(FrameSource):
+    """
+    動画ファイル (OpenCV で読めるもの)
+
+    タイムスタンプは動画のフレームレートから求める。
+    順番に読むときはシークせずにデコードを続ける (少し先に飛ぶだけなら grab() で読み飛ばす)。
+    フレーム数はヘッダーの値を使い、途中で読めなくなったらそこまでに縮める。
+    """
+
+    SUFFIXES = (".mp4", ".mkv", ".mov", ".avi", ".webm", ".flv", ".ts")
+    MAX_GRAB_SKIP = 30  # これより先に飛ぶときはシークする
+
+    def __init__(self, path: Path, fps: float = DEFAULT_FPS):
+        self.path = path
+        self._capture = cv2.VideoCapture(str(path))
+        if not self._capture.isOpened():
+            raise ValueError(f"動画を開けませんでした: {path}")
+        self.fps = self._capture.get(cv2.CAP_PROP_FPS) or fps
+        self._count = int(self._capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        self._next: Optional[int] = 0  # 次にデコードされるフレーム番号 (分からなければNone)
+
+    @classmethod
+    def can_open(cls, path: Path) -> bool:
+        return cv2 is not None and path.is_file() and path.suffix.lower() in cls.SUFFIXES
+
+    def __len__(self) -> int:
+        return self._count
+
+    def timestamp(self, index: int) -> float:
+        return index / self.fps
+
+    def _read(self, index: int):
+        # 位置が分からなければシークする
+        skip = index - self._next if self._next is not None else -1
+        if 0 < skip <= self.MAX_GRAB_SKIP:
+            for _ in range(skip):
+                self._capture.grab()
+        elif skip != 0:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+        ok, pixels = self._capture.read()
+        if not ok:
+            # ヘッダーのフレーム数が多すぎた (or 壊れている) -> ここを終わりにする
+            self._count = min(self._count, index)
+            self._next = None  # どこまで進んだか分からないので次はシークする
+            raise FrameSourceEnded(f"フレーム {index} を読めませんでした: {self.path}")
+        self._next = index + 1
+        return pixels
+
+    def load(self, index: int) -> Image.Image:
+        return Image.fromarray(self._read(index)[:, :, ::-1], "RGB")
+
+    def load_frame(self, index: int) -> Frame:
+        # OpenCV は BGR 順なので並べ替えずにそのまま使う
+        return Frame(self._read(index), "BGR", self.timestamp(index))
+
+    def close(self):
+        self._capture.release()
+
+
+@register_backend("replay")
+class ReplayCapture(CaptureBackend):
+    """
+    録画フレームを再生するキャプチャバックエンド
+
+    rate=1.0 なら元のタイムスタンプ通りの間隔で、rate=2.0 なら2倍速で返す。
+    rate=0 なら待たずに次々と返す (ベンチマーク用)。
+
+    capture_frame() の Frame.timestamp は「再生を始めた時刻 (time.perf_counter) + 録画での経過時間」にする。
+    再生速度に関係なくロード時間などが録画の時間で測れて、ライブと同じ時計のまま扱える。
+    """
+
+    def __init__(self, source, rate: float = 1.0, loop: bool = False, fps: float = DEFAULT_FPS):
+        self._source = source if isinstance(source, FrameSource) else open_frame_source(source, fps)
+        self._rate = rate
+        self._loop = loop
+        self._index = 0
+        self._pending: Optional[Image.Image] = None  # 先読み済みフレーム
+        self._start_wall: Optional[float] = None
+        self._clock_base: Optional[float] = None  # 録画の先頭フレームに対応する time.perf_counter
+        self._loop_offset = 0.0  # ループで巻き戻った分 (フレームの時刻が戻らないように足す)
+        self.last_timestamp: Optional[float] = None  # 直前に返したフレームの元タイムスタンプ
+        self.last_frame_time: Optional[float] = None  # 直前に返したフレームの時刻 (上記の時計)
+
+    @classmethod
+    def from_config(cls, config) -> "ReplayCapture":
+        return cls(config.replay_source, rate=config.replay_rate, loop=config.replay_loop)
+
+    def set_target_window(self, window_title: Optional[str]) -> bool:
+        # 録画再生なのでウィンドウ指定は無視
+        return True
+
+    @property
+    def frame_count(self) -> int:
+        return len(self._source)
+
+    def _peek(self) -> Optional[Image.Image]:
+        """次のフレームを読み込む (位置は進めない)"""
+        if self._index >= len(self._source):
+            if not self._loop or len(self._source) == 0:
+                return None
+            self._loop_offset += self._recording_length()
+            self._index = 0
+            self._start_wall = None
+        if self._pending is None:
+            try:
+                self._pending = self._source.load(self._index)
+            except FrameSourceEnded:
+                # 思っていたより短かった -> 縮んだ長さで終わり (ループなら先頭) に戻る
+                return self._peek()
+        return self._pending
+
+    def _recording_length(self) -> float:
+        """録画1周分の長さ (最後のフレームの後にもう1フレーム分の間隔があるものとする)"""
+        count = len(self._source)
+        span = self._source.timestamp(count - 1) - self._source.timestamp(0)
+        return span + (span / (count - 1) if count > 1 else 1.0 / DEFAULT_FPS)
+
+    def get_frame_size(self) -> Optional[tuple[int, int]]:
+        image = self._peek()
+        return image.size if image is not None else None
+
+    def capture(self) -> Optional[Image.Image]:
+        image = self._peek()
+        if image is None:
+            return None
+
+        timestamp = self._source.timestamp(self._index)
+        origin = timestamp - self._source.timestamp(0)
+        if self._clock_base is None:
+            self._clock_base = time.perf_counter() - origin
+        if self._rate > 0:
+            # 元のフレーム間隔を再現する
+            now = time.perf_counter()
+            if self._start_wall is None:
+                self._start_wall = now - origin / self._rate
+            wait = self._start_wall + origin / self._rate - now
+            if wait > 0:
+                time.sleep(wait)
+
+        self.last_timestamp = timestamp
+        self.last_frame_time = self._clock_base + self._loop_offset + origin
+        self._pending = None
+        self._index += 1
+        return image
+
+    def capture_frame(self, out: Optional[np.ndarray] = None) -> Optional[Frame]:
+        image = self.capture()
+        return Frame.from_image(image, self.last_frame_time) if image is not None else None
+
+    def close(self):
+        self._source.close()
+
+
+# --- 使い方（ベンチマーク） ---
+if __name__ == "__main__":
+    import sys
+    from config import load_config
+    from detector import detect_all_patterns
+
+    if len(sys.argv) < 2:
+        print("使い方: python replay.py <PNGフォルダ or 画像ファイル>")
+        sys.exit(1)
+
+    config = load_config()
+    backend = ReplayCapture(sys.argv[1], rate=0)
+    print(f"{backend.frame_count}フレームを再生します")
+
+    detected_count = 0
+    started = time.perf_counter()
+    while True:
+        image = backend.capture()
+        if image is None:
+            break
+        detected, _ = detect_all_patterns(image, config.patterns, config.area_size)
+        if detected:
+            detected_count += 1
+    elapsed = time.perf_counter() - started
+    backend.close()
+
+    fps = backend.frame_count / elapsed if elapsed > 0 else 0.0
+    print(f"処理時間 {elapsed:.3f}秒 ({fps:.1f} fps) / 検知フレーム {detected_count}")
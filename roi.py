@@ -0,0 +1,221 @@
+"""
+AutoSplit GIEEE - 関心領域 (ROI) モジュール
+検知エリアを覆う最小限の矩形だけをキャプチャするための計算を行う
+"""
+from PIL import Image
+from typing import Optional
+from dataclasses import dataclass
+
+from config import PatternConfig
+from frame import order_color
+
+
+# ROIキャプチャのモード
+ROI_MODE_OFF = "off"          # ウィンドウ全体をキャプチャ (従来通り)
+ROI_MODE_BBOX = "bbox"        # 全エリアを囲む1つの矩形
+ROI_MODE_CLUSTER = "cluster"  # 近いエリア同士をまとめた複数の矩形
+ROI_MODES = (ROI_MODE_OFF, ROI_MODE_BBOX, ROI_MODE_CLUSTER)
+
+
+@dataclass(frozen=True)
+class RoiRect:
+    """ピクセル単位の矩形 (right/bottom は含まない)"""
+    left: int
+    top: int
+    right: int
+    bottom: int
+
+    @property
+    def width(self) -> int:
+        return self.right - self.left
+
+    @property
+    def height(self) -> int:
+        return self.bottom - self.top
+
+    @property
+    def pixel_count(self) -> int:
+        return self.width * self.height
+
+    def contains(self, box: tuple[int, int, int, int]) -> bool:
+        """box (left, top, right, bottom) を完全に含むならTrue"""
+        left, top, right, bottom = box
+        return (self.left <= left and self.top <= top and
+                right <= self.right and bottom <= self.bottom)
+
+    def union(self, other: "RoiRect") -> "RoiRect":
+        return RoiRect(
+            min(self.left, other.left), min(self.top, other.top),
+            max(self.right, other.right), max(self.bottom, other.bottom)
+        )
+
+
+def area_pixel_box(x_percent: int, y_percent: int, img_w: int, img_h: int,
+                   area_size: int = 50) -> tuple[int, int, int, int]:
+    """
+    エリアの位置 (%) をピクセル矩形に変換
+
+    Returns:
+        (left, top, right, bottom)
+    """
+    # パーセントから実座標に変換
+    x = int((x_percent / 100) * img_w)
+    y = int((y_percent / 100) * img_h)
+
+    # エリアが画像範囲内に収まるようにクリップ
+    x = max(0, min(x, img_w - area_size))
+    y = max(0, min(y, img_h - area_size))
+
+    return (x, y, x + area_size, y + area_size)
+
+
+def timer_pixel_box(x_percent: int, y_percent: int, width_percent: int, height_percent: int,
+                    img_w: int, img_h: int) -> tuple[int, int, int, int]:
+    """
+    タイマー領域 (%) をピクセル矩形に変換
+
+    Returns:
+        (left, top, right, bottom)
+    """
+    x = int(x_percent / 100 * img_w)
+    y = int(y_percent / 100 * img_h)
+    w = int(width_percent / 100 * img_w)
+    h = int(height_percent / 100 * img_h)
+
+    # 範囲チェック
+    x = max(0, min(x, img_w - 1))
+    y = max(0, min(y, img_h - 1))
+    w = max(1, min(w, img_w - x))
+    h = max(1, min(h, img_h - y))
+
+    return (x, y, x + w, y + h)
+
+
+def compute_roi_rects(patterns: list[PatternConfig], frame_size: tuple[int, int],
+                      area_size: int = 50, mode: str = ROI_MODE_CLUSTER) -> list[RoiRect]:
+    """
+    有効なパターンの全エリアを覆う矩形リストを計算
+
+    Args:
+        patterns: 検知パターン
+        frame_size: キャプチャ全体のサイズ (幅, 高さ)
+        area_size: エリアサイズ (px)
+        mode: ROI_MODE_BBOX / ROI_MODE_CLUSTER
+
+    Returns:
+        矩形リスト (エリアがなければ空)
+    """
+    img_w, img_h = frame_size
+    boxes = set()
+    for pattern in patterns:
+        if not pattern.enabled or not pattern.areas:
+            continue
+        for area in pattern.areas:
+            left, top, right, bottom = area_pixel_box(area.x, area.y, img_w, img_h, area_size)
+            # 画像がエリアより小さい場合もはみ出さないようにする
+            boxes.add(RoiRect(max(0, left), max(0, top), min(img_w, right), min(img_h, bottom)))
+
+    if not boxes:
+        return []
+
+    rects = sorted(boxes, key=lambda r: (r.top, r.left))
+    if mode == ROI_MODE_BBOX:
+        bbox = rects[0]
+        for rect in rects[1:]:
+            bbox = bbox.union(rect)
+        return [bbox]
+
+    return merge_rects(rects)
+
+
+def merge_rects(rects: list[RoiRect]) -> list[RoiRect]:
+    """
+    まとめてもピクセル数がほとんど増えない矩形同士を結合する
+
+    重なっている/隣接しているエリアは1つの矩形にまとめ、
+    離れているエリアは別々の矩形のまま残す。
+    """
+    rects = list(rects)
+    merged = True
+    while merged:
+        merged = False
+        result: list[RoiRect] = []
+        for rect in rects:
+            for k, other in enumerate(result):
+                u = other.union(rect)
+                # 結合後の面積が個別の合計以下なら (重なり/隣接) まとめる
+                if u.pixel_count <= other.pixel_count + rect.pixel_count:
+                    result[k] = u
+                    merged = True
+                    break
+            else:
+                result.append(rect)
+        rects = result
+    return sorted(rects, key=lambda r: (r.top, r.left))
+
+
+class SparseFrame:
+    """
+    ROI矩形だけを保持するフレーム
+
+    PIL Image / Frame と同じく size / crop() を持つので、検知ロジックからは
+    通常のキャプチャ画像と同じように扱える。各領域は PIL Image か Frame。
+    """
+
+    def __init__(self, size: tuple[int, int], regions: list[tuple[RoiRect, Image.Image]],
+                 timestamp: Optional[float] = None):
+        self.size = size
+        self.regions = regions
+        self.timestamp = timestamp  # キャプチャ時刻 (任意)
+
+    @property
+    def channel_order(self) -> str:
+        """領域 (Frame) のチャンネル順"""
+        for _, region in self.regions:
+            return getattr(region, "channel_order", "RGB")
+        return "RGB"
+
+    def order_color(self, rgb: tuple[int, int, int]) -> tuple[int, int, int]:
+        """RGBの色を領域のチャンネル順に並べ替える"""
+        return order_color(rgb, self.channel_order)
+
+    @property
+    def width(self) -> int:
+        return self.size[0]
+
+    @property
+    def height(self) -> int:
+        return self.size[1]
+
+    @property
+    def byte_count(self) -> int:
+        """保持しているピクセルのバイト数"""
+        return sum(getattr(region, "byte_count", rect.pixel_count * 3)
+                   for rect, region in self.regions)
+
+    def find_region(self, box: tuple[int, int, int, int]) -> Optional[tuple[RoiRect, Image.Image]]:
+        """box を含む領域を探す"""
+        for rect, image in self.regions:
+            if rect.contains(box):
+                return rect, image
+        return None
+
+    def crop(self, box: tuple[int, int, int, int]) -> Image.Image:
+        """フル画像座標の box を切り抜く"""
+        found = self.find_region(box)
+        if found is None:
+            raise ValueError(f"ROI外の領域です: {box}")
+        rect, image = found
+        left, top, right, bottom = box
+        return image.crop((left - rect.left, top - rect.top,
+                           right - rect.left, bottom - rect.top))
+
+    def area_mean(self, box: tuple[int, int, int, int]) -> tuple[int, int, int]:
+        """フル画像座標の box の平均色 (領域が Frame の場合のみ)"""
+        found = self.find_region(box)
+        if found is None:
+            raise ValueError(f"ROI外の領域です: {box}")
+        rect, region = found
+        left, top, right, bottom = box
+        return region.area_mean((left - rect.left, top - rect.top,
+                                 right - rect.left, bottom - rect.top))
@@ -0,0 +1,329 @@
+"""
+AutoSplit GIEEE - ROI録画モジュール
+検知エリア周辺のピクセルとタイムスタンプ・判定結果をメモリマップしたファイルに追記する
+(誤検知したときに、検知ロジックが何を見ていたかを後から確認するため)
+"""
+import bisect
+import json
+import mmap
+import struct
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from frame import Frame
+from replay import DEFAULT_FPS, FrameSource, register_frame_source
+from roi import RoiRect, SparseFrame
+
+
+MAGIC = b"GIEEREC1"
+FILE_VERSION = 1
+FILE_SUFFIX = ".gieerec"
+HEADER_SIZE = 4096  # 先頭チャンクのうちファイルヘッダーに使う領域
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024  # mmap.ALLOCATIONGRANULARITY の倍数にすること
+
+# ファイルヘッダー: magic, version, chunk_size, JSONの長さ (続けてJSON)
+_FILE_HEADER = struct.Struct("<8sHII")
+# フレームのレコード: レコード長 (0=このチャンクはここまで), タイムスタンプ,
+# ピクセルデータ長, 展開後の長さ, フレーム幅, フレーム高さ, 領域数, パターン数, フラグ
+_RECORD = struct.Struct("<IdIIHHHHB7x")
+_RECT = struct.Struct("<iiii")  # left, top, right, bottom
+_COUNT = struct.Struct("<HH")  # 一致エリア数, エリア数
+
+FLAG_ZLIB = 0x01  # ピクセルデータを zlib で圧縮
+FLAG_BGR = 0x02  # チャンネル順が BGR
+
+
+def _align8(n: int) -> int:
+    return (n + 7) & ~7
+
+
+@dataclass
+class RecordedFrame:
+    """録画された1フレーム"""
+    timestamp: float  # キャプチャ時刻 (time.perf_counter)
+    frame_size: tuple[int, int]  # 元のフレームの (幅, 高さ)
+    channel_order: str
+    regions: list[tuple[RoiRect, np.ndarray]]  # (矩形, (H, W, 3) の画素)
+    matched: tuple[int, ...]  # パターンごとの一致エリア数 (記録していなければ空)
+    totals: tuple[int, ...]  # パターンごとのエリア数
+
+
+class RoiRecorder:
+    """
+    ROIのピクセルをチャンク単位でメモリマップしたファイルに追記する
+
+    ファイルは chunk_size ごとに伸ばしてマップし、レコードはチャンクをまたがない。
+    max_bytes を超える分は記録せずに捨てる (full が True になる)。
+    """
+
+    def __init__(self, path, pattern_names: list[str], max_bytes: int = 512 * 1024 * 1024,
+                 compress: bool = False, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        if chunk_size % mmap.ALLOCATIONGRANULARITY != 0:
+            raise ValueError(f"chunk_size は {mmap.ALLOCATIONGRANULARITY} の倍数にしてください")
+        self.path = Path(path)
+        self.chunk_size = chunk_size
+        self.max_bytes = max(max_bytes, chunk_size)
+        self.compress = compress
+
+        self._file = open(self.path, "w+b")
+        self._map: Optional[mmap.mmap] = None
+        self._chunk = -1
+        self._pos = 0
+        self.frames = 0  # 記録したフレーム数
+        self.dropped = 0  # 容量不足で捨てたフレーム数
+        self.full = False
+
+        self._next_chunk()
+        header = json.dumps({"patterns": pattern_names}, ensure_ascii=False).encode("utf-8")
+        if _FILE_HEADER.size + len(header) > HEADER_SIZE:
+            raise ValueError("パターンが多すぎてヘッダーに入りません")
+        _FILE_HEADER.pack_into(self._map, 0, MAGIC, FILE_VERSION, chunk_size, len(header))
+        self._map[_FILE_HEADER.size:_FILE_HEADER.size + len(header)] = header
+        self._pos = HEADER_SIZE
+
+    def _next_chunk(self) -> bool:
+        """次のチャンクへ進む (容量オーバーならFalse)"""
+        if (self._chunk + 2) * self.chunk_size > self.max_bytes:
+            self.full = True
+            return False
+        if self._map is not None:
+            self._map.close()
+        self._chunk += 1
+        self._file.truncate((self._chunk + 1) * self.chunk_size)
+        self._map = mmap.mmap(self._file.fileno(), self.chunk_size,
+                              offset=self._chunk * self.chunk_size)
+        self._pos = 0
+        return True
+
+    def append(self, timestamp: float, frame_size: tuple[int, int],
+               regions: list[tuple[RoiRect, Frame]],
+               matched=None, totals=None) -> bool:
+        """
+        1フレーム分を追記する
+
+        Args:
+            timestamp: キャプチャ時刻
+            frame_size: 元のフレームの (幅, 高さ)
+            regions: (矩形, Frame) のリスト (SparseFrame.regions と同じ形)
+            matched / totals: パターンごとの一致エリア数とエリア数 (任意)
+
+        Returns:
+            記録できたか
+        """
+        if self._map is None or self.full:
+            self.dropped += 1
+            return False
+
+        pattern_count = len(matched) if matched is not None else 0
+        raw_len = sum(region.pixels.shape[0] * region.pixels.shape[1] * 3 for _, region in regions)
+        channel_order = regions[0][1].channel_order if regions else "RGB"
+        flags = FLAG_BGR if channel_order == "BGR" else 0
+
+        payload = None
+        payload_len = raw_len
+        if self.compress:
+            payload = zlib.compress(b"".join(
+                np.ascontiguousarray(region.pixels[:, :, :3]).tobytes() for _, region in regions
+            ), 1)
+            payload_len = len(payload)
+            flags |= FLAG_ZLIB
+
+        meta_len = _RECORD.size + len(regions) * _RECT.size + pattern_count * _COUNT.size
+        record_len = _align8(meta_len + payload_len)
+        if record_len > self.chunk_size - HEADER_SIZE:
+            # 1チャンクに入らない (ROIが大きすぎる)
+            self.dropped += 1
+            return False
+        if self._pos + record_len > self.chunk_size and not self._next_chunk():
+            self.dropped += 1
+            return False
+
+        mm = self._map
+        pos = self._pos
+        _RECORD.pack_into(mm, pos, record_len, timestamp, payload_len, raw_len,
+                          frame_size[0], frame_size[1], len(regions), pattern_count, flags)
+        pos += _RECORD.size
+        for rect, _ in regions:
+            _RECT.pack_into(mm, pos, rect.left, rect.top, rect.right, rect.bottom)
+            pos += _RECT.size
+        for p in range(pattern_count):
+            _COUNT.pack_into(mm, pos, int(matched[p]), int(totals[p]))
+            pos += _COUNT.size
+
+        if payload is not None:
+            mm[pos:pos + payload_len] = payload
+        else:
+            # マップ上に直接コピーする (中間のバイト列を作らない)
+            for _, region in regions:
+                height, width = region.pixels.shape[:2]
+                view = np.frombuffer(mm, dtype=np.uint8, count=height * width * 3, offset=pos)
+                view.reshape(height, width, 3)[...] = region.pixels[:, :, :3]
+                pos += height * width * 3
+                del view
+
+        self._pos += record_len
+        self.frames += 1
+        return True
+
+    @property
+    def byte_count(self) -> int:
+        """書き込んだバイト数"""
+        return self._chunk * self.chunk_size + self._pos
+
+    def close(self):
+        if self._map is None:
+            return
+        used = self.byte_count
+        self._map.flush()
+        self._map.close()
+        self._map = None
+        # 最後のチャンクの使っていない部分は切り詰める
+        self._file.truncate(used)
+        self._file.close()
+
+
+class RoiRecording:
+    """
+    RoiRecorder で記録したファイルを読む
+
+    フレーム番号か時刻で任意のフレームを取り出せる。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, chunk_size, header_len = _FILE_HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"ROI録画ファイルではありません: {path}")
+        self.version = version
+        self.chunk_size = chunk_size
+        header = json.loads(bytes(self._map[_FILE_HEADER.size:_FILE_HEADER.size + header_len]))
+        self.pattern_names: list[str] = header.get("patterns", [])
+
+        self._offsets: list[int] = []
+        self._timestamps: list[float] = []
+        self._build_index()
+
+    def _build_index(self):
+        """各レコードの位置とタイムスタンプを集める"""
+        size = len(self._map)
+        chunk_start = 0
+        while chunk_start < size:
+            pos = chunk_start + (HEADER_SIZE if chunk_start == 0 else 0)
+            chunk_end = min(chunk_start + self.chunk_size, size)
+            while pos + _RECORD.size <= chunk_end:
+                record_len, timestamp = struct.unpack_from("<Id", self._map, pos)
+                if record_len == 0:
+                    break
+                self._offsets.append(pos)
+                self._timestamps.append(timestamp)
+                pos += record_len
+            chunk_start += self.chunk_size
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def timestamp(self, index: int) -> float:
+        return self._timestamps[index]
+
+    def index_at(self, timestamp: float) -> int:
+        """その時刻に表示されていたフレーム (時刻以前で最後のフレーム) の番号"""
+        index = bisect.bisect_right(self._timestamps, timestamp) - 1
+        return max(index, 0)
+
+    def read(self, index: int) -> RecordedFrame:
+        """フレームを読む"""
+        pos = self._offsets[index]
+        (_, timestamp, payload_len, raw_len, frame_w, frame_h,
+         region_count, pattern_count, flags) = _RECORD.unpack_from(self._map, pos)
+        pos += _RECORD.size
+
+        rects = []
+        for _ in range(region_count):
+            rects.append(RoiRect(*_RECT.unpack_from(self._map, pos)))
+            pos += _RECT.size
+        counts = [_COUNT.unpack_from(self._map, pos + p * _COUNT.size) for p in range(pattern_count)]
+        pos += pattern_count * _COUNT.size
+
+        data = self._map[pos:pos + payload_len]
+        if flags & FLAG_ZLIB:
+            data = zlib.decompress(data)
+        pixels = np.frombuffer(data, dtype=np.uint8, count=raw_len)
+
+        regions = []
+        offset = 0
+        for rect in rects:
+            n = rect.width * rect.height * 3
+            regions.append((rect, pixels[offset:offset + n].reshape(rect.height, rect.width, 3)))
+            offset += n
+
+        return RecordedFrame(
+            timestamp=timestamp,
+            frame_size=(frame_w, frame_h),
+            channel_order="BGR" if flags & FLAG_BGR else "RGB",
+            regions=regions,
+            matched=tuple(m for m, _ in counts),
+            totals=tuple(t for _, t in counts),
+        )
+
+    def read_at(self, timestamp: float) -> RecordedFrame:
+        """時刻でフレームを読む"""
+        return self.read(self.index_at(timestamp))
+
+    def sparse_frame(self, index: int) -> SparseFrame:
+        """検知ロジックにそのまま渡せる SparseFrame として読む"""
+        rec = self.read(index)
+        regions = [(rect, Frame(pixels, rec.channel_order, rec.timestamp)) for rect, pixels in rec.regions]
+        return SparseFrame(rec.frame_size, regions, rec.timestamp)
+
+    def to_image(self, index: int) -> Image.Image:
+        """元のフレームサイズの画像 (ROI以外は黒) として読む"""
+        rec = self.read(index)
+        canvas = np.zeros((rec.frame_size[1], rec.frame_size[0], 3), dtype=np.uint8)
+        for rect, pixels in rec.regions:
+            if rec.channel_order == "BGR":
+                pixels = pixels[:, :, ::-1]
+            canvas[rect.top:rect.bottom, rect.left:rect.right] = pixels
+        return Image.fromarray(canvas, "RGB")
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@register_frame_source
+class RoiRecordingSource(FrameSource):
+    """ROI録画ファイルをリプレイで再生する (ROI以外は黒)"""
+
+    def __init__(self, path: Path, fps: float = DEFAULT_FPS):
+        self.path = path
+        self._recording = RoiRecording(path)
+
+    @classmethod
+    def can_open(cls, path: Path) -> bool:
+        return path.is_file() and path.suffix.lower() == FILE_SUFFIX
+
+    def __len__(self) -> int:
+        return len(self._recording)
+
+    def timestamp(self, index: int) -> float:
+        return self._recording.timestamp(index)
+
+    def load(self, index: int) -> Image.Image:
+        return self._recording.to_image(index)
+
+    def close(self):
+        self._recording.close()
@@ -0,0 +1,101 @@
+"""
+AutoSplit GIEEE - 周期スケジューラ
+処理時間に左右されずに一定のフレームレートを保つ (締め切りベース)
+"""
+import statistics
+import time
+from collections import deque
+from typing import Optional
+
+
+# 統計に使う直近の周期数
+STATS_WINDOW = 120
+
+
+class FrameScheduler:
+    """
+    perf_counter の締め切り (deadline) で周期を刻むスケジューラ
+
+    「処理後に interval だけ眠る」のではなく「次の締め切りまで眠る」ので、
+    キャプチャや検知にかかった時間の分だけ周期が伸びることはない。
+    処理が締め切りを1周期以上超えた場合 (オーバーラン) は、
+    遅れを取り戻すために連続で回すことはせず、次の締め切りを現在時刻から取り直す。
+
+    spin_ms > 0 のときは、締め切りの spin_ms 前からは sleep せずに待つ
+    (CPUを使う代わりにOSのタイマー分解能より正確になる)。
+    spin_ms = 0 なら締め切りまで sleep するだけで、CPUは使わない。
+    """
+
+    def __init__(self, interval_ms: float, spin_ms: float = 0.0):
+        self.interval_ms = interval_ms
+        self.spin_ms = spin_ms
+        self._deadline: Optional[float] = None
+        self._ticks: deque[float] = deque(maxlen=STATS_WINDOW)  # 起床時刻
+        self._lateness: deque[float] = deque(maxlen=STATS_WINDOW)  # 締め切りからの遅れ (秒)
+        self.ticks = 0
+        self.overruns = 0
+
+    @property
+    def interval(self) -> float:
+        """周期 (秒)"""
+        return max(self.interval_ms, 0) / 1000
+
+    def start(self):
+        """今から周期を刻み直す (次の wait() はすぐ戻る。長く止まった後などにも呼ぶ)"""
+        self._deadline = time.perf_counter()
+
+    def wait(self) -> float:
+        """
+        次の締め切りまで待つ
+
+        Returns:
+            起床した時刻 (perf_counter)
+        """
+        now = time.perf_counter()
+        if self._deadline is None:
+            self._deadline = now
+        elif now > self._deadline + self.interval:
+            # 1周期以上遅れた -> 取り戻さずに仕切り直す
+            self.overruns += 1
+            self._deadline = now
+
+        deadline = self._deadline
+        spin = self.spin_ms / 1000
+        remaining = deadline - now
+        if remaining > spin:
+            time.sleep(remaining - spin)
+        if spin > 0:
+            while time.perf_counter() < deadline:
+                pass
+
+        woke = time.perf_counter()
+        self._lateness.append(woke - deadline)
+        self._ticks.append(woke)
+        self.ticks += 1
+        self._deadline = deadline + self.interval
+        return woke
+
+    def stats(self) -> dict[str, float]:
+        """
+        直近の統計
+
+        Returns:
+            fps: 実際のフレームレート
+            mean_lateness_ms: 締め切りからの遅れの平均 (ms)
+            jitter_ms: 締め切りからの遅れのばらつき (標準偏差, ms)
+            max_late_ms: 締め切りからの遅れの最大 (ms)
+            overruns: オーバーラン回数
+        """
+        fps = 0.0
+        if len(self._ticks) >= 2:
+            span = self._ticks[-1] - self._ticks[0]
+            if span > 0:
+                fps = (len(self._ticks) - 1) / span
+        lateness = self._lateness
+        return {
+            "fps": fps,
+            "mean_lateness_ms": statistics.fmean(lateness) * 1000 if lateness else 0.0,
+            "jitter_ms": statistics.pstdev(lateness) * 1000 if len(lateness) >= 2 else 0.0,
+            "max_late_ms": max(lateness) * 1000 if lateness else 0.0,
+            "overruns": self.overruns,
+        }
@@ -0,0 +1,8 @@
+"""
+テスト共通の設定
+モジュールはリポジトリ直下に平置きなので、そこから import できるようにする
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,43 @@
+"""
+area_suggest.py のテスト (帯ごとの集計が素直な計算と一致するか / エリアが足りないときの警告)
+"""
+import numpy as np
+from PIL import Image
+
+from area_suggest import block_stats, candidate_areas, suggest_areas
+from config import PatternConfig
+
+
+def test_block_stats_matches_per_box_numpy():
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, size=(90, 160, 3), dtype=np.uint8)
+    _, boxes = candidate_areas((160, 90), area_size=20, step=10)
+    means, spreads = block_stats(pixels, boxes)
+    for box, mean, spread in zip(boxes, means, spreads):
+        left, top, right, bottom = box
+        block = pixels[top:bottom, left:right].reshape(-1, 3).astype(np.float64)
+        assert np.array_equal(mean, np.floor(block.mean(axis=0) + 0.5))
+        assert np.isclose(spread, block.std(axis=0).mean())
+
+
+def test_suggest_areas_warns_when_fewer_than_min_areas():
+    # ロード画面で白くなるのは左上の1か所だけ
+    load = np.zeros((90, 160, 3), dtype=np.uint8)
+    load[:20, :20] = 255
+    game = np.zeros((90, 160, 3), dtype=np.uint8)
+    pattern = PatternConfig(name="load", color="#FFFFFF", tolerance=30)
+    suggestion = suggest_areas([Image.fromarray(load)], [Image.fromarray(game)], pattern,
+                               area_size=20, step=10, min_areas=2)
+    assert len(suggestion.areas) == 1
+    assert suggestion.load_detection_rate == 1.0
+    assert suggestion.warning
+
+
+def test_suggest_areas_no_warning_when_enough_areas():
+    load = np.zeros((90, 160, 3), dtype=np.uint8)
+    load[:20, :20] = 255
+    load[-20:, -20:] = 255
+    pattern = PatternConfig(name="load", color="#FFFFFF", tolerance=30)
+    suggestion = suggest_areas([Image.fromarray(load)], [], pattern, area_size=20, step=10, min_areas=2)
+    assert len(suggestion.areas) >= 2
+    assert suggestion.warning == ""
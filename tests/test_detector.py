@@ -0,0 +1,52 @@
+"""
+detector.py のテスト (画素ごとに判定するパターンがエリア方式でも検知エンジンと同じ結果になるか)
+"""
+import numpy as np
+import pytest
+
+from config import DetectionArea, PatternConfig
+from detection_engine import compile_plan
+from detector import detect_pattern, detect_pattern_frame
+from frame import Frame
+
+
+def make_pattern(**kwargs) -> PatternConfig:
+    areas = [DetectionArea(x=x, y=y) for x in (10, 40, 70) for y in (20, 60)]
+    return PatternConfig(name="load", color="#FFFFFF", tolerance=40, threshold_percent=50,
+                         areas=areas, match_mode="pixel", extra_colors=["#2040C0"],
+                         pixel_match_percent=60, **kwargs)
+
+
+def make_frames():
+    rng = np.random.default_rng(3)
+    for _ in range(20):
+        pixels = rng.integers(0, 256, size=(120, 200, 3), dtype=np.uint8)
+        # パターンの色 (extra_colors も) をところどころに塗る
+        mask = rng.random((120, 200)) < rng.uniform(0.3, 0.9)
+        colors = np.array([[255, 255, 255], [32, 64, 192]], dtype=np.uint8)
+        pixels[mask] = colors[rng.integers(0, 2, size=int(mask.sum()))]
+        yield pixels
+
+
+@pytest.mark.parametrize("channel_order", ["RGB", "BGR"])
+def test_pixel_pattern_matches_detection_engine(channel_order):
+    pattern = make_pattern()
+    for rgb in make_frames():
+        pixels = rgb[:, :, ::-1] if channel_order == "BGR" else rgb
+        frame = Frame(np.ascontiguousarray(pixels), channel_order)
+        plan = compile_plan([pattern], frame.size, 20, channel_order)
+        expected = int(plan.count_matches(frame)[0])
+
+        result = detect_pattern_frame(frame, pattern, 20)
+        assert result.matched_areas == expected
+        assert result.detected == (expected >= plan.threshold_counts[0])
+        if channel_order == "RGB":
+            assert detect_pattern(frame.to_image(), pattern, 20).matched_areas == expected
+
+
+def test_pixel_pattern_uses_extra_colors():
+    pattern = make_pattern()
+    pixels = np.zeros((120, 200, 3), dtype=np.uint8)
+    pixels[:] = (32, 64, 192)  # extra_colors だけで塗る
+    result = detect_pattern_frame(Frame(pixels), pattern, 20)
+    assert result.detected and result.matched_areas == len(pattern.areas)
@@ -0,0 +1,24 @@
+"""
+flight_recorder.py のテスト
+"""
+import csv
+import math
+
+import numpy as np
+
+from flight_recorder import FlightRecorder, UNAVAILABLE
+
+
+def test_unavailable_counts_are_not_recorded_as_zero(tmp_path):
+    recorder = FlightRecorder(4, ["night", "day"])
+    recorder.record(1.0, 2, np.zeros(4), np.array([3, UNAVAILABLE]), np.array([4, 2]))
+    recorder.record(1.1, 0, np.zeros(4), np.array([0, 1]), np.array([4, 2]))
+
+    data = recorder.snapshot()
+    assert data["match_percent"][0, 0] == 75.0
+    assert math.isnan(data["match_percent"][0, 1])
+    assert list(data["match_percent"][1]) == [0.0, 50.0]
+
+    rows = list(csv.reader(open(recorder.dump(tmp_path), encoding="utf-8")))
+    assert rows[1][2:8] == ["3", "4", "75.0", "", "2", ""]
+    assert rows[2][2:8] == ["0", "4", "0.0", "1", "2", "50.0"]
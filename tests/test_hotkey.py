@@ -0,0 +1,83 @@
+"""
+hotkey.py のテスト (偽の KeySink で送信スレッドを通して確かめる)
+"""
+import threading
+
+import pytest
+
+from hotkey import KEY_DOWN, KEY_UP, HotkeyManager, KeySink, RecordingKeySink
+
+
+class FailingKeySink(KeySink):
+    """最初のキー操作で失敗する送信先"""
+
+    def key_down(self, key: tuple):
+        raise OSError("SendInputに失敗しました (エラー 5)")
+
+    def key_up(self, key: tuple):
+        pass
+
+
+@pytest.fixture
+def reports():
+    received = []
+    done = threading.Event()
+
+    def on_sent(report):
+        received.append(report)
+        done.set()
+
+    return received, done, on_sent
+
+
+def test_key_sink_is_abstract():
+    with pytest.raises(TypeError):
+        KeySink()
+
+
+def test_queue_hotkey_plays_steps_in_order(reports):
+    received, done, on_sent = reports
+    sink = RecordingKeySink()
+    manager = HotkeyManager(sink=sink, on_sent=on_sent)
+    try:
+        assert manager.queue_hotkey("ctrl+numpad1")
+        assert done.wait(2.0)
+    finally:
+        manager.close()
+
+    assert [(action, key) for _, action, key in sink.events] == [
+        (KEY_DOWN, ("key", "ctrl")),
+        (KEY_DOWN, ("vk", 0x61)),
+        (KEY_UP, ("vk", 0x61)),
+        (KEY_UP, ("key", "ctrl")),
+    ]
+    report = received[0]
+    assert report.hotkey == "ctrl+numpad1"
+    assert report.error is None
+    assert report.finished_at >= report.started_at >= report.enqueued_at
+
+
+def test_send_failure_is_reported_after_queueing(reports):
+    received, done, on_sent = reports
+    manager = HotkeyManager(sink=FailingKeySink(), on_sent=on_sent)
+    try:
+        # 予約の時点では送れたかどうか分からないので True
+        assert manager.queue_hotkey("f5")
+        assert done.wait(2.0)
+    finally:
+        manager.close()
+
+    assert "SendInput" in received[0].error
+    assert manager.last_report is received[0]
+    assert manager.stats()["sent"] == 1
+
+
+def test_queue_hotkey_rejects_during_cooldown():
+    manager = HotkeyManager(sink=RecordingKeySink())
+    try:
+        assert manager.queue_hotkey("f5", cooldown_ms=10_000)
+        assert not manager.queue_hotkey("f5", cooldown_ms=10_000)
+        assert not manager.queue_hotkey("unknownkey")
+        assert manager.flush()
+    finally:
+        manager.close()
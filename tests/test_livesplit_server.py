@@ -0,0 +1,124 @@
+"""
+livesplit_server.py / ServerTimerMonitor のテスト (代わりのサーバーに実際につないで確かめる)
+"""
+import threading
+import time
+
+import pytest
+
+from config import AppConfig
+from livesplit_server import LiveSplitServerClient, StandInLiveSplitServer
+from timer_monitor import ServerTimerMonitor
+
+
+@pytest.fixture
+def server():
+    server = StandInLiveSplitServer()
+    server.start()
+    yield server
+    server.stop()
+
+
+def wait_until(condition, timeout: float = 2.0) -> bool:
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def test_commands_are_sent_before_waiting_queries(server):
+    client = LiveSplitServerClient("127.0.0.1", server.port)
+    answers = []
+    asking = threading.Thread(
+        target=lambda: answers.append(client.query("getcurrenttimerphase", timeout=2.0)))
+    asking.start()
+    assert wait_until(lambda: len(client._queries) == 1)
+    # 問い合わせより後に入れたコマンドが先に届く
+    client.send("startorsplit")
+    client.send("pausegametime")
+    client.start()
+    asking.join(2.0)
+    client.stop()
+
+    assert [c for _, c in server.commands] == ["startorsplit", "pausegametime",
+                                               "getcurrenttimerphase"]
+    assert answers == ["Running"]
+
+
+def test_abandoned_query_is_not_sent(server):
+    client = LiveSplitServerClient("127.0.0.1", server.port)
+    # 送信スレッドが動く前に待つのをやめた問い合わせ
+    assert client.query("getcurrenttimerphase", timeout=0.01) is None
+    client.start()
+    client.send("startorsplit")
+    assert client.query("getsplitindex") == "0"
+    client.stop()
+
+    assert [c for _, c in server.commands] == ["startorsplit", "getsplitindex"]
+
+
+def test_failed_query_is_not_retried():
+    server = StandInLiveSplitServer()
+    port = server.port
+    server.server_close()
+    client = LiveSplitServerClient("127.0.0.1", port, timeout=0.2)
+    client.start()
+    try:
+        assert client.query("getcurrenttimerphase", timeout=1.0) is None
+    finally:
+        client.stop()
+    assert client.failures == 1
+    assert client.reports[-1].error is not None
+
+
+def test_server_timer_monitor_follows_timer_phase(server):
+    client = LiveSplitServerClient("127.0.0.1", server.port, timeout=0.5)
+    client.start()
+    changes = []
+    monitor = ServerTimerMonitor(AppConfig(), changes.append, client=client)
+    try:
+        monitor.check()  # NotRunning
+        assert monitor.is_frozen
+
+        client.send("startorsplit")
+        monitor.check()  # Running
+        assert not monitor.is_frozen
+        assert monitor.current_time is not None
+
+        server.phase = "Paused"
+        monitor.check()
+        assert monitor.is_frozen
+
+        server.phase = "Running"
+        monitor.check()
+        server.phase = "SomethingElse"
+        monitor.check()  # 知らない答えでは状態を変えない
+        assert not monitor.is_frozen
+        assert monitor.phase == "Running"
+    finally:
+        client.stop()
+
+    assert changes == [True, False, True, False]
+
+
+def test_server_timer_monitor_keeps_state_without_answer(server):
+    client = LiveSplitServerClient("127.0.0.1", server.port, timeout=0.5)
+    client.start()
+    changes = []
+    monitor = ServerTimerMonitor(AppConfig(), changes.append, client=client)
+    try:
+        client.send("startorsplit")
+        monitor.check()
+        assert changes == [] and not monitor.is_frozen
+        checks = monitor.checks
+
+        # LiveSplitが落ちた -> 答えがないので「凍結中」にはしない
+        server.stop()
+        monitor.check()
+        assert not monitor.is_frozen
+        assert monitor.checks == checks
+    finally:
+        client.stop()
+    assert changes == []
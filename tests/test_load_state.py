@@ -0,0 +1,129 @@
+"""
+load_state.py のテスト (LiveSplit Server へ送るコマンドの順番)
+"""
+import time
+
+import pytest
+
+from config import AppConfig, PatternConfig
+from detector import DetectionResult
+from livesplit_server import (
+    LiveSplitServerClient, StandInLiveSplitServer, TRANSPORT_LIVESPLIT_SERVER,
+)
+from load_state import BOUNDARY_MIDPOINT, EVENT_LOAD_END, LoadStateMachine
+
+
+class FakeServerClient:
+    """LiveSplitServerClient の代わりに送ったものを記録する"""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, command: str) -> bool:
+        self.sent.append(command)
+        return True
+
+    def adjust_game_time(self, delta: float) -> bool:
+        self.sent.append(("adjust", round(delta, 6)))
+        return True
+
+
+def make_machine(server, **options):
+    config = AppConfig(min_duration_ms=500, cooldown_ms=0, **options)
+    pattern = PatternConfig(name="load", color="#000000",
+                            split_transport=TRANSPORT_LIVESPLIT_SERVER)
+    detected = DetectionResult(True, pattern, 100.0, 1, 1)
+    return LoadStateMachine(config, server=server), detected
+
+
+def run_frames(machine, detected, frames):
+    """(時刻, 検知したか) の列を流して、出てきたイベントを返す"""
+    events = []
+    for now, hit in frames:
+        events.extend(machine.update(detected if hit else None, now))
+    return events
+
+
+def test_server_commands_around_a_load():
+    server = FakeServerClient()
+    machine, detected = make_machine(server)
+    # 0.25 に検知開始、0.75 で確定、1.25 で途切れる
+    frames = [(0.0, False), (0.25, True), (0.5, True), (0.75, True), (1.0, True), (1.25, False)]
+    events = run_frames(machine, detected, frames)
+
+    # 確定待ち (0.25 -> 0.75) の間に進んだゲームタイムを unpause の前に戻す
+    assert server.sent == [
+        "startorsplit",
+        "pausegametime",
+        ("adjust", -0.5),
+        "unpausegametime",
+    ]
+    end = [e for e in events if e.kind == EVENT_LOAD_END][0]
+    assert end.duration == pytest.approx(1.0)
+
+
+def test_finish_during_a_load_unpauses_game_time():
+    server = FakeServerClient()
+    machine, detected = make_machine(server)
+    # 0.25 に検知開始、0.75 で確定、1.0 のまま監視を止める
+    run_frames(machine, detected, [(0.0, False), (0.25, True), (0.5, True), (0.75, True), (1.0, True)])
+    events = machine.finish()
+
+    assert server.sent == [
+        "startorsplit",
+        "pausegametime",
+        ("adjust", -0.5),
+        "unpausegametime",
+    ]
+    assert [event.kind for event in events] == [EVENT_LOAD_END]
+    assert events[0].duration == pytest.approx(0.75)
+    assert not machine.is_loading
+    # ロード中でなければ何も送らない
+    assert machine.finish() == []
+    assert len(server.sent) == 4
+
+
+def test_midpoint_boundary_returns_time_after_the_real_end():
+    server = FakeServerClient()
+    machine, detected = make_machine(server, load_boundary_mode=BOUNDARY_MIDPOINT)
+    frames = [(0.0, False), (0.25, True), (0.5, True), (0.75, True), (1.0, False)]
+    run_frames(machine, detected, frames)
+
+    # 開始の境界 0.125 から確定 0.75 までの分を戻し、終わりの境界 0.875 から途切れた 1.0 までの分を返す
+    assert server.sent == ["startorsplit", "pausegametime", ("adjust", -0.5), "unpausegametime"]
+
+
+def test_hotkey_patterns_send_nothing_to_the_server():
+    server = FakeServerClient()
+    config = AppConfig(min_duration_ms=0, cooldown_ms=0)
+    pattern = PatternConfig(name="load", color="#000000")
+    machine = LoadStateMachine(config, send_hotkey=lambda hotkey: True, server=server)
+    run_frames(machine, DetectionResult(True, pattern, 100.0, 1, 1),
+               [(0.0, True), (0.1, False)])
+    assert server.sent == []
+
+
+def test_adjust_game_time_against_stand_in_server():
+    server = StandInLiveSplitServer()
+    server.start()
+    client = LiveSplitServerClient("127.0.0.1", server.port)
+    client.start()
+    try:
+        client.send("startorsplit")
+        time.sleep(0.3)
+        client.send("pausegametime")
+        assert client.query("getcurrenttimerphase") == "Running"
+        paused = server.game_time()
+        client.adjust_game_time(-0.25)
+        # 後から送った問い合わせに応答があれば、補正も届いている
+        assert client.query("getsplitindex") == "0"
+        adjusted = server.game_time()
+    finally:
+        client.stop()
+        server.stop()
+
+    commands = [c for _, c in server.commands]
+    assert commands[3] == "getcurrentgametime"
+    assert commands[4].startswith("setgametime ")
+    # 問い合わせの応答は1/100秒までなので、その分の誤差は残る
+    assert adjusted == pytest.approx(paused - 0.25, abs=0.01)
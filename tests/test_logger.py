@@ -0,0 +1,27 @@
+"""
+logger.py のテスト (その日の記録CSVの形式)
+"""
+import csv
+import os
+
+from logger import CSV_COLUMNS, CSV_VERSION, TodaysSplitLogger
+
+
+def read_rows(path):
+    with open(path, encoding="utf-8", newline="") as f:
+        return list(csv.reader(f))
+
+
+def test_csv_keeps_the_old_columns_first_and_versions_the_file_name(tmp_path):
+    logger = TodaysSplitLogger(output_dir=str(tmp_path))
+    assert os.path.basename(logger.filename).endswith(f"_GIEEE_split_v{CSV_VERSION}.csv")
+
+    logger.start_timer(start_time=10.0)
+    logger.add_load_time(1.5)  # 誤差は省略できる
+    logger.add_load_time(0.5, 0.016)
+    assert logger.record_split(split_time=20.0) == (10.0, 2.0)
+
+    rows = read_rows(logger.filename)
+    assert rows[0] == CSV_COLUMNS
+    assert rows[0][:2] == ["Segment_Time", "Load_Time"]
+    assert rows[1] == ["10.000", "2.000", "0.016"]
@@ -0,0 +1,76 @@
+"""
+monitor.py のテスト (設定ダイアログで保存した設定を監視中に反映できるか)
+"""
+import copy
+import time
+
+import pytest
+from PIL import Image
+from PyQt6.QtCore import QCoreApplication
+
+from config import DetectionArea, PatternConfig, get_default_config
+from monitor import MonitorThread
+
+
+@pytest.fixture
+def replay_config(tmp_path):
+    for i in range(5):
+        Image.new("RGB", (160, 90), (i * 40, 0, 0)).save(tmp_path / f"{i:04d}.png")
+    config = get_default_config()
+    config.capture_backend = "replay"
+    config.replay_source = str(tmp_path)
+    config.replay_rate = 0
+    config.replay_loop = True
+    config.check_interval_ms = 10
+    config.patterns = [PatternConfig(name="load", color="#FFFFFF", areas=[DetectionArea(x=10, y=10)])]
+    return config
+
+
+def changed_copy(config):
+    """設定ダイアログと同じく、写しを編集して保存したもの"""
+    changed = copy.deepcopy(config)
+    changed.patterns[0].tolerance = 12
+    changed.area_sampling_step = 4
+    return changed
+
+
+def test_update_config_rebuilds_plan_and_sampler(replay_config):
+    monitor = MonitorThread(replay_config)
+    plan = monitor._plans.get(monitor.config, (160, 90), "RGB")
+    assert monitor.sampler is None
+
+    changed = changed_copy(replay_config)
+    monitor.update_config(changed)
+    assert monitor.config is changed
+    assert changed.revision != replay_config.revision
+    assert monitor.sampler is not None and monitor.sampler.step == 4
+    rebuilt = monitor._plans.get(monitor.config, (160, 90), "RGB")
+    assert rebuilt is not plan
+    assert list(rebuilt.tolerances_sq) == [144]
+    monitor._capture.close()
+
+
+def test_update_config_while_running_is_applied_by_the_monitor_thread(replay_config):
+    _app = QCoreApplication.instance() or QCoreApplication([])  # QThread にはアプリが要る
+    monitor = MonitorThread(replay_config)
+    monitor.start()
+    try:
+        deadline = time.perf_counter() + 5
+        while monitor._ring is None or monitor._ring.stats()["consumed"] == 0:
+            assert time.perf_counter() < deadline
+            time.sleep(0.01)
+
+        changed = changed_copy(replay_config)
+        monitor.update_config(changed)
+        while monitor.config is not changed:
+            assert time.perf_counter() < deadline
+            time.sleep(0.01)
+        assert monitor.sampler is not None and monitor.sampler.step == 4
+        # 反映したあとも監視が続いている
+        consumed = monitor._ring.stats()["consumed"]
+        while monitor._ring.stats()["consumed"] == consumed:
+            assert time.perf_counter() < deadline
+            time.sleep(0.01)
+        assert monitor._producer.is_alive()
+    finally:
+        monitor.stop()
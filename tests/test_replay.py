@@ -0,0 +1,119 @@
+"""
+replay.py / vod_analyzer.py のテスト (フレーム数が実際より多く報告される録画)
+"""
+import pytest
+from PIL import Image
+
+import vod_analyzer
+from config import AppConfig, PatternConfig, get_default_config
+from detection_engine import PlanCache
+from detector import DetectionResult
+from frame_ring import CaptureProducer, FrameRing
+from load_state import BOUNDARY_FRAME, EVENT_LOAD_END, LoadStateMachine
+from replay import FrameSource, FrameSourceEnded, ReplayCapture
+
+
+class ShortSource(FrameSource):
+    """reported フレームあると言いながら readable フレームしか読めないソース"""
+
+    def __init__(self, reported: int, readable: int):
+        self._count = reported
+        self.readable = readable
+
+    @classmethod
+    def can_open(cls, path) -> bool:
+        return False
+
+    def __len__(self) -> int:
+        return self._count
+
+    def timestamp(self, index: int) -> float:
+        return index / 10
+
+    def load(self, index: int) -> Image.Image:
+        if index >= self.readable:
+            self._count = min(self._count, index)
+            raise FrameSourceEnded(f"フレーム {index} を読めませんでした")
+        return Image.new("RGB", (64, 36), (index, index, index))
+
+
+class LoadSource(ShortSource):
+    """10fps で、10〜19 フレーム目 (1.0秒〜2.0秒) だけ白いロード画面"""
+
+    def __init__(self):
+        super().__init__(30, 30)
+
+    def load(self, index: int) -> Image.Image:
+        color = (255, 255, 255) if 10 <= index < 20 else (0, 0, 0)
+        return Image.new("RGB", (64, 36), color)
+
+
+def test_replay_at_rate_zero_measures_loads_in_recording_time():
+    # キャプチャは20ms間隔で回すが、録画のフレーム間隔は100ms
+    capture = ReplayCapture(LoadSource(), rate=0)
+    ring = FrameRing(capacity=3)
+    producer = CaptureProducer(ring, lambda out: capture.capture_frame(out), interval_ms=20)
+    machine = LoadStateMachine(AppConfig(min_duration_ms=0, cooldown_ms=0, load_boundary_mode=BOUNDARY_FRAME))
+    result = DetectionResult(True, PatternConfig(name="load", color="#FFFFFF"), 100.0, 1, 1)
+
+    events = []
+    timestamps = []
+    producer.start()
+    try:
+        while (slot := ring.take_latest(timeout=1.0)) is not None:
+            loading = slot.frame.pixels[0, 0, 0] == 255
+            timestamps.append(slot.timestamp)
+            events.extend(machine.update(result if loading else None, slot.timestamp))
+            ring.release(slot)
+            if len(timestamps) == 30:
+                break
+    finally:
+        producer.stop()
+
+    assert len(timestamps) == 30
+    assert timestamps[-1] - timestamps[0] == pytest.approx(2.9)
+    loads = [e for e in events if e.kind == EVENT_LOAD_END]
+    assert len(loads) == 1
+    assert loads[0].duration == pytest.approx(1.0)
+
+
+def test_replay_frame_times_keep_increasing_when_looping():
+    capture = ReplayCapture(ShortSource(3, 3), rate=0, loop=True)
+    times = [capture.capture_frame().timestamp for _ in range(7)]
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    assert gaps == pytest.approx([0.1] * 6)
+
+
+def test_replay_capture_stops_at_last_readable_frame():
+    capture = ReplayCapture(ShortSource(10, 3), rate=0)
+    frames = []
+    while (image := capture.capture()) is not None:
+        frames.append(image.getpixel((0, 0))[0])
+    assert frames == [0, 1, 2]
+    assert capture.frame_count == 3
+
+
+def test_replay_capture_loops_over_readable_frames():
+    capture = ReplayCapture(ShortSource(5, 2), rate=0, loop=True)
+    frames = [capture.capture().getpixel((0, 0))[0] for _ in range(5)]
+    assert frames == [0, 1, 0, 1, 0]
+
+
+def test_detect_range_keeps_frames_read_before_failure(monkeypatch):
+    monkeypatch.setattr(vod_analyzer, "_worker_source", ShortSource(10, 4))
+    monkeypatch.setattr(vod_analyzer, "_worker_config", get_default_config())
+    monkeypatch.setattr(vod_analyzer, "_worker_plans", PlanCache())
+
+    detections = vod_analyzer._detect_range((0, 10, 1))
+    assert len(detections) == 4
+    assert list(detections.timestamps) == [0.0, 0.1, 0.2, 0.3]
+
+    timestamps, means, pixel_counts = vod_analyzer._area_means_range((2, 10, 1))
+    assert list(timestamps) == [0.2, 0.3]
+    assert len(means) == 2 and len(pixel_counts) == 2
+
+    # 全部読めない範囲は空
+    detections = vod_analyzer._detect_range((6, 10, 2))
+    assert len(detections) == 0
+    timestamps, means, pixel_counts = vod_analyzer._area_means_range((6, 10, 1))
+    assert len(timestamps) == 0 and len(means) == 0 and len(pixel_counts) == 0
@@ -0,0 +1,190 @@
+"""
+AutoSplit GIEEE - LiveSplitタイマー監視
+ゲーム画面の検知ループとは別スレッド・別周期でタイマーの停止を見張ります
+"""
+import threading
+import time
+from typing import Callable, Optional
+
+from config import AppConfig
+from capture import CaptureBackend, create_backend
+from roi import RoiRect, timer_pixel_box
+from detector import TimerFreezeComparator
+from livesplit_server import LiveSplitServerClient, DEFAULT_PORT
+
+
+# timer_freeze_ms の間に何回チェックするか (多いほど停止判定が早いが重い)
+CHECKS_PER_FREEZE = 4
+MIN_INTERVAL_MS = 50
+MAX_INTERVAL_MS = 500
+
+# タイマー状態の取得元
+TIMER_SOURCE_CAPTURE = "capture"  # LiveSplitのウィンドウをキャプチャして比べる
+TIMER_SOURCE_SERVER = "livesplit_server"  # LiveSplit Server に問い合わせる
+TIMER_SOURCES = (TIMER_SOURCE_CAPTURE, TIMER_SOURCE_SERVER)
+
+# LiveSplit Server のタイマー状態 (getcurrenttimerphase の答え)
+RUNNING_PHASE = "Running"
+STOPPED_PHASES = ("NotRunning", "Paused", "Ended")  # 「凍結中」とみなすもの
+
+
+def timer_check_interval_ms(timer_freeze_ms: int) -> int:
+    """timer_freeze_ms からチェック間隔を決める"""
+    interval = timer_freeze_ms // CHECKS_PER_FREEZE
+    return max(MIN_INTERVAL_MS, min(interval, MAX_INTERVAL_MS))
+
+
+class TimerMonitor(threading.Thread):
+    """
+    LiveSplitのタイマー領域だけを定期的にキャプチャして、止まっていないか調べるスレッド
+
+    状態が変わったときだけ on_status_changed(True=凍結中 / False=動いてる) を呼びます。
+    キャプチャは capture_backend の設定どおりに作ります (作れなかったら on_error で知らせて止まります)。
+    """
+
+    def __init__(self, config: AppConfig, on_status_changed: Callable[[bool], None],
+                 capture: Optional[CaptureBackend] = None,
+                 on_error: Optional[Callable[[str], None]] = None):
+        super().__init__(daemon=True)
+        self.config = config
+        self._on_status_changed = on_status_changed
+        self._on_error = on_error
+        self._capture = capture  # None なら run() の中で作ります
+        self._comparator = TimerFreezeComparator()
+        self._running = False
+        self.interval_ms = timer_check_interval_ms(config.timer_freeze_ms)
+
+        self._frozen_since: Optional[float] = None
+        self._is_frozen = False
+        self.checks = 0  # チェック回数
+
+    @property
+    def is_frozen(self) -> bool:
+        return self._is_frozen
+
+    def run(self):
+        self._running = True
+        try:
+            self._setup()
+        except Exception as e:
+            # Windows以外で win32 キャプチャを使おうとした場合など
+            self._report_error(f"タイマー監視を始められませんでした: {e}")
+            self._running = False
+        try:
+            while self._running:
+                started = time.perf_counter()
+                self.check()
+                elapsed = time.perf_counter() - started
+                time.sleep(max(0.0, self.interval_ms / 1000 - elapsed))
+        finally:
+            self._teardown()
+
+    def _setup(self):
+        if self._capture is None:
+            self._capture = create_backend(self.config)
+        self._capture.set_target_window(self.config.livesplit_window)
+
+    def _teardown(self):
+        if self._capture is not None:
+            self._capture.close()
+
+    def _report_error(self, message: str):
+        if self._on_error is not None:
+            self._on_error(message)
+        else:
+            print(message)
+
+    def _timer_rect(self) -> Optional[tuple[RoiRect, tuple[int, int]]]:
+        """タイマー領域のピクセル矩形とウィンドウサイズ"""
+        size = self._capture.get_frame_size()
+        if size is None:
+            return None
+        ta = self.config.timer_area
+        box = timer_pixel_box(ta.x, ta.y, ta.width, ta.height, size[0], size[1])
+        return RoiRect(*box), size
+
+    def check(self):
+        """1回分のチェック (タイマー領域だけキャプチャして前回と比べます)"""
+        try:
+            found = self._timer_rect()
+            if found is None:
+                return
+            rect, size = found
+            sparse = self._capture.capture_regions([rect], size)
+            if sparse is None or not sparse.regions:
+                return
+            timer_image = sparse.regions[0][1]
+            self.checks += 1
+
+            # さっきと比べて変わったかな？ (初回はNone)
+            similar = self._comparator.update(timer_image)
+            now = time.perf_counter()
+
+            if similar is True:
+                # 動いてない...
+                if self._frozen_since is None:
+                    self._frozen_since = now
+                elif (now - self._frozen_since) * 1000 >= self.config.timer_freeze_ms:
+                    self._set_frozen(True)
+            elif similar is False:
+                # 動いてる！
+                self._frozen_since = None
+                self._set_frozen(False)
+        except Exception as e:
+            print(f"タイマー監視中に何か起きちゃいました: {e}")
+
+    def _set_frozen(self, frozen: bool):
+        if frozen != self._is_frozen:
+            self._is_frozen = frozen
+            self._on_status_changed(frozen)
+
+    def update_config(self, config: AppConfig):
+        self.config = config
+        self.interval_ms = timer_check_interval_ms(config.timer_freeze_ms)
+
+    def stop(self, timeout: float = 2.0):
+        self._running = False
+        if self.is_alive():
+            self.join(timeout)
+
+
+class ServerTimerMonitor(TimerMonitor):
+    """
+    LiveSplit Server にタイマーの状態を問い合わせる版の TimerMonitor
+
+    画面をキャプチャせずに getcurrenttimerphase の答えで判定するので、
+    NotRunning / Paused / Ended になったらすぐ「凍結中」とみなす。
+    答えが返ってこない・知らない答えのときは判定できないので状態を変えない。
+    """
+
+    def __init__(self, config: AppConfig, on_status_changed: Callable[[bool], None],
+                 client: Optional[LiveSplitServerClient] = None,
+                 on_error: Optional[Callable[[str], None]] = None):
+        super().__init__(config, on_status_changed, on_error=on_error)
+        # ホットキー用の接続があれば相乗りする (なければ自分で張る)
+        self._owns_client = client is None
+        self._client = client if client is not None else LiveSplitServerClient(
+            config.livesplit_server_host, config.livesplit_server_port or DEFAULT_PORT
+        )
+        self.phase: Optional[str] = None  # 最後に聞いたタイマー状態
+        self.current_time: Optional[str] = None  # 最後に聞いたタイマーの時刻
+
+    def _setup(self):
+        # 画面はキャプチャしない
+        if self._owns_client:
+            self._client.start()
+
+    def _teardown(self):
+        if self._owns_client:
+            self._client.stop()
+
+    def check(self):
+        """1回分のチェック (タイマー状態と時刻を問い合わせます)"""
+        phase = self._client.query("getcurrenttimerphase")
+        if phase != RUNNING_PHASE and phase not in STOPPED_PHASES:
+            # LiveSplitにつながらない・知らない答え -> 判定できないので状態は変えません
+            return
+        self.checks += 1
+        self.phase = phase
+        self.current_time = self._client.query("getcurrenttime")
+        self._set_frozen(phase in STOPPED_PHASES)
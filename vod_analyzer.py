@@ -0,0 +1,277 @@
+"""
+AutoSplit GIEEE - 録画の一括解析
+走りの録画 (動画ファイル / PNG連番フォルダ) からロードを検知して、ロード抜きのタイムを求める
+
+フレームの検知は時間範囲ごとに分けてプロセスプールで並列に行い、
+ロード判定 (min_duration_ms・クールダウン) は検知結果をつなげてから順番に行う。
+結果は TodaysSplitLogger と同じ形式のCSVに書き出す。
+
+使い方:
+    python vod_analyzer.py <動画ファイル or PNGフォルダ> [--workers N] [--step N] [--output フォルダ]
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+
+from config import AppConfig, load_config
+from detector import DetectionResult, detect_all_patterns_frame
+from detection_engine import DetectionPlan, PlanCache, compile_plan, compute_area_means
+from load_state import LoadStateMachine, LoadEvent, EVENT_LOAD_END, EVENT_SPLIT
+from logger import TodaysSplitLogger
+from replay import FrameSourceEnded, open_frame_source
+
+
+CHUNKS_PER_WORKER = 4  # 処理の偏りをならすため、ワーカー数より細かく分ける
+
+
+@dataclass
+class FrameDetections:
+    """フレームごとの検知結果 (パターン番号 -1 = 検知なし)"""
+    timestamps: np.ndarray  # (F,) 元のタイムスタンプ (秒)
+    patterns: np.ndarray  # (F,) 検知したパターンの番号
+    matched: np.ndarray  # (F,) 一致エリア数
+    totals: np.ndarray  # (F,) エリア数
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @classmethod
+    def concatenate(cls, parts: list["FrameDetections"]) -> "FrameDetections":
+        return cls(*(np.concatenate([getattr(p, name) for p in parts])
+                     for name in ("timestamps", "patterns", "matched", "totals")))
+
+
+@dataclass
+class AnalysisResult:
+    """録画の解析結果"""
+    detections: FrameDetections
+    events: list[LoadEvent] = field(default_factory=list)
+    elapsed: float = 0.0  # 解析にかかった時間 (秒)
+
+    @property
+    def loads(self) -> list[LoadEvent]:
+        return [e for e in self.events if e.kind == EVENT_LOAD_END]
+
+    @property
+    def splits(self) -> list[LoadEvent]:
+        return [e for e in self.events if e.kind == EVENT_SPLIT]
+
+    @property
+    def duration(self) -> float:
+        """録画の長さ (秒)"""
+        timestamps = self.detections.timestamps
+        return float(timestamps[-1] - timestamps[0]) if len(timestamps) else 0.0
+
+
+# --- ワーカープロセス側 ---
+
+_worker_source = None
+_worker_config: Optional[AppConfig] = None
+_worker_plans: Optional[PlanCache] = None
+
+
+def _init_worker(source_path: str, config: AppConfig):
+    """ワーカーごとに1回だけ録画を開く"""
+    global _worker_source, _worker_config, _worker_plans
+    _worker_source = open_frame_source(source_path)
+    _worker_config = config
+    _worker_plans = PlanCache()
+
+
+def _detect_range(frame_range: tuple[int, int, int]) -> FrameDetections:
+    """start から stop まで step おきにフレームを検知する"""
+    start, stop, step = frame_range
+    indices = range(start, stop, step)
+    timestamps = np.zeros(len(indices), dtype=np.float64)
+    patterns = np.full(len(indices), -1, dtype=np.int16)
+    matched = np.zeros(len(indices), dtype=np.int16)
+    totals = np.zeros(len(indices), dtype=np.int16)
+    config = _worker_config
+
+    rows = len(indices)
+    for row, index in enumerate(indices):
+        try:
+            frame = _worker_source.load_frame(index)
+        except FrameSourceEnded:
+            # 録画が思っていたより短かった -> 読めたところまでで終わり
+            rows = row
+            break
+        timestamps[row] = _worker_source.timestamp(index)
+        detected = detect_frame(frame, config, _worker_plans)
+        if detected is not None:
+            patterns[row] = _pattern_index(config, detected)
+            matched[row] = detected.matched_areas
+            totals[row] = detected.total_areas
+    return FrameDetections(timestamps[:rows], patterns[:rows], matched[:rows], totals[:rows])
+
+
+def _area_means_range(frame_range: tuple[int, int, int]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    start から stop まで step おきに、エリアごとの平均色と
+    画素ごとに判定するパターンの一致エリア数 (平均色からは判定できないので) を求める
+    """
+    start, stop, step = frame_range
+    indices = range(start, stop, step)
+    timestamps = np.zeros(len(indices), dtype=np.float64)
+    means = None
+    pixel_counts = np.zeros((len(indices), len(_worker_config.patterns)), dtype=np.int64)
+    rows = len(indices)
+    for row, index in enumerate(indices):
+        try:
+            frame = _worker_source.load_frame(index)
+        except FrameSourceEnded:
+            rows = row
+            break
+        timestamps[row] = _worker_source.timestamp(index)
+        plan = _worker_plans.get(_worker_config, frame.size, frame.channel_order)
+        if means is None:
+            means = np.zeros((len(indices), len(plan.boxes), 3), dtype=np.int16)
+        means[row] = compute_area_means(frame, plan.boxes)
+        if len(plan.pixel_entry_patterns):
+            pixel_counts[row] = plan.count_pixel_matches(frame)
+    if means is None:
+        return timestamps[:0], np.zeros((0, 0, 3), dtype=np.int16), pixel_counts[:0]
+    return timestamps[:rows], means[:rows], pixel_counts[:rows]
+
+
+def _pattern_index(config: AppConfig, result: DetectionResult) -> int:
+    for i, pattern in enumerate(config.patterns):
+        if pattern is result.pattern:
+            return i
+    return -1
+
+
+# --- 解析 ---
+
+def detect_frame(frame, config: AppConfig, plans: PlanCache) -> Optional[DetectionResult]:
+    """監視スレッドと同じ検知エンジンで1フレームを検知する"""
+    if config.detection_engine == "integral":
+        plan = plans.get(config, frame.size, frame.channel_order)
+        detected, _ = plan.results_from_counts(plan.count_matches(frame), False)
+    else:
+        detected, _ = detect_all_patterns_frame(
+            frame, config.patterns, config.area_size,
+            fast=config.fast_evaluation, need_best=False
+        )
+    return detected
+
+
+def split_ranges(frame_count: int, chunks: int, step: int = 1) -> list[tuple[int, int, int]]:
+    """フレーム番号を chunks 個の (start, stop, step) に分ける (境界は step の倍数)"""
+    sampled = (frame_count + step - 1) // step
+    chunks = max(1, min(chunks, sampled))
+    bounds = [round(sampled * i / chunks) * step for i in range(chunks + 1)]
+    bounds[-1] = frame_count
+    return [(bounds[i], bounds[i + 1], step) for i in range(chunks) if bounds[i] < bounds[i + 1]]
+
+
+def replay_detections(detections: FrameDetections, config: AppConfig,
+                      logger: Optional[TodaysSplitLogger] = None) -> list[LoadEvent]:
+    """検知結果を順番にロード判定に通す (ライブと同じ LoadStateMachine を使う)"""
+    state = LoadStateMachine(config, logger=logger)
+    if logger is not None and len(detections):
+        logger.start_timer(float(detections.timestamps[0]))
+
+    events: list[LoadEvent] = []
+    for row in range(len(detections)):
+        index = int(detections.patterns[row])
+        detected = None
+        if index >= 0:
+            matched = int(detections.matched[row])
+            total = int(detections.totals[row])
+            detected = DetectionResult(True, config.patterns[index],
+                                       matched / total * 100 if total else 0.0, matched, total)
+        events.extend(state.update(detected, float(detections.timestamps[row])))
+    return events
+
+
+def _map_ranges(func, source_path, config: AppConfig, workers: Optional[int], step: int) -> list:
+    """録画を時間範囲に分けて func をプロセスプールで実行する (結果は時間順)"""
+    source = open_frame_source(source_path)
+    frame_count = len(source)
+    source.close()
+
+    workers = workers or os.cpu_count() or 1
+    ranges = split_ranges(frame_count, workers * CHUNKS_PER_WORKER, step)
+    if workers == 1:
+        _init_worker(str(source_path), config)
+        return [func(r) for r in ranges]
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(str(source_path), config)) as pool:
+        return list(pool.map(func, ranges))
+
+
+def recording_area_means(source_path, config: AppConfig, workers: Optional[int] = None,
+                         step: int = 1) -> tuple[np.ndarray, np.ndarray, np.ndarray, DetectionPlan]:
+    """
+    録画の全フレームについて、検知エリアごとの平均色を並列で求める
+
+    許容値や閾値を変えても平均色は変わらないので、パラメータ探索ではこれを使い回す。
+    画素ごとに判定するパターンは平均色から判定できないので、今の設定での一致エリア数も一緒に求める。
+
+    Returns:
+        (タイムスタンプ (F,), 平均色 (F, N, 3), パターンごとの画素判定の一致エリア数 (F, P),
+         エリアの並びを決めた検知プラン)
+    """
+    parts = _map_ranges(_area_means_range, source_path, config, workers, step)
+    parts = [p for p in parts if len(p[0])]
+    source = open_frame_source(source_path)
+    try:
+        frame = source.load_frame(0)
+    finally:
+        source.close()
+    plan = compile_plan(config.patterns, frame.size, config.area_size, frame.channel_order)
+    if not parts:
+        return (np.zeros(0), np.zeros((0, len(plan.boxes), 3), dtype=np.int16),
+                np.zeros((0, len(plan.patterns)), dtype=np.int64), plan)
+    timestamps = np.concatenate([p[0] for p in parts])
+    means = np.concatenate([p[1] for p in parts])
+    pixel_counts = np.concatenate([p[2] for p in parts])
+    return timestamps, means, pixel_counts, plan
+
+
+def analyze(source_path, config: AppConfig, workers: Optional[int] = None, step: int = 1,
+            logger: Optional[TodaysSplitLogger] = None) -> AnalysisResult:
+    """
+    録画を解析する
+
+    Args:
+        source_path: 動画ファイル / PNGフォルダなど (replay で開けるもの)
+        config: 検知に使う設定
+        workers: プロセス数 (省略時はCPUコア数)
+        step: step フレームおきに検知する (1=全フレーム)
+        logger: 区間タイムの書き出し先 (任意)
+    """
+    started = time.perf_counter()
+    parts = _map_ranges(_detect_range, source_path, config, workers, step)
+    empty = FrameDetections(np.zeros(0), np.zeros(0, np.int16), np.zeros(0, np.int16), np.zeros(0, np.int16))
+    detections = FrameDetections.concatenate(parts) if parts else empty
+    events = replay_detections(detections, config, logger)
+    return AnalysisResult(detections, events, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="録画からロードを検知して区間タイムとロード時間を求めます")
+    parser.add_argument("source", help="動画ファイル (要OpenCV) / PNG連番フォルダ / 複数フレーム画像")
+    parser.add_argument("--workers", type=int, default=None, help="プロセス数 (省略時はCPUコア数)")
+    parser.add_argument("--step", type=int, default=1, help="何フレームおきに検知するか")
+    parser.add_argument("--output", default=None, help="CSVの保存先フォルダ")
+    args = parser.parse_args()
+
+    config = load_config()
+    logger = TodaysSplitLogger(output_dir=args.output)
+    result = analyze(args.source, config, args.workers, max(1, args.step), logger)
+
+    for event in result.loads:
+        print(f"ロード: {event.time - event.duration:9.3f}秒 - {event.time:9.3f}秒 "
+              f"({event.duration:.3f}秒 ±{event.error:.3f})")
+    total_load = sum(e.duration for e in result.loads)
+    speed = result.duration / result.elapsed if result.elapsed > 0 else 0.0
+    print(f"{len(result.detections)}フレーム / ロード {len(result.loads)}回 (計 {total_load:.3f}秒) / "
+          f"スプリット {len(result.splits)}回")
+    print(f"解析時間 {result.elapsed:.2f}秒 (録画 {result.duration:.2f}秒の {speed:.1f}倍速)")